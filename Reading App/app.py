@@ -1,15 +1,34 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
 from datetime import datetime
-import PyPDF2
 import time
-import fitz
-from PIL import Image
-import io
 import os
-import json
+import sys
 import hashlib
+import base64
+import uuid
+from concurrent.futures import wait as wait_futures
+from functools import partial
+
+# app.py is also run via the repo-root launcher, so make the sibling package importable
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from readvibe.pdfdocs import get_document_pool
+from readvibe.pdfpages import MIME_TYPES
+from readvibe.pageview import ZOOM_LEVELS, is_cached, render_view
+from readvibe.pagecache import get_page_cache
+from readvibe.prefetch import get_prefetcher, prefetch_window, record_move
+from readvibe.renderfarm import INDEXING, PREFETCH, VISIBLE, get_render_farm
+from readvibe.store import get_user_store
+from readvibe.records import get_user_records
+from readvibe.migrations import get_migration_runner
+from readvibe.blobs import get_blob_store
+from readvibe.ingest import get_ingest_queue
+from readvibe.thumbnails import render_cover, thumbnail_name
+from readvibe.library import LibraryIndex, library_index
+from readvibe.search import get_search_index
+from readvibe.leaderboard import TIERS, get_leaderboard, tier_for
+from readvibe.sessions import calc_points, is_realistic
+from readvibe.metrics import get_metrics, timed
+from readvibe.pagestats import estimate_minutes, sidecar_path
 
 st.set_page_config(page_title="📚 ReadVibe", page_icon="📚", layout="wide")
 
@@ -89,6 +108,7 @@ if 'stats' not in st.session_state:
         'total_pages': 0,
         'total_time': 0,
         'points': 0,
+        'daily_pages': 0,
         'weekly_pages': 0,
         'monthly_pages': 0,
     }
@@ -99,9 +119,24 @@ if 'pdf_page' not in st.session_state:
 if 'reader_pdf_page' not in st.session_state:
     st.session_state.reader_pdf_page = 0
 
+# identifies this browser session to process-wide workers (page prefetch)
+if 'session_uid' not in st.session_state:
+    st.session_state.session_uid = uuid.uuid4().hex
+
+if 'reader_history' not in st.session_state:
+    st.session_state.reader_history = []
+
 # Data file for storing users and their data
 DATA_FILE = os.path.join(os.path.dirname(__file__), 'users.json')
+USERS_DB_FILE = os.path.join(os.path.dirname(__file__), 'users.db')
+# 'sqlite' (users.db) or 'json' (users.json + write-ahead journal)
+USER_STORE_BACKEND = os.environ.get('READVIBE_STORE', 'sqlite')
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+PAGE_CACHE_DIR = os.path.join(DATA_DIR, '_cache', 'pages')
+BLOB_DIR = os.path.join(DATA_DIR, 'blobs')
+SEARCH_DB_FILE = os.path.join(DATA_DIR, 'search.db')
+# accounts that can see the performance panel in Settings, comma-separated
+ADMINS = {u.strip() for u in os.environ.get('READVIBE_ADMINS', '').split(',') if u.strip()}
 
 if not os.path.exists(DATA_DIR):
     try:
@@ -109,274 +144,109 @@ if not os.path.exists(DATA_DIR):
     except Exception:
         pass
 
-def load_users():
-    try:
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except Exception:
-        pass
-    return {}
-
-def save_users(users):
-    try:
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(users, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        st.error(f"Failed saving user data: {e}")
-
-
-def migrate_users_db(users: dict) -> dict:
-    """Migrate any in-memory stored PDFs or PIL images into on-disk files and update book entries.
-    This makes the users JSON serializable and prevents errors from raw bytes or PIL objects.
-    """
-    try:
-        changed = False
-        for uname, urec in list(users.items()):
-            if uname == '_last_user':
-                continue
-            data = urec.get('data', {}) if isinstance(urec, dict) else {}
-            books = data.get('books', [])
-            if not books:
-                continue
-            # ensure user dir
-            user_folder_name = ''.join(c for c in uname if c.isalnum() or c in ('-', '_'))
-            user_dir = os.path.join(DATA_DIR, user_folder_name)
-            os.makedirs(user_dir, exist_ok=True)
-
-            new_books = []
-            seen_paths = set()
-            for b in books:
-                # if already stored as paths, keep
-                if b.get('pdf_path') and isinstance(b.get('pdf_path'), str) and os.path.exists(b.get('pdf_path')):
-                    new_books.append(b)
-                    continue
-
-                # migrate pdf bytes if present
-                pdf_path = b.get('pdf_path')
-                if not pdf_path and b.get('pdf_file'):
-                    try:
-                        ts = int(time.time())
-                        safe_title = ''.join(c for c in (b.get('title') or 'book') if c.isalnum() or c in (' ', '-', '_')).replace(' ', '_')[:120]
-                        pdf_filename = f"{safe_title}_{ts}.pdf"
-                        pdf_path = os.path.join(user_dir, pdf_filename)
-                        with open(pdf_path, 'wb') as f:
-                            f.write(b.get('pdf_file'))
-                        changed = True
-                    except Exception:
-                        pdf_path = None
-
-                # migrate cover if present or generate from pdf
-                cover_path = b.get('cover_path')
-                if not cover_path:
-                    cover_saved = False
-                    if b.get('cover_image'):
-                        try:
-                            ts = int(time.time())
-                            safe_title = ''.join(c for c in (b.get('title') or 'book') if c.isalnum() or c in (' ', '-', '_')).replace(' ', '_')[:120]
-                            cover_filename = f"{safe_title}_{ts}.png"
-                            cover_path = os.path.join(user_dir, cover_filename)
-                            img = b.get('cover_image')
-                            # PIL Image -> save
-                            try:
-                                img.save(cover_path)
-                                cover_saved = True
-                                changed = True
-                            except Exception:
-                                cover_path = None
-                        except Exception:
-                            cover_path = None
-
-                    # try generating from pdf path
-                    if not cover_saved and pdf_path and os.path.exists(pdf_path):
-                        try:
-                            img = get_pdf_first_page_image(pdf_path)
-                            if img:
-                                ts = int(time.time())
-                                safe_title = ''.join(c for c in (b.get('title') or 'book') if c.isalnum() or c in (' ', '-', '_')).replace(' ', '_')[:120]
-                                cover_filename = f"{safe_title}_{ts}.png"
-                                cover_path = os.path.join(user_dir, cover_filename)
-                                try:
-                                    img.save(cover_path)
-                                    changed = True
-                                except Exception:
-                                    cover_path = None
-                        except Exception:
-                            cover_path = None
-
-                # skip duplicates by pdf path
-                if pdf_path and pdf_path in seen_paths:
-                    continue
-
-                new_b = {
-                    'title': b.get('title'),
-                    'author': b.get('author'),
-                    'pages': b.get('pages'),
-                    'current_page': b.get('current_page', 0),
-                    'pages_read': b.get('pages_read', 0),
-                    'pdf_path': pdf_path,
-                    'cover_path': cover_path,
-                }
-                new_books.append(new_b)
-                if pdf_path:
-                    seen_paths.add(pdf_path)
-
-            if changed:
-                data['books'] = new_books
-                urec['data'] = data
-                users[uname] = urec
-        if changed:
-            try:
-                with open(DATA_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(users, f, ensure_ascii=False, indent=2)
-            except Exception:
-                pass
-    except Exception:
-        pass
-    return users
-
 def hash_password(pw: str) -> str:
     return hashlib.sha256(pw.encode('utf-8')).hexdigest()
 
-# Load users DB into session
-if 'users_db' not in st.session_state:
-    loaded = load_users()
-    # migrate any old in-memory PDFs or images to on-disk files
-    migrated = migrate_users_db(loaded)
-    st.session_state.users_db = migrated
+def markdown_table(rows, columns):
+    """A Markdown table of ``columns`` from a list of dicts"""
+    def cell(v):
+        return '–' if v is None else f"{v:,.2f}" if isinstance(v, float) else str(v)
+    lines = ['| ' + ' | '.join(columns) + ' |', '|' + '---|' * len(columns)]
+    lines += ['| ' + ' | '.join(cell(row.get(c)) for c in columns) + ' |' for row in rows]
+    return '\n'.join(lines)
+
+def show_image(image, fmt, caption=None):
+    """Show encoded image bytes (or an image file) without re-encoding them"""
+    # st.image keeps JPEG and PNG bytes when told their format, and turns anything else into JPEG.
+    # Other formats go inline as base64 and are sent again on every rerun, so keep them to images shown once
+    if fmt in ('jpg', 'jpeg', 'png'):
+        st.image(image, caption=caption, use_container_width=True, output_format='PNG' if fmt == 'png' else 'JPEG')
+        return
+    if isinstance(image, str):
+        with open(image, 'rb') as f:
+            image = f.read()
+    st.markdown(f"<img src='data:{MIME_TYPES.get(fmt, 'image/' + fmt)};base64,{base64.b64encode(image).decode()}' alt='' style='width: 100%;'>", unsafe_allow_html=True)
+    if caption:
+        st.caption(caption)
+
+def tiles_html(view):
+    """The window of a tiled PageView: its tiles laid over a clipping box that scales with the column"""
+    x, y, w, h = view.window
+    tiles = ''.join(
+        f"<img src='data:{view.mime_type};base64,{base64.b64encode(data).decode()}' alt='' style='position: absolute; "
+        f"left: {(tx - x) / w:.4%}; top: {(ty - y) / h:.4%}; width: {tw / w:.4%}; height: {th / h:.4%};'>"
+        for tx, ty, tw, th, data in view.tiles)
+    return f"<div style='position: relative; width: 100%; aspect-ratio: {w} / {h}; overflow: hidden;'>{tiles}</div>"
+
+user_store = get_user_store(DATA_FILE if USER_STORE_BACKEND == 'json' else USERS_DB_FILE, USER_STORE_BACKEND)
+# one copy of each active user's record for the whole process, shared by all sessions
+user_records = get_user_records(user_store)
+
+# uploaded PDFs, stored once per distinct file and shared between users
+blob_store = get_blob_store(BLOB_DIR)
+# rendered pages, in memory and on disk, shared by every session
+page_cache = get_page_cache(PAGE_CACHE_DIR)
+# pages missing from it are rendered by worker processes shared by every session, most urgent first
+render_farm = get_render_farm()
+render_page = partial(render_view, cache=page_cache, run=partial(render_farm.call, VISIBLE))
+# seconds the Library waits for covers rendered in the farm before leaving their placeholders
+COVER_WAIT = 10
+# page statistics missing from a book (e.g. its indexing failed) are built there too, not on the script thread
+build_stats = partial(render_farm.submit, INDEXING, block=False)
+# page counts, covers and page statistics of new uploads are worked out off the script thread
+ingest_queue = get_ingest_queue(user_records, blob_store, PAGE_CACHE_DIR, SEARCH_DB_FILE)
+
+# full-text index of every stored PDF's pages, filled in by ingestion
+search_index = get_search_index(SEARCH_DB_FILE)
+
+# bring saved data up to the current schema version, once per process; all but the account import in the background
+migrations = get_migration_runner(user_store, DATA_FILE, DATA_DIR, blobs=blob_store, records=user_records, search=search_index)
+migrations.start()
 
 if 'current_user' not in st.session_state:
     st.session_state.current_user = None
 
-# If a user was last active, restore them and load their data so login persists across refresh
+# If a user was last active, restore them so login persists across refresh
 try:
-    last_user = st.session_state.users_db.get('_last_user') if isinstance(st.session_state.users_db, dict) else None
-    if last_user and st.session_state.current_user is None and last_user in st.session_state.users_db:
+    last_user = user_store.get_meta('_last_user') if st.session_state.current_user is None else None
+    if last_user and user_records.get(last_user):
         st.session_state.current_user = last_user
-        data = st.session_state.users_db[last_user].get('data', {})
-        st.session_state.books = data.get('books', [])
-        st.session_state.stats = data.get('stats', st.session_state.stats)
 except Exception:
     pass
 
-def extract_pdf_pages(pdf_bytes):
-    try:
-        # pdf_bytes may be a path or raw bytes
-        if isinstance(pdf_bytes, (bytes, bytearray)):
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        elif isinstance(pdf_bytes, str) and os.path.exists(pdf_bytes):
-            doc = fitz.open(pdf_bytes)
-        else:
-            return None
-        return len(doc)
-    except:
-        return None
-
-def get_pdf_first_page_image(pdf_bytes):
-    """Extract first page of PDF as image"""
-    try:
-        if isinstance(pdf_bytes, (bytes, bytearray)):
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        elif isinstance(pdf_bytes, str) and os.path.exists(pdf_bytes):
-            doc = fitz.open(pdf_bytes)
-        else:
-            return None
-        page = doc[0]
-        pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # 2x zoom for better quality
-        img_bytes = pix.tobytes("png")
-        return Image.open(io.BytesIO(img_bytes))
-    except:
-        pass
-    return None
-
-def get_pdf_page_image(pdf_bytes, page_num):
-    """Extract a specific page of PDF as image"""
-    try:
-        if isinstance(pdf_bytes, (bytes, bytearray)):
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        elif isinstance(pdf_bytes, str) and os.path.exists(pdf_bytes):
-            doc = fitz.open(pdf_bytes)
-        else:
-            return None
-        if page_num >= len(doc):
-            page_num = len(doc) - 1
-        page = doc[page_num]
-        pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-        img_bytes = pix.tobytes("png")
-        return Image.open(io.BytesIO(img_bytes))
-    except:
-        pass
-    return None
-
-def estimate_read_time(pdf_bytes, page_num, reader_wpm=None):
-    """Estimate reading time (minutes) for a specific page using text extraction and heuristics."""
-    try:
-        if isinstance(pdf_bytes, (bytes, bytearray)):
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        elif isinstance(pdf_bytes, str) and os.path.exists(pdf_bytes):
-            doc = fitz.open(pdf_bytes)
-        else:
-            return None
-        if page_num >= len(doc):
-            page_num = len(doc) - 1
-        page = doc[page_num]
-        text = page.get_text("text") or ""
-        words = [w for w in text.split() if w.isalpha() or w.isalnum()]
-        word_count = len(words)
-        if word_count == 0:
-            return 0.1  # very short
-
-        # base reading speed
-        base_wpm = reader_wpm or 200
-
-        # difficulty adjustments: long words slow reading
-        avg_len = sum(len(w) for w in words) / max(1, word_count)
-        long_ratio = sum(1 for w in words if len(w) > 7) / word_count
-        difficulty_factor = 1 + (long_ratio * 0.35) + max(0, (avg_len - 5) / 10)
-
-        minutes = (word_count / base_wpm) * difficulty_factor
-        return minutes
-    except Exception:
-        return None
-
-def is_realistic(book_pdf_path, start_page, end_page, minutes, user_wpm=None):
-    """Validate reading speed by estimating time for the range and comparing to actual time spent.
-    Uses word count estimation for more accuracy.
-    """
-    if minutes < 1:
-        return False
-    try:
-        # Estimate total time for reading this page range
-        total_estimated_minutes = 0
-        for page_num in range(start_page, min(end_page, end_page)):
-            est = estimate_read_time(book_pdf_path, page_num, reader_wpm=user_wpm)
-            if est:
-                total_estimated_minutes += est
-        
-        if total_estimated_minutes == 0:
-            return True  # fallback if estimation fails
-        
-        # Check if actual time is within reasonable bounds (1x to 3x estimated time)
-        # This allows for slower reading, breaks, and distractions
-        ratio = minutes / total_estimated_minutes
-        return 1.0 <= ratio <= 3.0
-    except Exception:
-        # Fallback to simple speed check if word-count estimation fails
-        if minutes < 2:
-            return False
-        speed = (end_page - start_page) / minutes
-        return 0.3 <= speed <= 0.7
-
-def calc_points(pages, minutes):
-    points = (pages // 10) * 5
-    if minutes >= 20: points += 15
-    elif minutes >= 10: points += 8
-    if minutes >= 30: points += 20
-    return points
+# The session only keeps a handle; books and stats point into the shared, read-only record.
+# Changes go through the handle, which swaps in a new record for every session of that user.
+user_handle = user_records.handle(st.session_state.current_user) if st.session_state.current_user else None
+if user_handle:
+    st.session_state.books = user_handle.data.get('books', [])
+    st.session_state.stats = user_handle.data.get('stats', st.session_state.stats)
+    # this day's, week's and month's pages come from the session rollups, which roll over by themselves
+    rollups = user_handle.rollups()
+    st.session_state.stats = {**st.session_state.stats, 'daily_pages': rollups['day']['pages'],
+                              'weekly_pages': rollups['week']['pages'], 'monthly_pages': rollups['month']['pages']}
+
+@st.fragment(run_every=1)
+def ingest_progress(digest):
+    """Live progress of a book still being processed; reruns the page once it is ready"""
+    job = ingest_queue.job(digest)
+    if job is None:
+        st.caption("⏳ Waiting to be processed...")
+    elif job.state == 'failed':
+        st.warning(f"Processing failed: {job.error}")
+    elif not job.active:
+        st.rerun()
+    else:
+        st.progress(job.progress, text=f"⏳ Processing... ({job.stage or 'queued'})")
 
 # Sidebar
 with st.sidebar:
     st.markdown(f"<h1 style='text-align: center; color: {COLORS['primary']}; font-size: 2.5em;'>📚 ReadVibe</h1>", unsafe_allow_html=True)
+    if not migrations.accounts_ready:
+        st.error(f"Accounts could not be upgraded, so logins are closed: {migrations.error}")
+    elif migrations.running:
+        st.info(f"⏳ Upgrading saved data... {migrations.progress}")
+    elif migrations.error:
+        st.warning(f"Data upgrade paused: {migrations.error}")
     st.divider()
     # Account section
     if st.session_state.current_user:
@@ -389,38 +259,30 @@ with st.sidebar:
                 'total_pages': 0,
                 'total_time': 0,
                 'points': 0,
+                'daily_pages': 0,
                 'weekly_pages': 0,
                 'monthly_pages': 0,
             }
             # clear last user marker
             try:
-                users = st.session_state.users_db
-                if isinstance(users, dict) and users.get('_last_user'):
-                    users['_last_user'] = None
-                    save_users(users)
-                    st.session_state.users_db = users
+                if user_store.get_meta('_last_user'):
+                    user_store.set_meta('_last_user', None)
             except Exception:
                 pass
             st.rerun()
-    else:
+    elif migrations.accounts_ready:
         acct_mode = st.radio("Account", ["Login", "Sign Up"], index=0)
         if acct_mode == "Login":
             login_user = st.text_input("Username", key="login_user")
             login_pw = st.text_input("Password", type="password", key="login_pw")
             if st.button("Login", key="do_login"):
-                users = st.session_state.users_db
-                if login_user in users and users[login_user].get('password') == hash_password(login_pw):
+                login_rec = user_records.get(login_user) if login_user else None
+                if login_rec and login_rec.get('password') == hash_password(login_pw):
                     st.session_state.current_user = login_user
-                    # load user data
-                    data = users[login_user].get('data', {})
-                    st.session_state.books = data.get('books', [])
-                    st.session_state.stats = data.get('stats', st.session_state.stats)
                     st.success("Logged in")
                     # remember last user for persistent login
                     try:
-                        users['_last_user'] = login_user
-                        save_users(users)
-                        st.session_state.users_db = users
+                        user_store.set_meta('_last_user', login_user)
                     except Exception:
                         pass
                     st.rerun()
@@ -430,31 +292,18 @@ with st.sidebar:
             signup_user = st.text_input("New username", key="signup_user")
             signup_pw = st.text_input("New password", type="password", key="signup_pw")
             if st.button("Create account", key="do_signup"):
-                users = st.session_state.users_db
                 if not signup_user:
                     st.error("Choose a username")
-                elif signup_user in users:
+                elif not user_records.handle(signup_user).create(hash_password(signup_pw)):
                     st.error("Username already exists")
                 else:
-                    users[signup_user] = {
-                        'password': hash_password(signup_pw),
-                        'data': {
-                            'books': [],
-                            'stats': {
-                                'total_pages': 0,
-                                'total_time': 0,
-                                'points': 0,
-                                'weekly_pages': 0,
-                                'monthly_pages': 0,
-                            }
-                        }
-                    }
-                    save_users(users)
-                    st.session_state.users_db = users
                     st.success("Account created. Please log in.")
     st.divider()
     page = st.radio("Navigation", ["🏠 Home", "📖 Read", "📚 Library", "📊 Stats", "🎁 Rewards", "⚙️ Settings"], label_visibility="collapsed")
 
+# one latency sample per run of the chosen page; runs cut short by st.rerun() are not counted
+page_timer = timed(f"page.{page.split(' ', 1)[1].lower()}")
+
 # ==================== HOME ====================
 if page == "🏠 Home":
     st.markdown(f"<div class='header'>📚 ReadVibe</div>", unsafe_allow_html=True)
@@ -463,7 +312,7 @@ if page == "🏠 Home":
     
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.markdown(f"<div class='card'><div class='label'>Pages Today</div><div class='metric'>{st.session_state.stats['total_pages'] % 30}</div></div>", unsafe_allow_html=True)
+        st.markdown(f"<div class='card'><div class='label'>Pages Today</div><div class='metric'>{st.session_state.stats['daily_pages']}</div></div>", unsafe_allow_html=True)
     with col2:
         st.markdown(f"<div class='card'><div class='label'>Points</div><div class='metric'>{st.session_state.stats['points']}</div></div>", unsafe_allow_html=True)
     with col3:
@@ -478,7 +327,7 @@ if page == "🏠 Home":
     home_monthly_goal = 800
     if st.session_state.current_user:
         try:
-            user_rec = st.session_state.users_db.get(st.session_state.current_user, {})
+            user_rec = user_handle.record
             goals = user_rec.get('data', {}).get('goals', {})
             home_daily_goal = goals.get('daily', 30)
             home_monthly_goal = goals.get('monthly', 800)
@@ -487,7 +336,7 @@ if page == "🏠 Home":
     
     col1, col2 = st.columns(2)
     with col1:
-        daily = st.session_state.stats['total_pages'] % home_daily_goal
+        daily = st.session_state.stats['daily_pages']
         daily_pct = min((daily / home_daily_goal) * 100, 100)
         st.markdown(f"""
             <div class='card'>
@@ -519,12 +368,38 @@ elif page == "📖 Read":
     st.markdown(f"<div class='header'>📖 Ebook Reader</div>", unsafe_allow_html=True)
     st.divider()
     
+    # books still being processed (or whose processing failed) have no page count yet. Books are picked
+    # by id: the list is shared with the user's other sessions, so an upload there shifts the positions
+    books_by_id = {b.get('id'): b for b in st.session_state.books}
+    ready_books = [b.get('id') for b in st.session_state.books if b.get('status') not in ('processing', 'failed')]
     if not st.session_state.books:
         st.info("📚 No books uploaded yet! Go to Library to add one.")
+    elif not ready_books:
+        st.info("⏳ Your books are still being processed. See the Library for progress.")
     else:
-        book_idx = st.selectbox("Select Book", range(len(st.session_state.books)), 
-                                format_func=lambda x: st.session_state.books[x]['title'], label_visibility="collapsed")
-        book = st.session_state.books[book_idx]
+        # search every page of the user's books; a hit opens that book at that page
+        search_query = st.text_input("Search inside your books", key="reader_search", placeholder="🔎 Search inside your books", label_visibility="collapsed")
+        if search_query.strip():
+            by_digest = {books_by_id[i].get('sha256'): i for i in ready_books if books_by_id[i].get('sha256')}
+            hits = search_index.search(search_query, list(by_digest))
+            if not hits:
+                st.caption("No matches.")
+            for digest, hit_page, snippet in hits:
+                col1, col2 = st.columns([5, 1])
+                with col1:
+                    st.markdown(f"<div style='padding: 6px 0;'><strong style='color: {COLORS['secondary']};'>{books_by_id[by_digest[digest]]['title']}</strong> · p. {hit_page + 1}<br><span style='color: rgba(255,255,255,0.7); font-size: 0.9em;'>{snippet}</span></div>", unsafe_allow_html=True)
+                with col2:
+                    if st.button("Open", key=f"hit_{digest[:16]}_{hit_page}", use_container_width=True):
+                        st.session_state.reader_book = by_digest[digest]
+                        st.session_state.reader_pdf_page = hit_page
+                        st.rerun()
+            st.divider()
+
+        if st.session_state.get('reader_book') not in ready_books:
+            st.session_state.pop('reader_book', None)
+        book_id = st.selectbox("Select Book", ready_books, key="reader_book",
+                               format_func=lambda x: books_by_id[x]['title'], label_visibility="collapsed")
+        book = books_by_id[book_id]
         
         # Top controls
         col1, col2, col3, col4 = st.columns([1.5, 1, 1, 1.5])
@@ -542,8 +417,9 @@ elif page == "📖 Read":
         
         # PDF Viewer
         try:
-            with st.spinner("⏳ Loading PDF..."):
-                total_pages = extract_pdf_pages(book.get('pdf_path'))
+            # counted by ingestion; opening the PDF here would take the document pool on every rerun
+            pdf_path = book.get('pdf_path')
+            total_pages = book.get('pages') or None if isinstance(pdf_path, str) and os.path.exists(pdf_path) else None
 
             if total_pages is None:
                 st.error("❌ Could not load PDF. Please check the file.")
@@ -560,21 +436,52 @@ elif page == "📖 Read":
                 page_num = st.slider("Page", 1, total_pages, st.session_state.reader_pdf_page + 1, label_visibility="collapsed") - 1
                 st.session_state.reader_pdf_page = page_num
 
-                # Display PDF page
+                # a jump (slider drag, First/Last, other book) makes queued prefetches useless
+                prefetcher = get_prefetcher()
+                history = st.session_state.reader_history
+                if st.session_state.get('reader_book_path') != book.get('pdf_path') or (history and abs(history[-1][1] - page_num) > 1):
+                    prefetcher.cancel(st.session_state.session_uid)
+                    history.clear()
+                st.session_state.reader_book_path = book.get('pdf_path')
+                record_move(history, page_num)
+
+                # Display PDF page: "Fit" shows all of it, higher zoom levels a window that pans over it
+                zoom_level = st.select_slider("Zoom", ZOOM_LEVELS, key="reader_zoom",
+                                              format_func=lambda z: "Fit" if z == 1 else f"{z:g}×")
+                if st.session_state.get('reader_prefetch_level', zoom_level) != zoom_level:
+                    prefetcher.cancel(st.session_state.session_uid)  # queued pages are at the old zoom
+                st.session_state.reader_prefetch_level = zoom_level
+                st.session_state.setdefault('reader_pan_x', 50)
+                st.session_state.setdefault('reader_pan_y', 0)
+                if st.session_state.get('reader_view_page') != page_num:
+                    st.session_state.reader_pan_y = 0  # a new page starts at its top
+                st.session_state.reader_view_page = page_num
+                pan = (st.session_state.reader_pan_x / 100, st.session_state.reader_pan_y / 100)
                 with st.spinner("📖 Rendering page..."):
-                    pdf_page_img = get_pdf_page_image(book.get('pdf_path'), page_num)
+                    view = render_page(book.get('pdf_path'), page_num, zoom_level, pan)
 
-                if pdf_page_img:
+                if view:
                     st.markdown(f"<div style='background: rgba(255,107,157,0.08); border-radius: 10px; padding: 15px; border: 2px solid rgba(255,107,157,0.3);'>", unsafe_allow_html=True)
-                    st.image(pdf_page_img, use_container_width=True, caption=f"Page {page_num + 1} of {total_pages}")
+                    if view.image is not None:
+                        show_image(view.image, view.fmt, caption=f"Page {page_num + 1} of {total_pages}")
+                    else:
+                        st.markdown(tiles_html(view), unsafe_allow_html=True)
+                        st.caption(f"Page {page_num + 1} of {total_pages} · {zoom_level:g}×")
+                        pan_x_col, pan_y_col = st.columns(2)
+                        with pan_x_col:
+                            if view.size[0] > view.window[2]:
+                                st.slider("↔️ Across", 0, 100, step=5, key="reader_pan_x", format="%d%%")
+                        with pan_y_col:
+                            if view.size[1] > view.window[3]:
+                                st.slider("↕️ Down", 0, 100, step=5, key="reader_pan_y", format="%d%%")
                     # Show AI-based estimated reading time for this page
                     est_minutes = None
                     try:
                         user_wpm = None
                         if st.session_state.current_user:
-                            user_rec = st.session_state.users_db.get(st.session_state.current_user, {})
+                            user_rec = user_handle.record
                             user_wpm = user_rec.get('data', {}).get('wpm')
-                        est_minutes = estimate_read_time(book.get('pdf_path'), page_num, reader_wpm=user_wpm)
+                        est_minutes = estimate_minutes(book.get('pdf_path'), [(page_num, page_num + 1)], wpm=user_wpm, build=build_stats)
                     except Exception:
                         est_minutes = None
 
@@ -585,6 +492,12 @@ elif page == "📖 Read":
                 else:
                     st.error("Could not render page. Try another page.")
 
+                # warm the pages the reader is likely to open next, as they will first see them
+                render_next = partial(render_page, level=zoom_level, pan=(pan[0], 0.0), run=partial(render_farm.call, PREFETCH))
+                prefetcher.schedule(st.session_state.session_uid, render_next, book.get('pdf_path'),
+                                    prefetch_window(history, total_pages),
+                                    cached=partial(is_cached, level=zoom_level, pan=(pan[0], 0.0), cache=page_cache))
+
                 # Page info and controls
                 col1, col2, col3, col4, col5 = st.columns(5)
 
@@ -649,12 +562,12 @@ elif page == "📖 Read":
                         user_wpm = None
                         if st.session_state.current_user:
                             try:
-                                user_rec = st.session_state.users_db.get(st.session_state.current_user, {})
+                                user_rec = user_handle.record
                                 user_wpm = user_rec.get('data', {}).get('wpm')
                             except Exception:
                                 pass
                         
-                        realistic = is_realistic(book.get('pdf_path'), start_page - 1, end_page, minutes, user_wpm=user_wpm)
+                        realistic = is_realistic(book.get('pdf_path'), start_page - 1, end_page, minutes, user_wpm=user_wpm, build=build_stats)
                         if realistic:
                             st.success(f"✅ Realistic reading pace", icon="✅")
                         else:
@@ -673,30 +586,15 @@ elif page == "📖 Read":
                             # Get user's WPM for validation
                             user_wpm = None
                             try:
-                                user_rec = st.session_state.users_db.get(st.session_state.current_user, {})
+                                user_rec = user_handle.record
                                 user_wpm = user_rec.get('data', {}).get('wpm')
                             except Exception:
                                 pass
                             
-                            if is_realistic(book.get('pdf_path'), start_page - 1, end_page, minutes, user_wpm=user_wpm):
+                            if is_realistic(book.get('pdf_path'), start_page - 1, end_page, minutes, user_wpm=user_wpm, build=build_stats):
                                 points = calc_points(pages_read, minutes)
-                                st.session_state.stats['total_pages'] += pages_read
-                                st.session_state.stats['total_time'] += minutes
-                                st.session_state.stats['points'] += points
-                                st.session_state.stats['weekly_pages'] += pages_read
-                                st.session_state.stats['monthly_pages'] += pages_read
-                                st.session_state.books[book_idx]['current_page'] = end_page
-                                st.session_state.books[book_idx]['pages_read'] = st.session_state.books[book_idx].get('pages_read', 0) + pages_read
-                                # persist to user DB
-                                users = st.session_state.users_db
-                                user = users.get(st.session_state.current_user, {})
-                                data = user.get('data', {})
-                                data['stats'] = st.session_state.stats
-                                data['books'] = st.session_state.books
-                                user['data'] = data
-                                users[st.session_state.current_user] = user
-                                save_users(users)
-                                st.session_state.users_db = users
+                                # persist to user DB; updates the book's progress and the user's totals
+                                user_handle.log_session(book.get('id'), start_page, end_page, minutes, points)
 
                                 st.success(f"🎉 +{points} points! Great reading session!", icon="🎉")
                                 st.balloons()
@@ -727,88 +625,107 @@ elif page == "📚 Library":
                 st.error("Please create an account or log in to save books.")
             else:
                 try:
-                    # Read PDF once and reuse
-                    pdf_bytes = uploaded.read()
-                    pages = extract_pdf_pages(pdf_bytes)
-                    
-                    if pages:
-                        # Save PDF and cover to disk (per-user folder)
-                        user_folder_name = ''.join(c for c in st.session_state.current_user if c.isalnum() or c in ('-', '_'))
-                        user_dir = os.path.join(DATA_DIR, user_folder_name)
-                        os.makedirs(user_dir, exist_ok=True)
-                        ts = int(time.time())
-                        safe_title = ''.join(c for c in title if c.isalnum() or c in (' ', '-', '_')).replace(' ', '_')[:120]
-                        pdf_filename = f"{safe_title}_{ts}.pdf"
-                        pdf_path = os.path.join(user_dir, pdf_filename)
-                        with open(pdf_path, 'wb') as f:
-                            f.write(pdf_bytes)
-
-                        # Get first page image and save
-                        cover_image = get_pdf_first_page_image(pdf_path)
-                        cover_path = None
-                        if cover_image:
-                            cover_filename = f"{safe_title}_{ts}.png"
-                            cover_path = os.path.join(user_dir, cover_filename)
-                            try:
-                                cover_image.save(cover_path)
-                            except Exception:
-                                cover_path = None
-
+                    data_books = user_handle.data.get('books', [])
+                    # Stream the upload into the shared blob store. Copying and hashing need no lock; it is
+                    # only held while the blob is published and referenced, so a concurrent delete cannot
+                    # remove the blob before our book references it
+                    uploaded.seek(0)
+                    digest, staged_path = blob_store.stage_stream(uploaded)
+                    with blob_store.lock:
+                        pdf_path, _ = blob_store.commit(digest, staged_path)
                         book_obj = {
                             'title': title,
                             'author': author,
-                            'pages': pages,
+                            'pages': 0,
                             'current_page': 0,
                             'pages_read': 0,
                             'pdf_path': pdf_path,
-                            'cover_path': cover_path,
+                            'cover_path': blob_store.derived_path(digest, thumbnail_name('detail')),
+                            'sha256': digest,
+                            'status': 'processing',
                         }
-
-                        # persist to user DB (avoid double-appending if lists reference same object)
-                        users = st.session_state.users_db
-                        user = users.get(st.session_state.current_user, {})
-                        data = user.get('data', {})
-                        data_books = data.get('books') if data.get('books') is not None else []
-
-                        # ensure we don't already have this pdf_path
-                        exists = any(b.get('pdf_path') == pdf_path for b in data_books)
+                        # persist to user DB, unless we already have this pdf
+                        exists = any(b.get('sha256') == digest for b in data_books)
                         if not exists:
-                            data_books.append(book_obj)
-                            data['books'] = data_books
-                            user['data'] = data
-                            users[st.session_state.current_user] = user
-                            save_users(users)
-                            st.session_state.users_db = users
-
-                        # synchronize session books with saved user books (single source of truth)
-                        st.session_state.books = data_books
-                        st.success(f"✅ Added! ({pages}p)")
-                        time.sleep(1)
-                        st.rerun()
-                    else:
-                        st.error("❌ Could not read PDF. Invalid file?")
+                            book_obj = user_handle.add_book(book_obj)
+                    # page count, cover and page statistics are filled in by the ingestion workers
+                    if not exists:
+                        ingest_queue.submit(st.session_state.current_user, book_obj)
+
+                    # synchronize session books with saved user books (single source of truth)
+                    st.session_state.books = user_handle.data.get('books', [])
+                    st.rerun()
                 except Exception as e:
                     st.error(f"❌ Upload failed: {str(e)}")
     
     st.divider()
     st.markdown("### 📖 Your Books")
     
+    if st.session_state.current_user:
+        for failed_title in ingest_queue.pop_failures(st.session_state.current_user):
+            st.error(f"❌ Could not read PDF \"{failed_title}\". Invalid file?")
+        # books left half-processed by a restart
+        ingest_queue.resume(st.session_state.current_user, st.session_state.books)
+    
     if st.session_state.books:
+        # only one page of cards is built; sorting and filtering run over a cached index of the library
+        col1, col2, col3 = st.columns([2, 1, 1])
+        with col1:
+            library_query = st.text_input("Search", key="library_query", placeholder="🔍 Search title or author", label_visibility="collapsed")
+        with col2:
+            library_sort = st.selectbox("Sort by", ["title", "author", "progress"], key="library_sort", format_func=str.capitalize, label_visibility="collapsed")
+        with col3:
+            library_desc = st.toggle("Descending", key="library_desc")
+        if st.session_state.get('library_view') != (library_query, library_sort, library_desc):
+            st.session_state.library_view = (library_query, library_sort, library_desc)
+            st.session_state.library_page = 0
+        positions = library_index(st.session_state.books).query(library_query, library_sort, library_desc)
+        library_page, page_count, visible = LibraryIndex.page(positions, st.session_state.get('library_page', 0))
+        if not visible:
+            st.info("No books match your search.")
+        
         cols = st.columns(3)
-        for idx, book in enumerate(st.session_state.books):
-            progress = (book.get('current_page', 0) / book['pages']) * 100
+        cover_placeholder = f"<div style='background: linear-gradient(135deg, {COLORS['primary']} 0%, {COLORS['secondary']} 100%); height: 200px; border-radius: 10px; display: flex; align-items: center; justify-content: center;'><h3 style='color: white;'>📖</h3></div>"
+        pending_covers = []  # (st.empty, cover path, Future) for covers the render farm is rendering
+        for slot, idx in enumerate(visible):
+            book = st.session_state.books[idx]
+            processing = book.get('status') == 'processing'
+            failed = book.get('status') == 'failed'
+            progress = 0 if processing or failed else (book.get('current_page', 0) / book['pages']) * 100
+            # a book can be deleted unless its job is queued or running
+            job = ingest_queue.job(book['sha256']) if processing and book.get('sha256') else None
+            busy = job is not None and job.active
             
-            with cols[idx % 3]:
+            with cols[slot % 3]:
                 st.markdown(f"""
                     <div style='background: rgba(255, 107, 157, 0.15); border-radius: 15px; padding: 15px; border: 1px solid rgba(255, 107, 157, 0.25); text-align: center;'>
                 """, unsafe_allow_html=True)
                 
-                # Display cover image if available
+                # Display cover image if available; stored PDFs get a small JPEG thumbnail rendered at grid size,
+                # which st.image serves by URL so the browser caches it across reruns. A missing one is
+                # rendered in the render farm and shown once the rest of the page is out
                 cover_path = book.get('cover_path')
-                if cover_path and isinstance(cover_path, str) and os.path.exists(cover_path):
-                    st.image(cover_path, use_container_width=True)
-                else:
-                    st.markdown(f"<div style='background: linear-gradient(135deg, {COLORS['primary']} 0%, {COLORS['secondary']} 100%); height: 200px; border-radius: 10px; display: flex; align-items: center; justify-content: center;'><h3 style='color: white;'>📖</h3></div>", unsafe_allow_html=True)
+                cover_slot = st.empty()
+                if book.get('sha256') and not (processing or failed):
+                    grid_cover = blob_store.derived_path(book['sha256'], thumbnail_name('grid'))
+                    if os.path.exists(grid_cover):
+                        cover_path = grid_cover
+                    else:
+                        try:
+                            future = render_cover(blob_store, book['sha256'], book.get('pdf_path'), partial(render_farm.submit, VISIBLE))
+                            pending_covers.append((cover_slot, grid_cover, future))
+                            cover_path = None
+                        except Exception:
+                            pass
+                with cover_slot:
+                    if cover_path and isinstance(cover_path, str) and os.path.exists(cover_path):
+                        show_image(cover_path, os.path.splitext(cover_path)[1][1:].lower())
+                    else:
+                        st.markdown(cover_placeholder, unsafe_allow_html=True)
+                if processing:
+                    ingest_progress(book.get('sha256'))
+                elif failed:
+                    st.warning("Processing failed; it is tried again after a restart, or delete the book.")
                 
                 st.markdown(f"""
                     <h4 style='margin: 10px 0 5px 0;'>{book['title']}</h4>
@@ -820,27 +737,36 @@ elif page == "📚 Library":
                 
                 col1, col2, col3 = st.columns(3)
                 with col1:
-                    if st.button("📖", key=f"read_{idx}", help="Read"):
-                        st.session_state.selected_book = idx
+                    if st.button("📖", key=f"read_{book['id']}", help="Read", disabled=processing or failed):
+                        st.session_state.selected_book = book['id']
                 with col2:
-                    if st.button("👁️", key=f"view_{idx}", help="View PDF"):
-                        st.session_state.view_pdf = idx
+                    if st.button("👁️", key=f"view_{book['id']}", help="View PDF", disabled=processing or failed):
+                        st.session_state.view_pdf = book['id']
                 with col3:
-                    if st.button("🗑️", key=f"del_{idx}", help="Delete"):
+                    if st.button("🗑️", key=f"del_{book['id']}", help="Delete", disabled=busy):
                         # remove locally and delete files
-                        # Use the stored user list as the source of truth to avoid double-removal
+                        # Use the stored user list as the source of truth to avoid double-removal; look the book
+                        # up by id, since another session of this user may have added or deleted books meanwhile
                         if st.session_state.current_user:
-                            users = st.session_state.users_db
-                            user = users.get(st.session_state.current_user, {})
-                            data = user.get('data', {})
-                            data_books = data.get('books', [])
-                            if idx < len(data_books):
-                                book_to_remove = data_books.pop(idx)
+                            book_to_remove = next((b for b in user_handle.data.get('books', []) if b.get('id') == book['id']), None)
+                            digest = book_to_remove.get('sha256') if book_to_remove else None
+                            if digest:
+                                # shared blob: only the last reference removes the PDF and its artifacts
+                                with blob_store.lock:
+                                    if user_handle.delete_book(book['id']) == 0:
+                                        blob_store.remove(digest)
+                                        page_cache.drop_document(digest)
+                                        search_index.remove(digest)
+                            elif book_to_remove:
+                                user_handle.delete_book(book['id'])
                                 # delete files on disk if present
                                 try:
                                     p = book_to_remove.get('pdf_path')
                                     if p and os.path.exists(p):
+                                        get_document_pool().discard(p)
                                         os.remove(p)
+                                        if os.path.exists(sidecar_path(p)):
+                                            os.remove(sidecar_path(p))
                                 except Exception:
                                     pass
                                 try:
@@ -849,13 +775,8 @@ elif page == "📚 Library":
                                         os.remove(c)
                                 except Exception:
                                     pass
-                            data['books'] = data_books
-                            user['data'] = data
-                            users[st.session_state.current_user] = user
-                            save_users(users)
-                            st.session_state.users_db = users
                             # sync session books
-                            st.session_state.books = data_books
+                            st.session_state.books = user_handle.data.get('books', [])
                         else:
                             # not logged in: just pop local list
                             if idx < len(st.session_state.books):
@@ -863,7 +784,10 @@ elif page == "📚 Library":
                                 try:
                                     p = book_to_remove.get('pdf_path')
                                     if p and os.path.exists(p):
+                                        get_document_pool().discard(p)
                                         os.remove(p)
+                                        if os.path.exists(sidecar_path(p)):
+                                            os.remove(sidecar_path(p))
                                 except Exception:
                                     pass
                                 try:
@@ -873,6 +797,26 @@ elif page == "📚 Library":
                                 except Exception:
                                     pass
                         st.rerun()
+        
+        if pending_covers:
+            wait_futures([future for _, _, future in pending_covers], timeout=COVER_WAIT)
+            for cover_slot, grid_cover, future in pending_covers:
+                if future.done() and not future.cancelled() and future.exception() is None and os.path.exists(grid_cover):
+                    with cover_slot:
+                        show_image(grid_cover, os.path.splitext(grid_cover)[1][1:])
+        
+        if page_count > 1:
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col1:
+                if st.button("⬅️ Prev", key="library_prev", disabled=library_page == 0, use_container_width=True):
+                    st.session_state.library_page = library_page - 1
+                    st.rerun()
+            with col2:
+                st.markdown(f"<div style='text-align: center; padding: 8px; color: rgba(255,255,255,0.7);'>Page {library_page + 1} of {page_count} · {len(positions)} books</div>", unsafe_allow_html=True)
+            with col3:
+                if st.button("Next ➡️", key="library_next", disabled=library_page >= page_count - 1, use_container_width=True):
+                    st.session_state.library_page = library_page + 1
+                    st.rerun()
     else:
         st.info("No books yet! Upload one to get started!")
 
@@ -880,6 +824,10 @@ elif page == "📚 Library":
 elif page == "📊 Stats":
     st.markdown(f"<div class='header'>📊 Statistics</div>", unsafe_allow_html=True)
     st.divider()
+    # Plotly is only needed here, so it is loaded on the first visit to this page
+    from readvibe.charts import book_progress_figure, cached_figure, goals_figure, history_start, pages_per_day_figure
+    # charts of a logged-in user are cached per data version; logged-out sessions build their own
+    chart_key = (st.session_state.current_user, user_handle.data.get('version', 0)) if user_handle else None
     
     col1, col2, col3, col4 = st.columns(4)
     with col1:
@@ -898,13 +846,9 @@ elif page == "📊 Stats":
         col1, col2 = st.columns(2)
         with col1:
             st.markdown("### 📊 Book Progress")
-            data = []
-            for b in st.session_state.books:
-                data.append({'Book': b['title'][:15], 'Read': b.get('pages_read', 0), 'Total': b['pages']})
-            df = pd.DataFrame(data)
-            fig = px.bar(df, x='Book', y=['Read', 'Total'], barmode='stack',
-                        color_discrete_sequence=[COLORS['primary'], COLORS['accent']])
-            fig.update_layout(template='plotly_dark', height=400, margin=dict(l=0,r=0,t=0,b=0))
+            # figures are reused until the user's data version changes (session logged, book added/removed)
+            fig = cached_figure(chart_key and ('books', *chart_key),
+                                lambda: book_progress_figure(st.session_state.books, [COLORS['primary'], COLORS['accent']]))
             st.plotly_chart(fig, use_container_width=True)
         
         with col2:
@@ -915,7 +859,7 @@ elif page == "📊 Stats":
             stats_monthly_goal = 800
             if st.session_state.current_user:
                 try:
-                    user_rec = st.session_state.users_db.get(st.session_state.current_user, {})
+                    user_rec = user_handle.record
                     user_goals = user_rec.get('data', {}).get('goals', {})
                     stats_daily_goal = user_goals.get('daily', 30)
                     stats_weekly_goal = user_goals.get('weekly', 200)
@@ -923,20 +867,19 @@ elif page == "📊 Stats":
                 except Exception:
                     pass
             
-            goals = {
-                'Goal': ['Daily', 'Weekly', 'Monthly'],
-                'Progress': [
-                    st.session_state.stats['total_pages'] % stats_daily_goal,
-                    st.session_state.stats['weekly_pages'],
-                    st.session_state.stats['monthly_pages']
-                ],
-                'Target': [stats_daily_goal, stats_weekly_goal, stats_monthly_goal]
-            }
-            df = pd.DataFrame(goals)
-            fig = px.bar(df, x='Goal', y=['Progress', 'Target'], barmode='group',
-                        color_discrete_sequence=[COLORS['secondary'], COLORS['warning']])
-            fig.update_layout(template='plotly_dark', height=400, margin=dict(l=0,r=0,t=0,b=0))
+            goal_progress = (st.session_state.stats['daily_pages'], st.session_state.stats['weekly_pages'], st.session_state.stats['monthly_pages'])
+            goal_targets = (stats_daily_goal, stats_weekly_goal, stats_monthly_goal)
+            # keyed on its six numbers, which also change when a day, week or month rolls over
+            fig = cached_figure(('goals', goal_progress, goal_targets),
+                                lambda: goals_figure(goal_progress, goal_targets, [COLORS['secondary'], COLORS['warning']]))
             st.plotly_chart(fig, use_container_width=True)
+    
+    if st.session_state.current_user:
+        st.markdown("### 📅 Pages per Day")
+        today = datetime.now().date()
+        fig = cached_figure(('days', *chart_key, today),
+                            lambda: pages_per_day_figure(user_store.day_series(st.session_state.current_user, history_start(today).isoformat()), COLORS['primary'], today))
+        st.plotly_chart(fig, use_container_width=True)
 
 # ==================== REWARDS ====================
 elif page == "🎁 Rewards":
@@ -948,7 +891,7 @@ elif page == "🎁 Rewards":
     rewards_monthly_goal = 800
     if st.session_state.current_user:
         try:
-            user_rec = st.session_state.users_db.get(st.session_state.current_user, {})
+            user_rec = user_handle.record
             goals = user_rec.get('data', {}).get('goals', {})
             rewards_weekly_goal = goals.get('weekly', 200)
             rewards_monthly_goal = goals.get('monthly', 800)
@@ -994,19 +937,34 @@ elif page == "🎁 Rewards":
     
     st.divider()
     
+    # rankings cover every user, so wait until a first-run data import has finished
+    leaderboard = get_leaderboard(user_store, user_records) if not migrations.running else None
+    
+    st.markdown("### 🥇 Leaderboard")
+    if leaderboard is None:
+        st.info("⏳ The leaderboard will be ready once the data upgrade finishes.")
+    else:
+        rank_by = st.radio("Rank by", ["points", "pages"], horizontal=True, key="leaderboard_by", format_func=str.capitalize, label_visibility="collapsed")
+        if st.session_state.current_user:
+            my_rank = leaderboard.rank(st.session_state.current_user, rank_by)
+            if my_rank:
+                st.markdown(f"<div class='card'><div class='label'>Your Rank</div><div class='metric'>#{my_rank}</div><div class='label'>of {len(leaderboard)} readers</div></div>", unsafe_allow_html=True)
+        for rank, username, value in leaderboard.top(10, rank_by):
+            me = username == st.session_state.current_user
+            st.markdown(f"<div style='display: flex; justify-content: space-between; padding: 8px 12px; border-radius: 8px; background: {'rgba(255,107,157,0.2)' if me else 'rgba(255,255,255,0.04)'}; margin-bottom: 4px;'><span><strong>#{rank}</strong> {username}</span><span class='badge'>{value} {rank_by}</span></div>", unsafe_allow_html=True)
+    
+    st.divider()
+    
     st.markdown("### 🏆 Tiers")
-    tiers = [
-        {"name": "Bronze", "range": "0-200", "reward": "Avatar Pack"},
-        {"name": "Silver", "range": "201-500", "reward": "Theme + Avatar"},
-        {"name": "Gold", "range": "501-1000", "reward": "$2.50 Card"},
-        {"name": "Platinum", "range": "1000+", "reward": "$5 Card"},
-    ]
+    tier_counts = leaderboard.tier_counts() if leaderboard is not None else {}
+    my_tier = tier_for(st.session_state.stats['points'])
     
-    for tier in tiers:
+    for tier in (leaderboard.tiers if leaderboard is not None else TIERS):
+        readers = f" · {tier_counts[tier['name']]} readers" if tier['name'] in tier_counts else ""
         st.markdown(f"""
-            <div class='card'>
+            <div class='card' style='{f"border: 2px solid {COLORS['primary']};" if tier is my_tier else ""}'>
                 <div style='display: flex; justify-content: space-between; align-items: center;'>
-                    <div><h4 style='margin: 0;'>{tier['name']}</h4><p style='margin: 0; font-size: 0.9em;'>{tier['range']} pts</p></div>
+                    <div><h4 style='margin: 0;'>{tier['name']}{' ⭐' if tier is my_tier else ''}</h4><p style='margin: 0; font-size: 0.9em;'>{tier['range']} pts{readers}</p></div>
                     <span class='badge'>{tier['reward']}</span>
                 </div>
             </div>
@@ -1017,76 +975,106 @@ elif page == "⚙️ Settings":
     st.markdown(f"<div class='header'>⚙️ Settings</div>", unsafe_allow_html=True)
     st.divider()
     
-    st.markdown("### 📖 Reading Goals")
+    # admins also get this server process's timings, error counts and cache hit ratios
+    perf_tab = None
+    prefs_tab = st.container()
+    if st.session_state.current_user in ADMINS:
+        prefs_tab, perf_tab = st.tabs(["📖 Preferences", "📈 Performance"])
+
+    with prefs_tab:
+        st.markdown("### 📖 Reading Goals")
     
-    # Load current goals from user data
-    daily_goal = 30
-    weekly_goal = 200
-    monthly_goal = 800
-    if st.session_state.current_user:
-        try:
-            user_rec = st.session_state.users_db.get(st.session_state.current_user, {})
-            goals = user_rec.get('data', {}).get('goals', {})
-            daily_goal = goals.get('daily', 30)
-            weekly_goal = goals.get('weekly', 200)
-            monthly_goal = goals.get('monthly', 800)
-        except Exception:
-            pass
+        # Load current goals from user data
+        daily_goal = 30
+        weekly_goal = 200
+        monthly_goal = 800
+        if st.session_state.current_user:
+            try:
+                user_rec = user_handle.record
+                goals = user_rec.get('data', {}).get('goals', {})
+                daily_goal = goals.get('daily', 30)
+                weekly_goal = goals.get('weekly', 200)
+                monthly_goal = goals.get('monthly', 800)
+            except Exception:
+                pass
     
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        daily_goal_input = st.number_input("Daily Goal (pages)", min_value=1, max_value=500, value=int(daily_goal), key="daily_goal_input")
-    with col2:
-        weekly_goal_input = st.number_input("Weekly Goal (pages)", min_value=1, max_value=2000, value=int(weekly_goal), key="weekly_goal_input")
-    with col3:
-        monthly_goal_input = st.number_input("Monthly Goal (pages)", min_value=1, max_value=10000, value=int(monthly_goal), key="monthly_goal_input")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            daily_goal_input = st.number_input("Daily Goal (pages)", min_value=1, max_value=500, value=int(daily_goal), key="daily_goal_input")
+        with col2:
+            weekly_goal_input = st.number_input("Weekly Goal (pages)", min_value=1, max_value=2000, value=int(weekly_goal), key="weekly_goal_input")
+        with col3:
+            monthly_goal_input = st.number_input("Monthly Goal (pages)", min_value=1, max_value=10000, value=int(monthly_goal), key="monthly_goal_input")
     
-    st.divider()
-
-    st.markdown("### 👤 Profile")
-    col1, col2 = st.columns(2)
-    with col1:
-        name = st.text_input("Name", "Reader", key="name_input")
-        email_display = st.session_state.current_user if st.session_state.current_user else "reader@example.com"
-        email = st.text_input("Email", email_display, key="email_input", disabled=True)
-    with col2:
-        country = st.text_input("Country", "USA", key="country_input")
-        theme = st.selectbox("Theme", ["Dark (Gen Z)", "Light"], key="theme_select")
-
-    st.divider()
+        st.divider()
 
-    # Per-user reading speed (WPM)
-    user_wpm = None
-    if st.session_state.current_user:
-        try:
-            user_rec = st.session_state.users_db.get(st.session_state.current_user, {})
-            user_wpm = user_rec.get('data', {}).get('wpm')
-        except Exception:
-            user_wpm = None
+        st.markdown("### 👤 Profile")
+        col1, col2 = st.columns(2)
+        with col1:
+            name = st.text_input("Name", "Reader", key="name_input")
+            email_display = st.session_state.current_user if st.session_state.current_user else "reader@example.com"
+            email = st.text_input("Email", email_display, key="email_input", disabled=True)
+        with col2:
+            country = st.text_input("Country", "USA", key="country_input")
+            theme = st.selectbox("Theme", ["Dark (Gen Z)", "Light"], key="theme_select")
 
-    wpm = st.number_input("Reading speed (WPM)", min_value=50, max_value=1000, value=int(user_wpm) if user_wpm else 200)
+        st.divider()
 
-    if st.button("💾 Save", use_container_width=True):
-        # persist settings to user data if logged in
+        # Per-user reading speed (WPM)
+        user_wpm = None
         if st.session_state.current_user:
             try:
-                users = st.session_state.users_db
-                user = users.get(st.session_state.current_user, {})
-                data = user.get('data', {})
-                data['wpm'] = int(wpm)
-                data['goals'] = {
-                    'daily': int(daily_goal_input),
-                    'weekly': int(weekly_goal_input),
-                    'monthly': int(monthly_goal_input),
-                }
-                data['name'] = name
-                data['country'] = country
-                user['data'] = data
-                users[st.session_state.current_user] = user
-                save_users(users)
-                st.session_state.users_db = users
-                st.success("✅ Settings saved!")
-            except Exception as e:
-                st.error(f"Failed to save: {e}")
-        else:
-            st.info("Log in to save profile settings.")
+                user_rec = user_handle.record
+                user_wpm = user_rec.get('data', {}).get('wpm')
+            except Exception:
+                user_wpm = None
+
+        wpm = st.number_input("Reading speed (WPM)", min_value=50, max_value=1000, value=int(user_wpm) if user_wpm else 200)
+
+        if st.button("💾 Save", use_container_width=True):
+            # persist settings to user data if logged in
+            if st.session_state.current_user:
+                try:
+                    user_handle.update_settings(
+                        wpm=int(wpm),
+                        goals={
+                            'daily': int(daily_goal_input),
+                            'weekly': int(weekly_goal_input),
+                            'monthly': int(monthly_goal_input),
+                        },
+                        name=name,
+                        country=country,
+                    )
+                    st.success("✅ Settings saved!")
+                except Exception as e:
+                    st.error(f"Failed to save: {e}")
+            else:
+                st.info("Log in to save profile settings.")
+
+    if perf_tab is not None:
+        with perf_tab:
+            metrics = get_metrics()
+            st.caption(f"This server process, since {datetime.fromtimestamp(metrics.since):%Y-%m-%d %H:%M:%S}")
+            ops = metrics.operations()
+            if ops:
+                st.markdown("#### ⏱️ Operations")
+                st.markdown(markdown_table(ops, ['op', 'count', 'errors', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms']))
+            else:
+                st.info("Nothing has been timed yet.")
+            caches = metrics.caches()
+            if caches:
+                st.markdown("#### 🗃️ Caches")
+                st.markdown(markdown_table(caches, ['cache', 'hits', 'misses', 'hit_ratio']))
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.download_button("⬇️ Prometheus", metrics.prometheus(), file_name="readvibe-metrics.prom",
+                                   mime="text/plain", use_container_width=True)
+            with col2:
+                st.download_button("⬇️ JSONL", metrics.jsonl(), file_name="readvibe-metrics.jsonl",
+                                   mime="application/jsonl", use_container_width=True)
+            with col3:
+                if st.button("🔄 Reset", use_container_width=True, key="reset_metrics"):
+                    metrics.reset()
+                    st.rerun()
+
+page_timer.stop()
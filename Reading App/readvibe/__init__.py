@@ -0,0 +1,5 @@
+"""Non-UI helpers for the ReadVibe Streamlit app.
+
+Everything in here lives for the whole server process (modules are imported
+once), unlike the top level of ``app.py`` which re-executes on every rerun.
+"""
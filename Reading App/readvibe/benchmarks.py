@@ -0,0 +1,385 @@
+"""Headless benchmarks for the PDF and persistence hot paths.
+
+    python -m readvibe.benchmarks [--quick] [--only NAME] [--out results.json] [--compare baseline.json]
+
+Run it from the ``Reading App`` folder. Everything it needs is generated in
+a temporary directory:
+
+- PDFs of 10, 100 and 500 pages, each in three text densities, and an A0 poster page.
+- User stores of 10 to 100,000 users, each with a few books: SQLite, and the
+  journaled ``users.json``.
+
+Each case is called until a timing round lasts at least ``MIN_ROUND_SECONDS``
+and is then timed over ``REPEAT`` rounds, in the manner of ``timeit``/asv.
+It reports:
+
+- Latency: min, median, p95 and mean, in ms per call.
+- Throughput: calls per second, plus items per second for bulk cases.
+- Peak memory: what Python allocated during one call, measured with tracemalloc. MuPDF's own buffers are not counted.
+
+Results are saved as JSON, one entry per case name. ``--compare`` prints
+each median against an earlier results file and exits with status 1 if
+any case got slower than ``--threshold``.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import fitz
+import numpy as np
+
+from .jsonstore import JournaledJsonStore, atomic_write_json
+from .pagecache import PageImageCache
+from .pagestats import build_page_stats, estimate_minutes, load_page_stats
+from .pageview import page_size, render_tiles, render_view
+from .records import UserRecords
+from .renderfarm import VISIBLE, RenderFarm
+from .sessions import is_realistic, realistic_mask
+from .store import SQLiteUserStore
+
+REPEAT = 7
+MIN_ROUND_SECONDS = 0.05
+MAX_CALLS_PER_ROUND = 10000
+
+PAGE_COUNTS = (10, 100, 500)
+# words per page and font size, so each density still fits on the page
+DENSITIES = {'sparse': (60, 12), 'normal': (300, 10), 'dense': (900, 7)}
+USER_COUNTS = (10, 1000, 10000, 100000)
+QUICK_PAGE_COUNTS = (10, 100)
+QUICK_USER_COUNTS = (10, 1000)
+BOOKS_PER_USER = 3
+BULK_RANGES = 10000
+
+_VOCABULARY = ('the a of and to in is was reader page book chapter story quietly morning river garden '
+               'window teacher revision question answer history geography mathematics photosynthesis '
+               'understanding characteristics responsibility nevertheless approximately environment '
+               'independent comprehension 1945 2025 x y').split()
+
+
+# ---- synthetic inputs ----
+
+def synthetic_pdf(path, pages, density='normal', seed=0, scale=1):
+    """Write a ``pages``-page PDF of random prose at one of :data:`DENSITIES`, on A4 pages ``scale`` times enlarged."""
+    words_per_page, fontsize = DENSITIES[density]
+    rnd = random.Random(seed)
+    doc = fitz.open()
+    try:
+        for _ in range(pages):
+            page = doc.new_page(width=595 * scale, height=842 * scale)
+            text = ' '.join(rnd.choice(_VOCABULARY) for _ in range(words_per_page * scale * scale))
+            page.insert_textbox(page.rect + (36, 36, -36, -36), text, fontsize=fontsize)
+        doc.save(path)
+    finally:
+        doc.close()
+    return path
+
+
+def synthetic_users(count, pdf_paths, books_per_user=BOOKS_PER_USER, seed=0) -> dict:
+    """A ``users.json`` dict of ``count`` readers whose books point at ``pdf_paths``."""
+    rnd = random.Random(seed)
+    users = {}
+    for i in range(count):
+        books = []
+        for j in range(books_per_user):
+            pages = rnd.choice(PAGE_COUNTS)
+            current = rnd.randint(0, pages)
+            books.append({'title': f"Book {i}-{j}", 'author': 'Synthetic', 'pages': pages, 'current_page': current,
+                          'pages_read': current, 'pdf_path': rnd.choice(pdf_paths), 'cover_path': None})
+        users[f"reader{i:06d}"] = {
+            'password': '0' * 64,
+            'data': {'books': books, 'wpm': rnd.choice((None, 180, 250)),
+                     'goals': {'daily': 30, 'weekly': 200, 'monthly': 800},
+                     'stats': {'total_pages': rnd.randint(0, 5000), 'total_time': rnd.randint(0, 9000),
+                               'points': rnd.randint(0, 2000), 'weekly_pages': 0, 'monthly_pages': 0}},
+        }
+    users['_last_user'] = None
+    return users
+
+
+# ---- measurement ----
+
+def measure(call, items=None, repeat=REPEAT) -> dict:
+    """Time ``call()``; ``items`` is how many things one call processes, for bulk cases."""
+    call()  # warm-up: imports, document pool, sidecars, disk cache
+    number, elapsed = 1, 0.0
+    while number < MAX_CALLS_PER_ROUND:
+        started = time.perf_counter()
+        for _ in range(number):
+            call()
+        elapsed = time.perf_counter() - started
+        if elapsed >= MIN_ROUND_SECONDS:
+            break
+        number *= 10
+    times = [elapsed / number]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            call()
+        times.append((time.perf_counter() - started) / number)
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    times.sort()
+    median = statistics.median(times)
+    result = {
+        'calls_per_round': number,
+        'rounds': repeat,
+        'min_ms': times[0] * 1000,
+        'median_ms': median * 1000,
+        'p95_ms': times[min(len(times) - 1, round(0.95 * (len(times) - 1)))] * 1000,
+        'mean_ms': statistics.fmean(times) * 1000,
+        'ops_per_s': 1 / median if median else float('inf'),
+        'peak_kib': peak / 1024,
+    }
+    if items:
+        result['items'] = items
+        result['items_per_s'] = items / median if median else float('inf')
+    return result
+
+
+# ---- cases: (name, fn(workdir, quick) -> yields (case name, call, items)) ----
+
+BENCHMARKS = []
+
+
+def benchmark(name):
+    def register(fn):
+        BENCHMARKS.append((name, fn))
+        return fn
+    return register
+
+
+def _pdf(workdir, pages, density='normal', scale=1):
+    path = os.path.join(workdir, f"synthetic-{pages}-{density}{f'-x{scale}' if scale != 1 else ''}.pdf")
+    if not os.path.exists(path):
+        synthetic_pdf(path, pages, density, scale=scale)
+    return path
+
+
+def _users(workdir, count) -> dict:
+    return synthetic_users(count, [_pdf(workdir, 10)])
+
+
+def _sqlite_store(workdir, count):
+    path = os.path.join(workdir, f"users-{count}.db")
+    exists = os.path.exists(path)
+    store = SQLiteUserStore(path)
+    if not exists:
+        store.import_legacy(_users(workdir, count))
+    return store
+
+
+def _json_store(workdir, count):
+    # an existing users.json, as a deployment upgrading to the journal has; loading it assigns book ids
+    path = os.path.join(workdir, f"users-{count}.json")
+    if not os.path.exists(path):
+        atomic_write_json(path, _users(workdir, count))
+    return JournaledJsonStore(path)
+
+
+@benchmark('page_size')
+def bench_page_size(workdir, quick):
+    # what the first view of a page measures, and ingestion stores as the book's page count
+    for pages in QUICK_PAGE_COUNTS if quick else PAGE_COUNTS:
+        path = _pdf(workdir, pages)
+        yield f"pages={pages}", lambda p=path: page_size(p, 0), None
+
+
+@benchmark('page_image')
+def bench_page_image(workdir, quick):
+    # one page at Fit, as the Read view shows it
+    for density in DENSITIES:
+        path = _pdf(workdir, 10, density)
+        yield f"render,{density}", lambda p=path: render_view(p, 3), None
+    path = _pdf(workdir, 10, 'dense')
+    for fmt in ('png', 'jpg', 'webp'):
+        yield f"render,dense,{fmt}", lambda f=fmt: render_view(path, 3, fmt=f), None
+    path = _pdf(workdir, 10)
+    memory = PageImageCache(os.path.join(workdir, 'cache-memory'))
+    disk = PageImageCache(os.path.join(workdir, 'cache-disk'), max_bytes=0)
+    yield "memory hit", lambda: render_view(path, 3, cache=memory), None
+    yield "disk hit", lambda: render_view(path, 3, cache=disk), None
+
+
+@benchmark('render_view')
+def bench_render_view(workdir, quick):
+    # A4 and A0 (4x4 A4): at Fit both are one image of the same size; zoomed, only the window's tiles.
+    # "2x page" is the whole page at a fixed 2x zoom, as the Read view rendered it before render_view
+    for label, scale in (('a4', 1), ('a0', 4)):
+        path = _pdf(workdir, 3, 'normal', scale)
+        yield f"2x page,{label}", lambda p=path: render_tiles(p, 1, 2.0, [None]), None
+        for level in (1, 2, 4):
+            yield f"level={level:g},{label}", lambda p=path, z=level: render_view(p, 1, z, (0.5, 0.5)), None
+    path = _pdf(workdir, 3, 'normal', 4)
+    memory = PageImageCache(os.path.join(workdir, 'cache-tiles'))
+    yield "level=2,a0,memory hit", lambda: render_view(path, 1, 2, (0.5, 0.5), cache=memory), None
+
+
+@benchmark('page_flip')
+def bench_page_flip(workdir, quick):
+    # an uncached page turn up to the bytes Streamlit serves: st.image's own processing is image_to_url
+    from streamlit.elements.image import image_to_url
+
+    path = _pdf(workdir, 10, 'dense')
+    yield "png,st.image auto", lambda: image_to_url(render_view(path, 3, fmt='png').image, -2, False, 'RGB', 'auto', 'bench'), None
+    for fmt in ('png', 'jpg'):
+        output = 'PNG' if fmt == 'png' else 'JPEG'
+        yield f"{fmt},st.image {output}", lambda f=fmt, o=output: image_to_url(render_view(path, 3, fmt=f).image, -2, False, 'RGB', o, 'bench'), None
+
+
+@benchmark('render_farm')
+def bench_render_farm(workdir, quick):
+    # uncached whole-page renders of many readers at once: on the calling thread, then through the farm
+    path = _pdf(workdir, 100, 'dense')
+    pages = range(0, 100, 5)
+    yield "script thread", lambda: [render_tiles(path, page, 2.0, [None]) for page in pages], len(pages)
+    # a farm has at least two workers, one of them kept from indexing jobs
+    for workers in sorted({2, max(2, os.cpu_count() or 1)}):
+        with RenderFarm(workers=workers) as farm:
+            def render_all(farm=farm):
+                for future in [farm.submit(VISIBLE, render_tiles, path, page, 2.0, [None]) for page in pages]:
+                    future.result()
+            yield f"workers={workers}", render_all, len(pages)
+
+
+@benchmark('estimate_minutes')
+def bench_estimate_minutes(workdir, quick):
+    # "build" is the sidecar build ingestion (or the render farm) pays once per book
+    for density in DENSITIES:
+        path = _pdf(workdir, 10, density)
+        yield f"build,{density}", lambda p=path: build_page_stats(p), None
+        yield f"stats,{density}", lambda p=path: estimate_minutes(p, [(3, 4)]), None
+
+
+@benchmark('is_realistic')
+def bench_is_realistic(workdir, quick):
+    path = _pdf(workdir, 100, 'normal')
+    yield "one range", lambda: is_realistic(path, 10, 30, 25, user_wpm=220), None
+    rnd = np.random.default_rng(0)
+    starts = rnd.integers(0, 99, BULK_RANGES)
+    ends = starts + rnd.integers(1, 10, BULK_RANGES)
+    minutes = rnd.integers(1, 60, BULK_RANGES)
+    wpm = rnd.choice([0, 180, 250], BULK_RANGES)
+    stats = load_page_stats(path)
+    yield f"vectorized,ranges={BULK_RANGES}", lambda: realistic_mask(stats, starts, ends, minutes, wpm), BULK_RANGES
+
+
+@benchmark('sqlite_store')
+def bench_sqlite_store(workdir, quick):
+    for count in QUICK_USER_COUNTS if quick else USER_COUNTS:
+        store = _sqlite_store(workdir, count)
+        name = f"reader{count // 2:06d}"
+        book = store.get_books(name)[0]
+        # add_book last: the books it adds would slow the other cases down
+        yield f"get_user,users={count}", lambda s=store, n=name: s.get_user(n), None
+        yield f"log_session,users={count}", lambda s=store, n=name, b=book: s.log_session(n, b['id'], 0, 10, 15, 10), None
+        yield f"add_book,users={count}", lambda s=store, n=name, b=book: s.add_book(n, b), None
+
+
+@benchmark('json_store')
+def bench_json_store(workdir, quick):
+    # log_session is one journal append; the compaction every COMPACT_EVERY records is timed on its own
+    for count in QUICK_USER_COUNTS if quick else USER_COUNTS:
+        store = _json_store(workdir, count)
+        name = f"reader{count // 2:06d}"
+        book = store.get_books(name)[0]
+        yield f"get_user,users={count}", lambda s=store, n=name: s.get_user(n), None
+        yield f"log_session,users={count}", lambda s=store, n=name, b=book: s.log_session(n, b['id'], 0, 10, 15, 10), None
+        yield f"compact,users={count}", store.compact, count
+
+
+@benchmark('user_records')
+def bench_user_records(workdir, quick):
+    # a write as a browser session makes it: the store write, then the record reloaded for every session
+    for count in QUICK_USER_COUNTS if quick else USER_COUNTS:
+        records = UserRecords(_sqlite_store(workdir, count))
+        name = f"reader{count // 3:06d}"  # not the reader sqlite_store gave many books
+        book = records.get(name)['data']['books'][0]
+        yield f"get,users={count}", lambda r=records, n=name: r.get(n), None
+        yield f"write,users={count}", lambda r=records, n=name, b=book: r.write(n, 'log_session', b['id'], 0, 10, 15, 10), None
+
+
+def run(workdir, quick=False, only=None, log=None) -> dict:
+    results = {}
+    for name, cases in BENCHMARKS:
+        if only and name not in only:
+            continue
+        for case, call, items in cases(workdir, quick):
+            key = f"{name}[{case}]"
+            results[key] = measure(call, items)
+            if log:
+                log(key, results[key])
+    return results
+
+
+def environment() -> dict:
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'pymupdf': fitz.VersionBind,
+        'numpy': np.__version__,
+    }
+
+
+def compare(results, baseline, threshold) -> list:
+    """Cases whose median is more than ``threshold`` times the baseline's, as (name, old ms, new ms)."""
+    slower = []
+    for name, new in results.items():
+        old = baseline.get(name)
+        if old and new['median_ms'] > old['median_ms'] * threshold:
+            slower.append((name, old['median_ms'], new['median_ms']))
+    return slower
+
+
+def _print_row(name, r):
+    extra = f"  {r['items_per_s']:>12,.0f} items/s" if 'items_per_s' in r else ''
+    print(f"{name:<48} {r['median_ms']:>10.3f} ms  p95 {r['p95_ms']:>10.3f} ms  "
+          f"{r['ops_per_s']:>10,.1f}/s  peak {r['peak_kib']:>10,.0f} KiB{extra}", flush=True)
+
+
+def main(argv=None):
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(prog='python -m readvibe.benchmarks', description="Benchmark the PDF and persistence hot paths.")
+    parser.add_argument('--quick', action='store_true', help="smaller PDFs and user databases")
+    parser.add_argument('--only', action='append', choices=[name for name, _ in BENCHMARKS], help="run only these benchmarks")
+    parser.add_argument('--out', help="results file (default: data/_bench/<time>.json)")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=1.25, help="slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='readvibe-bench-')
+    try:
+        results = run(workdir, args.quick, args.only, log=_print_row)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    out = args.out or os.path.join(app_dir, 'data', '_bench', time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump({'environment': environment(), 'quick': args.quick, 'results': results}, f, indent=2)
+    print(f"saved {len(results)} results to {out}")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        slower = compare(results, baseline, args.threshold)
+        for name, old, new in slower:
+            print(f"SLOWER {name}: {old:.3f} ms -> {new:.3f} ms ({new / old:.2f}x)")
+        print(f"{len(slower)} of {len(results)} cases slower than {args.threshold:g}x the baseline")
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""Content-addressed storage for uploaded PDFs.
+
+Each distinct PDF is stored once, named by the SHA-256 of its bytes::
+
+    <root>/<digest[:2]>/<digest>.pdf
+
+and everything derived from it sits next to it under the same name
+(``<digest>.cover.png``, ``<digest>.stats``, ...), so a revision booklet
+uploaded by a whole class is stored, indexed and rendered once. Book
+records carry the digest; the user store counts references per digest,
+and the blob and its artifacts are deleted when the last book pointing
+at them goes.
+"""
+import glob
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+from .pdfdocs import get_document_pool, remember_digest
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def link_or_copy(src, dst):
+    """Put a copy of ``src`` at ``dst`` atomically, as a hard link when the filesystem allows."""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = root
+        # held while adding a reference to a blob or deciding to delete one
+        self.lock = threading.RLock()
+
+    def path(self, digest, suffix='.pdf'):
+        return os.path.join(self.root, digest[:2], digest + suffix)
+
+    def derived_path(self, digest, name):
+        """Where an artifact derived from the blob lives, e.g. ``derived_path(d, 'cover.png')``."""
+        return self.path(digest, '.' + name)
+
+    def exists(self, digest) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def put_bytes(self, data):
+        """Store ``data`` unless it is already present; returns (digest, path)."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        remember_digest(path, digest)
+        return digest, path
+
+    def stage_stream(self, fileobj, chunk_size=CHUNK_SIZE):
+        """Copy a file-like object into a temporary file in the store chunk by chunk, hashing as it goes.
+
+        Only one chunk is held in memory at a time, and no lock is taken. Returns (digest, temporary
+        path), to be handed to :meth:`commit`.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        h = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in iter(lambda: fileobj.read(chunk_size), b''):
+                    h.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        return h.hexdigest(), tmp
+
+    def commit(self, digest, tmp):
+        """Rename a file staged by :meth:`stage_stream` to its blob, or drop it if the blob is there already.
+
+        Call it holding ``lock``, together with adding the book that references the blob.
+        Returns (path, created).
+        """
+        path = self.path(digest)
+        try:
+            created = not os.path.exists(path)
+            if created:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        remember_digest(path, digest)
+        return path, created
+
+    def put_stream(self, fileobj, chunk_size=CHUNK_SIZE):
+        """:meth:`stage_stream` and :meth:`commit` in one go. Returns (digest, path, created)."""
+        digest, tmp = self.stage_stream(fileobj, chunk_size)
+        with self.lock:
+            return (digest, *self.commit(digest, tmp))
+
+    def put_file(self, src, digest):
+        """Hard-link (or copy) ``src``, whose SHA-256 is ``digest``, into the store.
+
+        ``src`` itself is left in place for the caller to remove once the
+        book record points at the blob.
+        """
+        path = self.path(digest)
+        if os.path.abspath(src) != os.path.abspath(path) and not os.path.exists(path):
+            link_or_copy(src, path)
+        remember_digest(path, digest)
+        return path
+
+    def remove(self, digest):
+        """Delete the blob and every artifact derived from it."""
+        get_document_pool().discard(self.path(digest))
+        for p in glob.glob(os.path.join(self.root, digest[:2], glob.escape(digest) + '.*')):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+
+_blobs = None
+_blobs_lock = threading.Lock()
+
+
+def get_blob_store(root) -> BlobStore:
+    global _blobs
+    with _blobs_lock:
+        if _blobs is None:
+            _blobs = BlobStore(root)
+        return _blobs
@@ -0,0 +1,92 @@
+"""Plotly figures for the Stats page, memoized per user.
+
+The Stats page used to build a pandas DataFrame and a Plotly Express
+figure for every chart on every rerun. Figures are now built from plain
+lists with graph objects and cached in an LRU. The key is the username and
+the user's data ``version``, which the store bumps whenever a session is
+logged or a book is added, changed or removed. An unchanged dashboard
+reuses the same figure objects, and only Streamlit's own serialization
+remains per rerun.
+"""
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import plotly.graph_objects as go
+
+from .metrics import register_cache
+
+MAX_CACHED_FIGURES = 512
+HISTORY_DAYS = 365
+
+_LAYOUT = dict(template='plotly_dark', height=400, margin=dict(l=0, r=0, t=0, b=0))
+
+
+class FigureCache:
+    def __init__(self, max_entries=MAX_CACHED_FIGURES):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self._figures = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        """The figure cached under ``key``, calling ``build()`` to make it on a miss."""
+        with self.lock:
+            fig = self._figures.get(key)
+            if fig is not None:
+                self._figures.move_to_end(key)
+                self.hits += 1
+                return fig
+            self.misses += 1
+        fig = build()
+        with self.lock:
+            self._figures[key] = fig
+            while len(self._figures) > self.max_entries:
+                self._figures.popitem(last=False)
+        return fig
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'entries': len(self._figures), 'hits': self.hits, 'misses': self.misses}
+
+
+_cache = FigureCache()
+register_cache('figures', _cache.stats)
+
+
+def cached_figure(key, build):
+    """Memoize ``build()`` under ``key``; ``key=None`` always builds (e.g. logged-out sessions)."""
+    return build() if key is None else _cache.get(key, build)
+
+
+def _grouped_bars(x, series, colors, barmode, x_title):
+    # the same figure px.bar(df, x=..., y=[...], barmode=...) used to produce
+    fig = go.Figure([go.Bar(x=x, y=y, name=name, marker_color=color) for (name, y), color in zip(series, colors)])
+    fig.update_layout(barmode=barmode, xaxis_title=x_title, yaxis_title='value', legend_title_text='variable', **_LAYOUT)
+    return fig
+
+
+def book_progress_figure(books, colors):
+    titles = [b['title'][:15] for b in books]
+    return _grouped_bars(titles, [('Read', [b.get('pages_read', 0) for b in books]),
+                                  ('Total', [b['pages'] for b in books])], colors, 'stack', 'Book')
+
+
+def goals_figure(progress, targets, colors):
+    return _grouped_bars(['Daily', 'Weekly', 'Monthly'], [('Progress', list(progress)), ('Target', list(targets))],
+                         colors, 'group', 'Goal')
+
+
+def history_start(today=None, days=HISTORY_DAYS) -> date:
+    return (today or date.today()) - timedelta(days=days - 1)
+
+
+def pages_per_day_figure(day_pages, color, today=None, days=HISTORY_DAYS):
+    """Pages read on each of the last ``days`` days, from {day bucket: pages} rollups."""
+    start = history_start(today, days)
+    x = [start + timedelta(days=i) for i in range(days)]
+    y = [day_pages.get(d.isoformat(), 0) for d in x]
+    fig = go.Figure(go.Bar(x=x, y=y, name='Pages', marker_color=color))
+    fig.update_layout(xaxis_title='Day', yaxis_title='Pages', **{**_LAYOUT, 'height': 300})
+    return fig
@@ -0,0 +1,125 @@
+"""Cold-start timing report for the Streamlit script.
+
+    python -m readvibe.coldstart [--runs 3] [--top 15] [--out report.json]
+
+Each run copies ``app.py``, this package, ``users.json`` and the uploaded
+books into an empty temporary directory. The copy has no ``users.db``,
+caches or page statistics, as on a fresh container. Each run then starts
+a new interpreter and renders the first screen with Streamlit's
+``AppTest``. It reports, in milliseconds:
+
+- ``interpreter``: Python start-up and exit, outside the timed phases.
+- ``streamlit``: ``import streamlit`` and the test harness.
+- ``first_run``: the script's first run, which is what a new container pays before the login screen shows. It covers the script's own imports, loading the shared resources and rendering.
+- ``second_run``: the next rerun, with everything already loaded.
+
+One more run under ``-X importtime`` lists the modules that the script's
+first run imported, with the slowest first.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+_MARK = '--- readvibe first run ---'
+_PROBE = f"""
+import json, sys, time
+t0 = time.perf_counter()
+import streamlit
+from streamlit.testing.v1 import AppTest
+t1 = time.perf_counter()
+at = AppTest.from_file('app.py', default_timeout=300)
+print({_MARK!r}, file=sys.stderr, flush=True)
+at.run()
+t2 = time.perf_counter()
+print({_MARK!r}, file=sys.stderr, flush=True)
+at.run()
+t3 = time.perf_counter()
+print(json.dumps({{'streamlit': t1 - t0, 'first_run': t2 - t1, 'second_run': t3 - t2,
+                  'exceptions': [str(e.value) for e in at.exception]}}))
+"""
+_SKIP = shutil.ignore_patterns('__pycache__', '_cache', '_bench', 'blobs', 'search.db*', '*.stats', 'users.db*', '*.journal')
+
+
+def fresh_copy(app_dir, dest):
+    """Copy what a new container starts with into ``dest``."""
+    shutil.copy2(os.path.join(app_dir, 'app.py'), dest)
+    shutil.copytree(os.path.join(app_dir, 'readvibe'), os.path.join(dest, 'readvibe'), ignore=_SKIP)
+    if os.path.exists(os.path.join(app_dir, 'users.json')):
+        shutil.copy2(os.path.join(app_dir, 'users.json'), dest)
+    if os.path.isdir(os.path.join(app_dir, 'data')):
+        shutil.copytree(os.path.join(app_dir, 'data'), os.path.join(dest, 'data'), ignore=_SKIP)
+
+
+def _probe(app_dir, importtime=False):
+    with tempfile.TemporaryDirectory(prefix='readvibe-coldstart-') as workdir:
+        fresh_copy(app_dir, workdir)
+        cmd = [sys.executable, *(['-X', 'importtime'] if importtime else []), '-c', _PROBE]
+        started = time.perf_counter()
+        proc = subprocess.run(cmd, cwd=workdir, capture_output=True, text=True,
+                              env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'})
+        wall = time.perf_counter() - started
+    if proc.returncode:
+        raise RuntimeError(f"probe failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['interpreter'] = wall - result['streamlit'] - result['first_run'] - result['second_run']
+    return result, proc.stderr
+
+
+def slowest_imports(stderr, top) -> list:
+    """(module, cumulative ms) for the top-level imports between the first-run marks, slowest first."""
+    section = stderr.split(_MARK)[1] if stderr.count(_MARK) >= 2 else ''
+    modules = []
+    for line in section.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # nesting is shown by indentation; keep the modules the script itself pulled in
+        if len(name) - len(name.lstrip()) <= 1:
+            modules.append((name.strip(), int(cumulative) / 1000))
+    return sorted(modules, key=lambda m: -m[1])[:top]
+
+
+def report(app_dir, runs=3, top=15) -> dict:
+    results = [_probe(app_dir)[0] for _ in range(runs)]
+    phases = ('interpreter', 'streamlit', 'first_run', 'second_run')
+    summary = {phase: statistics.median(r[phase] for r in results) * 1000 for phase in phases}
+    _, stderr = _probe(app_dir, importtime=True)
+    return {
+        'runs': runs,
+        'median_ms': summary,
+        'samples_ms': [{phase: r[phase] * 1000 for phase in phases} for r in results],
+        'exceptions': sorted({e for r in results for e in r['exceptions']}),
+        'slowest_imports_ms': slowest_imports(stderr, top),
+    }
+
+
+def main(argv=None):
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(prog='python -m readvibe.coldstart', description="Time the app's cold start.")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=15, help="how many of the slowest imports to list")
+    parser.add_argument('--out', help="also save the report as JSON")
+    args = parser.parse_args(argv)
+
+    result = report(app_dir, args.runs, args.top)
+    for phase, ms in result['median_ms'].items():
+        print(f"{phase:<12} {ms:>9.0f} ms")
+    print("\nslowest imports of the first run (cumulative):")
+    for name, ms in result['slowest_imports_ms']:
+        print(f"  {name:<40} {ms:>8.1f} ms")
+    for e in result['exceptions']:
+        print(f"\nexception: {e}")
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+    return 1 if result['exceptions'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
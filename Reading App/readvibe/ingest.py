@@ -0,0 +1,228 @@
+"""Background ingestion of uploaded PDFs.
+
+Adding a book used to block the script thread while the PDF was parsed, its
+cover rasterized and its pages indexed. Now the upload is only streamed into
+the blob store (:meth:`BlobStore.stage_stream`) and saved as a book with
+``status='processing'``; an :class:`IngestQueue` then fills in the page
+count, the cover, the page statistics, the full-text index and the first
+rendered pages, and marks the book ``'ready'``. A job that fails for any
+other reason than an unreadable file (a crashed worker, a store error) is
+tried ``INGEST_ATTEMPTS`` times; then its books are marked ``'failed'``,
+which can be deleted and are tried again after a restart.
+
+Jobs are keyed by blob digest, so a file uploaded by several users at once
+is analysed once. The stages run in the render farm's worker processes at
+indexing priority (see :mod:`readvibe.renderfarm`): PyMuPDF holds the GIL
+and its documents are not thread-safe, so threads would only ever analyse
+one PDF at a time. The job threads wait on the workers and write the
+results back through the shared user records.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .pagecache import PageImageCache
+from .pagestats import build_page_stats, sidecar_path
+from .pageview import render_view
+from .pdfdocs import open_pdf, remember_digest
+from .renderfarm import INDEXING, get_render_farm
+from .search import get_search_index, page_texts
+from .thumbnails import render_thumbnails, thumbnail_targets
+
+# jobs analysed at once; their stages share the render farm's worker processes
+INGEST_WORKERS = int(os.environ.get('READVIBE_INGEST_WORKERS', str(min(4, os.cpu_count() or 1))))
+# 0 runs the stages on the job threads instead of in the render farm
+INGEST_PROCESSES = os.environ.get('READVIBE_INGEST_PROCESSES', '1') != '0'
+INGEST_ATTEMPTS = int(os.environ.get('READVIBE_INGEST_ATTEMPTS', '3'))
+WARM_PAGES = 3
+
+STAGES = ('pages', 'cover', 'index', 'warmup')
+
+
+class InvalidPDF(ValueError):
+    pass
+
+
+# ---- stages; module-level so the worker processes can run them ----
+
+def count_pages(pdf_path) -> int:
+    try:
+        with open_pdf(pdf_path) as doc:
+            pages = len(doc)
+    except Exception as e:
+        raise InvalidPDF(str(e))
+    if not pages:
+        raise InvalidPDF("PDF has no pages")
+    return pages
+
+
+def index_pages(pdf_path, digest, search_path):
+    """Page statistics and the full-text index, from a single pass of text extraction."""
+    search = get_search_index(search_path)
+    need_stats = not os.path.exists(sidecar_path(pdf_path))
+    if not need_stats and search.has(digest):
+        return
+    texts = page_texts(pdf_path)
+    if need_stats:
+        build_page_stats(pdf_path, texts)
+    if not search.has(digest):
+        search.add(digest, texts)
+
+
+def warm_pages(pdf_path, digest, cache_root, pages):
+    """Render the Read view's first sight of ``pages`` into the on-disk page cache so the first read is instant."""
+    cache = PageImageCache(cache_root, max_bytes=0)  # disk tier only; memory belongs to the app process
+    remember_digest(pdf_path, digest)
+    for page_num in pages:
+        render_view(pdf_path, page_num, cache=cache)
+
+
+class IngestJob:
+    def __init__(self, digest, pdf_path):
+        self.digest = digest
+        self.pdf_path = pdf_path
+        self.books = []  # (username, book_id, title) waiting on this file
+        self.state = 'queued'  # queued | running | done | invalid | failed
+        self.stage = None
+        self.stages_done = 0
+        self.pages = None
+        self.error = None
+        self.attempts = 0
+
+    @property
+    def active(self) -> bool:
+        return self.state in ('queued', 'running')
+
+    @property
+    def progress(self) -> float:
+        return self.stages_done / len(STAGES)
+
+
+class IngestQueue:
+    def __init__(self, records, blobs, cache_root, search_path, workers=INGEST_WORKERS, processes=INGEST_PROCESSES, farm=None):
+        self.records = records
+        self.blobs = blobs
+        self.cache_root = cache_root
+        self.search_path = search_path
+        self.workers = max(1, workers)
+        self.processes = processes
+        self.lock = threading.Lock()
+        self.jobs = {}  # digest -> latest IngestJob
+        self._failures = {}  # username -> [title, ...] not yet shown
+        self._threads = ThreadPoolExecutor(self.workers, thread_name_prefix='ingest')
+        self.farm = farm
+
+    def submit(self, username, book) -> IngestJob:
+        """Queue ``book`` (as returned by ``add_book``) for analysis."""
+        digest = book['sha256']
+        with self.lock:
+            job = self.jobs.get(digest)
+            if job is None or not job.active:
+                job = self.jobs[digest] = IngestJob(digest, book['pdf_path'])
+                self._threads.submit(self._run, job)
+            job.books.append((username, book['id'], book.get('title')))
+            return job
+
+    def resume(self, username, books):
+        """Requeue books left processing by a finished or failed job, and after a restart also failed books."""
+        for book in books:
+            if book.get('status') in ('processing', 'failed') and book.get('sha256'):
+                job = self.job(book['sha256'])
+                # a failed book waits for a restart rather than retrying on every rerun
+                if job is None or (not job.active and book['status'] == 'processing'):
+                    if book['status'] == 'failed':
+                        self.records.handle(username).update_book(book['id'], status='processing')
+                    self.submit(username, book)
+
+    def job(self, digest):
+        with self.lock:
+            return self.jobs.get(digest)
+
+    def pop_failures(self, username) -> list:
+        """Titles of this user's uploads that turned out not to be readable PDFs."""
+        with self.lock:
+            return self._failures.pop(username, [])
+
+    def _call(self, fn, *args):
+        if not self.processes:
+            return fn(*args)
+        return (self.farm or get_render_farm()).call(INDEXING, fn, *args)
+
+    def _stage(self, job, name, fn, *args):
+        job.stage = name
+        try:
+            return self._call(fn, *args)
+        finally:
+            job.stages_done += 1
+
+    def _settle(self, job, state, apply):
+        """Call ``apply`` for every book on ``job``, including ones that join meanwhile, then finish it."""
+        settled = 0
+        while True:
+            with self.lock:
+                pending = job.books[settled:]
+                if not pending:
+                    job.state = state
+                    return
+            for entry in pending:
+                apply(*entry)
+            settled += len(pending)
+
+    def _run(self, job):
+        job.state = 'running'
+        job.attempts += 1
+        try:
+            job.pages = self._stage(job, 'pages', count_pages, job.pdf_path)
+            with self.lock:
+                waiting = list(job.books)
+            for username, book_id, _ in waiting:
+                self.records.handle(username).update_book(book_id, pages=job.pages)
+            covers = thumbnail_targets(self.blobs, job.digest)
+            # a missing cover or index is not fatal: the grid shows a placeholder, estimates re-read the text
+            for name, fn, args in (('cover', render_thumbnails, (job.pdf_path, covers)),
+                                   ('index', index_pages, (job.pdf_path, job.digest, self.search_path)),
+                                   ('warmup', warm_pages, (job.pdf_path, job.digest, self.cache_root, range(WARM_PAGES)))):
+                try:
+                    self._stage(job, name, fn, *args)
+                except Exception:
+                    pass
+        except InvalidPDF as e:
+            job.error = str(e)
+            self._settle(job, 'invalid', lambda *entry: self._reject(job, *entry))
+            return
+        except Exception as e:
+            job.error = str(e)
+            if job.attempts < INGEST_ATTEMPTS:
+                with self.lock:
+                    job.state, job.stage, job.stages_done = 'queued', None, 0
+                    self._threads.submit(self._run, job)
+            else:
+                self._settle(job, 'failed', self._fail)
+            return
+        self._settle(job, 'done', lambda username, book_id, title:
+                     self.records.handle(username).update_book(book_id, pages=job.pages, status='ready'))
+
+    def _fail(self, username, book_id, title):
+        try:
+            self.records.handle(username).update_book(book_id, status='failed')
+        except Exception:
+            pass  # still 'processing'; resume() requeues it since the job is no longer active
+
+    def _reject(self, job, username, book_id, title):
+        with self.blobs.lock:
+            if self.records.handle(username).delete_book(book_id) == 0:
+                self.blobs.remove(job.digest)
+        with self.lock:
+            self._failures.setdefault(username, []).append(title)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_ingest_queue(records, blobs, cache_root, search_path) -> IngestQueue:
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = IngestQueue(records, blobs, cache_root, search_path)
+        return _queue
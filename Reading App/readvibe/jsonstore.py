@@ -0,0 +1,463 @@
+"""``users.json`` persistence with a write-ahead journal.
+
+Drop-in alternative to :class:`readvibe.store.SQLiteUserStore` for
+deployments that want to keep the plain JSON file. Every change is appended
+to ``users.json.journal`` as one small JSON record and fsync'ed before it is
+applied in memory, so a write costs O(change) and survives a crash. Every
+``COMPACT_EVERY`` records the full state is written to a temporary file,
+fsync'ed and renamed over ``users.json``; then the journal is truncated.
+
+Records carry a sequence number and the snapshot remembers the last one it
+contains, so a crash between the rename and the truncate never applies a
+record twice. A torn final journal line (crash mid-append) is ignored.
+
+A change is first applied to copies of the records it touches; only if that
+succeeds is it journaled and the copies swapped in. A change that fails
+(e.g. a session logged for an unknown user) raises without writing anything,
+so it neither reaches the journal nor uses up a sequence number. Should a
+journal record still fail on replay, it is moved to
+``users.json.journal.rejected`` and the load goes on without it.
+
+Reading sessions also go to ``users.json.sessions``, one line per record
+that logs them, tagged with its sequence number. Compaction truncates the
+journal but never this file, so it stays the full session log that
+:meth:`JournaledJsonStore.rebuild_rollups` recomputes the rollups from. Its
+lines are written after the journal record; compaction fsyncs the file
+before it empties the journal, and a load appends the sessions of replayed
+records it does not have yet (e.g. after a crash in between).
+"""
+import copy
+import json
+import os
+import threading
+import time
+
+from .metrics import error
+from .rollups import PERIODS, aggregate, bucket_keys, empty_rollup
+from .store import BOOK_FIELDS, ImportConflict, empty_stats
+
+COMPACT_EVERY = int(os.environ.get('READVIBE_JOURNAL_COMPACT_EVERY', '500'))
+
+
+def atomic_write_json(path, obj):
+    """Replace ``path`` with ``obj`` as JSON via temp file + fsync + rename."""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    try:
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return  # e.g. Windows, where directories cannot be opened
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class JournaledJsonStore:
+    def __init__(self, path):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.rejected_path = self.journal_path + '.rejected'
+        self.sessions_path = path + '.sessions'
+        self.lock = threading.RLock()
+        self._users = {}
+        self._seq = 0
+        self._pending = 0
+        self._unlogged = []  # committed session records not yet in the session log
+        self._load()
+
+    # ---- journal ----
+    def _load(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._users = json.load(f)
+        meta = self._users.setdefault('_meta', {})
+        self._seq = meta.get('seq', 0)
+        torn = rejected = False
+        replayed = []
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        torn = True  # crash mid-append; later appends must not land after it
+                        break
+                    if record.get('seq', 0) > self._seq:
+                        staged = self._stage(record)
+                        try:
+                            self._apply(record, staged)
+                        except Exception:
+                            # keep the record for inspection, but never let it block the load
+                            error('journal.rejected')
+                            with open(self.rejected_path, 'a', encoding='utf-8') as r:
+                                r.write(line if line.endswith('\n') else line + '\n')
+                            rejected = True
+                        else:
+                            self._users.update(staged)
+                            replayed.append(record)
+                        self._seq = record['seq']
+                        self._pending += 1
+        logged = self._logged_seq()
+        self._log_sessions([r for r in replayed if r['seq'] > logged])
+        if self._assign_book_ids() or torn or rejected or self._pending >= COMPACT_EVERY:
+            self.compact()
+
+    def _assign_book_ids(self) -> bool:
+        # legacy books have no id; give them one and persist it straight away
+        meta = self._users['_meta']
+        changed = False
+        for uname, rec in self._users.items():
+            if uname.startswith('_'):
+                continue
+            for b in rec.setdefault('data', {}).setdefault('books', []):
+                if 'id' not in b:
+                    meta['next_book_id'] = meta.get('next_book_id', 1) + 1
+                    b['id'] = meta['next_book_id'] - 1
+                    changed = True
+        return changed
+
+    def _stage(self, record) -> dict:
+        # copies of the top-level entries ``record`` changes; _apply works on these, not on the live state
+        names = {record['user']} if 'user' in record else {s[0] for s in record.get('sessions', ())}
+        return {k: copy.deepcopy(self._users[k]) for k in names | {'_meta'} if k in self._users}
+
+    def _commit(self, op, **fields):
+        with self.lock:
+            record = {'seq': self._seq + 1, 'op': op, **fields}
+            staged = self._stage(record)
+            result = self._apply(record, staged)  # raises before anything is written
+            line = json.dumps(record, ensure_ascii=False) + '\n'
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                end = f.tell()
+                try:
+                    f.write(line)
+                    f.flush()
+                    os.fsync(f.fileno())
+                except BaseException:
+                    f.truncate(end)  # no half-written record for the next append to land after
+                    raise
+            self._users.update(staged)
+            self._seq = record['seq']
+            self._pending += 1
+            self._log_sessions([record])
+            if self._pending >= COMPACT_EVERY:
+                self.compact()
+            return result
+
+    def compact(self):
+        """Write a snapshot containing every applied record and empty the journal."""
+        with self.lock:
+            if not self._log_sessions([]):
+                return  # the journal still holds sessions the session log is missing
+            if os.path.exists(self.sessions_path):
+                with open(self.sessions_path, 'a', encoding='utf-8') as f:
+                    os.fsync(f.fileno())
+            self._users['_meta']['seq'] = self._seq
+            atomic_write_json(self.path, self._users)
+            with open(self.journal_path, 'w', encoding='utf-8') as f:
+                f.flush()
+                os.fsync(f.fileno())
+            self._pending = 0
+
+    # ---- session log ----
+    @staticmethod
+    def _record_sessions(record):
+        # (username, book_id, start_page, end_page, minutes, points, logged_at) lists of a journal record
+        if record['op'] == 'log_session':
+            return [[record['user'], record['book_id'], record['start_page'], record['end_page'],
+                     record['minutes'], record['points'], record['logged_at']]]
+        if record['op'] == 'log_sessions':
+            return record['sessions']
+        return []
+
+    def _log_sessions(self, records) -> bool:
+        """Append the sessions of ``records``, and of any earlier ones that could not be written; True once none are left."""
+        self._unlogged.extend(r for r in records if self._record_sessions(r))
+        if not self._unlogged:
+            return True
+        text = ''.join(json.dumps({'seq': r['seq'], 'sessions': self._record_sessions(r)}, ensure_ascii=False) + '\n'
+                       for r in self._unlogged)
+        try:
+            with open(self.sessions_path, 'a', encoding='utf-8') as f:
+                end = f.tell()
+                try:
+                    f.write(text)
+                    f.flush()
+                except BaseException:
+                    f.truncate(end)
+                    raise
+        except OSError:
+            # the change itself is journaled; the next commit or compaction tries again
+            error('sessions.log')
+            return False
+        self._unlogged = []
+        return True
+
+    def _logged_seq(self) -> int:
+        """Sequence number of the last record in the session log; a torn last line is cut off."""
+        try:
+            f = open(self.sessions_path, 'rb+')
+        except FileNotFoundError:
+            return 0
+        with f:
+            pos = f.seek(0, os.SEEK_END)
+            tail = b''
+            while pos > 0 and tail.count(b'\n') < 2:
+                step = min(pos, 64 * 1024)
+                pos -= step
+                f.seek(pos)
+                tail = f.read(step) + tail
+            if not tail.endswith(b'\n'):
+                cut = tail.rfind(b'\n') + 1  # crash mid-append
+                f.truncate(pos + cut)
+                tail = tail[:cut]
+            lines = tail.splitlines()
+            return json.loads(lines[-1])['seq'] if lines else 0
+
+    def _apply(self, record, users):
+        # ``users`` holds (copies of) the entries ``record`` changes; see _stage
+        op = record['op']
+        meta = users['_meta']
+        if op == 'set_meta':
+            if record['key'] == '_last_user':
+                users['_last_user'] = record['value']
+            else:
+                meta[record['key']] = record['value']
+        elif op == 'create_user':
+            users[record['user']] = {'password': record['password'], 'data': record['data']}
+        elif op == 'update_settings':
+            users[record['user']]['data'].update(record['fields'])
+        elif op == 'add_book':
+            meta['next_book_id'] = max(meta.get('next_book_id', 1), record['book']['id'] + 1)
+            users[record['user']]['data']['books'].append(record['book'])
+            self._ref_blob(meta, record['book'].get('sha256'), 1)
+            self._bump(users[record['user']]['data'])
+        elif op == 'update_book':
+            for b in users[record['user']]['data']['books']:
+                if b.get('id') == record['id']:
+                    if 'sha256' in record['fields'] and record['fields']['sha256'] != b.get('sha256'):
+                        self._ref_blob(meta, b.get('sha256'), -1)
+                        self._ref_blob(meta, record['fields']['sha256'], 1)
+                    b.update(record['fields'])
+            self._bump(users[record['user']]['data'])
+        elif op == 'delete_book':
+            data = users[record['user']]['data']
+            removed = [b for b in data['books'] if b.get('id') == record['id']]
+            data['books'] = [b for b in data['books'] if b.get('id') != record['id']]
+            self._bump(data)
+            return self._ref_blob(meta, removed[0].get('sha256'), -1) if removed else None
+        elif op == 'log_session':
+            self._apply_session(users[record['user']]['data'], record['book_id'], record['start_page'],
+                                record['end_page'], record['minutes'], record['points'], record['logged_at'])
+        elif op == 'log_sessions':
+            for username, book_id, start_page, end_page, minutes, points, logged_at in record['sessions']:
+                self._apply_session(users[username]['data'], book_id, start_page, end_page, minutes, points, logged_at)
+        elif op == 'import':
+            for uname, rec in record['users'].items():
+                users[uname] = rec
+
+    def _apply_session(self, data, book_id, start_page, end_page, minutes, points, logged_at):
+        pages = end_page - start_page
+        for b in data['books']:
+            if b.get('id') == book_id:
+                b['current_page'] = end_page
+                b['pages_read'] = b.get('pages_read', 0) + pages
+        self._bump(data)
+        stats = data.setdefault('stats', empty_stats())
+        for k, v in (('total_pages', pages), ('total_time', minutes), ('points', points),
+                     ('weekly_pages', pages), ('monthly_pages', pages)):
+            stats[k] = stats.get(k, 0) + v
+        # {period: {bucket: rollup}}; the sessions themselves go to the session log
+        rollups = data.setdefault('rollups', {})
+        for period, bucket in bucket_keys(logged_at).items():
+            r = rollups.setdefault(period, {}).setdefault(bucket, empty_rollup())
+            r['pages'] += pages
+            r['minutes'] += minutes
+            r['points'] += points
+            r['sessions'] += 1
+
+    @staticmethod
+    def _bump(data):
+        # the user's books or reading totals changed; lets derived views (charts) know they are stale
+        data['version'] = data.get('version', 0) + 1
+
+    @staticmethod
+    def _ref_blob(meta, digest, delta):
+        if not digest:
+            return None
+        refs = meta.setdefault('blob_refs', {})
+        refs[digest] = refs.get(digest, 0) + delta
+        if refs[digest] <= 0:
+            del refs[digest]
+            return 0
+        return refs[digest]
+
+    # ---- meta ----
+    def get_meta(self, key, default=None):
+        with self.lock:
+            if key == '_last_user':
+                return self._users.get('_last_user', default)
+            return copy.deepcopy(self._users['_meta'].get(key, default))
+
+    def set_meta(self, key, value):
+        self._commit('set_meta', key=key, value=value)
+
+    # ---- users ----
+    def get_user(self, username):
+        with self.lock:
+            rec = self._users.get(username) if not username.startswith('_') else None
+            return copy.deepcopy(rec) if rec is not None else None
+
+    def has_user(self, username) -> bool:
+        with self.lock:
+            return not username.startswith('_') and username in self._users
+
+    def create_user(self, username, password_hash, data=None):
+        data = copy.deepcopy(dict(data or {}))
+        data['stats'] = {**empty_stats(), **(data.get('stats') or {})}
+        with self.lock:
+            if self.has_user(username):
+                return False
+            books = data.pop('books', None) or []
+            data['books'] = []
+            self._commit('create_user', user=username, password=password_hash, data=data)
+            for b in books:
+                self.add_book(username, b)
+        return True
+
+    def update_settings(self, username, **fields):
+        with self.lock:
+            if self.has_user(username):
+                self._commit('update_settings', user=username, fields=fields)
+
+    def load_all(self) -> dict:
+        with self.lock:
+            users = {k: copy.deepcopy(v) for k, v in self._users.items() if not k.startswith('_')}
+            users['_last_user'] = self._users.get('_last_user')
+            return users
+
+    def leaderboard_rows(self):
+        """(username, points, total_pages) for every user."""
+        with self.lock:
+            return [(u, rec.get('data', {}).get('stats', {}).get('points', 0), rec.get('data', {}).get('stats', {}).get('total_pages', 0))
+                    for u, rec in self._users.items() if not u.startswith('_') and isinstance(rec, dict)]
+
+    # ---- books ----
+    def get_books(self, username) -> list:
+        rec = self.get_user(username)
+        return rec['data'].get('books', []) if rec else []
+
+    def add_book(self, username, book) -> dict:
+        with self.lock:
+            book = {k: book.get(k) for k in BOOK_FIELDS}
+            book['current_page'] = book['current_page'] or 0
+            book['pages_read'] = book['pages_read'] or 0
+            book['id'] = self._users['_meta'].get('next_book_id', 1)
+            self._commit('add_book', user=username, book=book)
+            return dict(book)
+
+    def update_book(self, username, book_id, **fields):
+        fields = {k: v for k, v in fields.items() if k in BOOK_FIELDS}
+        with self.lock:
+            if fields and self.has_user(username):
+                self._commit('update_book', user=username, id=book_id, fields=fields)
+
+    def delete_book(self, username, book_id):
+        """Delete a book; returns how many books still reference its PDF blob (None for legacy books)."""
+        with self.lock:
+            return self._commit('delete_book', user=username, id=book_id) if self.has_user(username) else None
+
+    def blob_refs(self, digest) -> int:
+        with self.lock:
+            return self._users['_meta'].get('blob_refs', {}).get(digest, 0)
+
+    def iter_books(self, after_id=0):
+        """Yield (username, book) for every book with ``id > after_id``, in id order."""
+        with self.lock:
+            books = [(u, dict(b)) for u, rec in self._users.items() if not u.startswith('_')
+                     for b in rec.get('data', {}).get('books', []) if b.get('id', 0) > after_id]
+        yield from sorted(books, key=lambda ub: ub[1]['id'])
+
+    # ---- reading sessions ----
+    def log_session(self, username, book_id, start_page, end_page, minutes, points, logged_at=None):
+        self._commit('log_session', user=username, book_id=book_id, start_page=start_page, end_page=end_page,
+                     minutes=minutes, points=points, logged_at=logged_at or time.time())
+
+    def log_sessions(self, sessions) -> int:
+        """Record many sessions, given as (username, book_id, start_page, end_page, minutes, points, logged_at)
+        tuples, as one journal record: they are applied all together or not at all.
+
+        Sessions are applied in ``logged_at`` order, so a book ends up on the end page of its latest one.
+        """
+        sessions = sorted((list(s) for s in sessions), key=lambda s: s[6])
+        if sessions:
+            self._commit('log_sessions', sessions=sessions)
+        return len(sessions)
+
+    def get_rollups(self, username, ts=None) -> dict:
+        """{period: {pages, minutes, points, sessions}} for the day, week and month containing ``ts``."""
+        keys = bucket_keys(ts)
+        with self.lock:
+            rollups = self._users.get(username, {}).get('data', {}).get('rollups', {})
+            return {period: dict(rollups.get(period, {}).get(keys[period]) or empty_rollup()) for period in PERIODS}
+
+    def day_series(self, username, since) -> dict:
+        """{day bucket: pages} for the days from ``since`` (a day bucket, e.g. '2025-01-31') on."""
+        with self.lock:
+            days = self._users.get(username, {}).get('data', {}).get('rollups', {}).get('day', {})
+            return {bucket: r['pages'] for bucket, r in sorted(days.items()) if bucket >= since}
+
+    def rebuild_rollups(self) -> int:
+        """Recompute every rollup bucket from the session log; returns the number of buckets.
+
+        Sessions logged by releases older than the session log are not in it.
+        """
+        with self.lock:
+            self._log_sessions([])
+            events = []
+            if os.path.exists(self.sessions_path):
+                with open(self.sessions_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            sessions = json.loads(line)['sessions']
+                        except ValueError:
+                            break  # torn last line
+                        events.extend((u, at, end - start, minutes, points)
+                                      for u, _, start, end, minutes, points, at in sessions)
+            users = {u: rec['data'] for u, rec in self._users.items() if not u.startswith('_') and isinstance(rec, dict)}
+            rollups = {u: {} for u in users}
+            buckets = aggregate(events)
+            for (username, period, bucket), r in buckets.items():
+                if username in rollups:
+                    rollups[username].setdefault(period, {})[bucket] = r
+            for username, data in users.items():
+                data['rollups'] = rollups[username]
+                self._bump(data)
+            self.compact()
+            return len(buckets)
+
+    # ---- legacy import ----
+    def import_legacy(self, users: dict) -> int:
+        """Adopt the (migrated) records of a ``users.json`` dict that this store does not have yet.
+
+        This store's snapshot is usually that very file, so its accounts are already here and are left
+        as they are, not overwritten with the file's older copy. As for
+        :meth:`SQLiteUserStore.import_legacy`, a username taken with another password raises
+        :class:`ImportConflict`.
+        """
+        records = {k: v for k, v in users.items() if not k.startswith('_') and isinstance(v, dict)}
+        with self.lock:
+            for uname, rec in records.items():
+                if uname in self._users and self._users[uname].get('password') != rec.get('password'):
+                    raise ImportConflict(f"username {uname!r} is taken by a different account")
+            new = {u: rec for u, rec in records.items() if u not in self._users}
+            if new:
+                self._commit('import', users=new)
+                if self._assign_book_ids():
+                    self.compact()
+        return len(new)
@@ -0,0 +1,139 @@
+"""Points and pages rankings over all users, and the reward tiers.
+
+The leaderboard is built once per process from the store, with one row per
+user. After that it is kept current from the shared user records: every
+write that changes a user's totals, such as a logged session, moves that
+user in two sorted arrays, one by points and one by pages. Top-N is a
+slice. A user's rank and the number of users in each tier are binary
+searches. Nothing rescans the user table.
+
+Tiers are data. Each tier is a name, a minimum points value and a reward,
+and a tier lasts until the next one starts. Set ``READVIBE_TIERS`` to a
+JSON file with the same shape to change them.
+"""
+import json
+import os
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+DEFAULT_TIERS = [
+    {'name': 'Bronze', 'min': 0, 'reward': 'Avatar Pack'},
+    {'name': 'Silver', 'min': 201, 'reward': 'Theme + Avatar'},
+    {'name': 'Gold', 'min': 501, 'reward': '$2.50 Card'},
+    {'name': 'Platinum', 'min': 1001, 'reward': '$5 Card'},
+]
+
+
+def load_tiers(path=None) -> list:
+    """Tiers sorted by ``min``, each with a display ``range`` ('201-500', '1001+')."""
+    path = path or os.environ.get('READVIBE_TIERS')
+    tiers = DEFAULT_TIERS
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            tiers = json.load(f)
+    tiers = sorted((dict(t) for t in tiers), key=lambda t: t['min'])
+    for tier, nxt in zip(tiers, tiers[1:] + [None]):
+        tier['range'] = f"{tier['min']}-{nxt['min'] - 1}" if nxt else f"{tier['min']}+"
+    return tiers
+
+
+TIERS = load_tiers()
+
+
+def tier_for(points, tiers=TIERS):
+    """The tier ``points`` fall into (the lowest one for anything below it)."""
+    i = bisect_right([t['min'] for t in tiers], points) - 1
+    return tiers[max(i, 0)]
+
+
+class Leaderboard:
+    def __init__(self, tiers=TIERS):
+        self.tiers = tiers
+        self.lock = threading.Lock()
+        self._totals = {}  # username -> (points, pages)
+        # (-value, username): best first, ties by name
+        self._by = {'points': [], 'pages': []}
+
+    def load(self, rows):
+        """Fill the board from (username, points, pages) rows; users updated meanwhile keep their newer totals."""
+        totals = {u: (int(p or 0), int(n or 0)) for u, p, n in rows}
+        with self.lock:
+            totals.update(self._totals)
+            self._totals = totals
+            self._by['points'] = sorted((-p, u) for u, (p, _) in self._totals.items())
+            self._by['pages'] = sorted((-n, u) for u, (_, n) in self._totals.items())
+
+    def update(self, username, points, pages):
+        """Set one user's totals, moving them within the rankings."""
+        points, pages = int(points or 0), int(pages or 0)
+        with self.lock:
+            old = self._totals.get(username)
+            if old == (points, pages):
+                return
+            if old is not None:
+                for key, value in zip(('points', 'pages'), old):
+                    arr = self._by[key]
+                    del arr[bisect_left(arr, (-value, username))]
+            self._totals[username] = (points, pages)
+            insort(self._by['points'], (-points, username))
+            insort(self._by['pages'], (-pages, username))
+
+    def __len__(self):
+        return len(self._totals)
+
+    def top(self, n=10, by='points') -> list:
+        """[(rank, username, value), ...] for the best ``n`` users; equal values share a rank."""
+        with self.lock:
+            arr = self._by[by]
+            return [(bisect_left(arr, (neg,)) + 1, u, -neg) for neg, u in arr[:n]]
+
+    def rank(self, username, by='points'):
+        """1-based rank of ``username`` (None if unknown); ties share the best rank."""
+        with self.lock:
+            totals = self._totals.get(username)
+            if totals is None:
+                return None
+            value = totals[0 if by == 'points' else 1]
+            return bisect_left(self._by[by], (-value,)) + 1
+
+    def totals(self, username):
+        with self.lock:
+            return self._totals.get(username)
+
+    def tier_counts(self) -> dict:
+        """{tier name: number of users whose points fall in that tier}."""
+        with self.lock:
+            arr = self._by['points']
+            # users with at least ``min`` points: every key below (-min + 1,)
+            at_least = [bisect_left(arr, (-t['min'] + 1,)) for t in self.tiers]
+            total = len(arr)
+        counts = {}
+        for i, tier in enumerate(self.tiers):
+            above = at_least[i + 1] if i + 1 < len(self.tiers) else 0
+            counts[tier['name']] = at_least[i] - above
+        # anyone below the first tier's minimum is counted in it
+        counts[self.tiers[0]['name']] += total - at_least[0]
+        return counts
+
+    def on_record(self, username, record):
+        """:class:`readvibe.records.UserRecords` listener; keeps the board in step with every write."""
+        if record is not None:
+            stats = record.get('data', {}).get('stats', {})
+            self.update(username, stats.get('points', 0), stats.get('total_pages', 0))
+
+
+_board = None
+_board_lock = threading.Lock()
+
+
+def get_leaderboard(store, records) -> Leaderboard:
+    """The process-wide leaderboard, loaded from ``store`` on first use."""
+    global _board
+    with _board_lock:
+        if _board is None:
+            board = Leaderboard()
+            # listen first, so a write racing the load is not lost; load() keeps its newer totals
+            records.listeners.append(board.on_record)
+            board.load(store.leaderboard_rows())
+            _board = board
+        return _board
@@ -0,0 +1,72 @@
+"""Sorted, filtered and paginated views of a user's books for the Library grid.
+
+The grid used to build a card, a cover image and three buttons for every
+book on every rerun. It now shows one page of cards at a time. Each book
+list gets a :class:`LibraryIndex` holding its sort orders (title, author,
+progress) and lower-cased search text. A rerun only scans that text and
+slices out one page, so rendering cost does not grow with the library.
+
+Records are never mutated in place (see :mod:`readvibe.records`), so a
+changed library is a new list and indexes are cached by list identity.
+"""
+import threading
+from collections import OrderedDict
+
+PAGE_SIZE = 12
+MAX_CACHED_INDEXES = 256
+
+
+def _progress(book) -> float:
+    pages = book.get('pages') or 0
+    return (book.get('current_page') or 0) / pages if pages else 0.0
+
+
+SORT_KEYS = {
+    'title': lambda b: (b.get('title') or '').casefold(),
+    'author': lambda b: (b.get('author') or '').casefold(),
+    'progress': _progress,
+}
+
+
+class LibraryIndex:
+    def __init__(self, books):
+        self.books = books
+        self._text = [f"{b.get('title') or ''}\n{b.get('author') or ''}".casefold() for b in books]
+        # positions into ``books``, one ordering per sort key; ties keep upload order
+        self._orders = {name: sorted(range(len(books)), key=lambda i, k=key: k(books[i])) for name, key in SORT_KEYS.items()}
+
+    def query(self, text='', sort='title', descending=False) -> list:
+        """Positions of the books matching ``text`` (title or author), in ``sort`` order."""
+        order = self._orders[sort]
+        if descending:
+            order = order[::-1]
+        needle = text.strip().casefold()
+        if not needle:
+            return order
+        return [i for i in order if needle in self._text[i]]
+
+    @staticmethod
+    def page(positions, page, per_page=PAGE_SIZE):
+        """Clamp ``page`` to the available pages; returns (page, page_count, positions on it)."""
+        page_count = max(1, -(-len(positions) // per_page))
+        page = min(max(page, 0), page_count - 1)
+        return page, page_count, positions[page * per_page:(page + 1) * per_page]
+
+
+_indexes = OrderedDict()  # id(books) -> LibraryIndex
+_indexes_lock = threading.Lock()
+
+
+def library_index(books) -> LibraryIndex:
+    """The index of ``books``, built on first use of that list."""
+    with _indexes_lock:
+        index = _indexes.get(id(books))
+        if index is not None and index.books is books:
+            _indexes.move_to_end(id(books))
+            return index
+    index = LibraryIndex(books)
+    with _indexes_lock:
+        _indexes[id(books)] = index
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            _indexes.popitem(last=False)
+    return index
@@ -0,0 +1,216 @@
+"""Latency histograms, error counts and cache hit ratios of the hot paths.
+
+Instrumented code wraps an operation in ``with timed('pdf.render'):``.
+An exception leaving the block counts as an error of that operation, even
+if a helper further up swallows it and returns None. Failures outside any
+timed block are counted with ``error(op)``. A recording is one
+``perf_counter`` pair, one bisect and a short lock. Caches are not touched
+on their hot path: each registers a ``stats()`` function with
+:func:`register_cache`, and hits and misses are read when a snapshot is
+taken.
+
+Operations::
+
+    pdf.open       fitz.open of a file (document pool miss) or of uploaded bytes
+    pdf.render     page rasterization and encoding (a whole page, or one tile of a zoomed view)
+    pdf.text       text extraction (read-time estimates, page statistics, search)
+    users.load     loading a user record or users.json
+    users.save     writing a user change or users.json
+    page.<name>    one script run of a top-level page (home, read, library, ...)
+    farm.<prio>    a render farm job (visible, prefetch, indexing) from submission to result;
+                   prefetch jobs refused by a full queue count as errors
+    farm.<prio>.wait
+                   the part of it the job spent queued
+
+Metrics are per process. Renders and ingestion stages run in the render
+farm's worker processes (see :mod:`readvibe.renderfarm`), so their own
+``pdf.*`` time is not included; the ``farm.*`` operations time them from
+the app's side. The Settings page shows a snapshot to admins, and
+:meth:`Metrics.prometheus` and :meth:`Metrics.jsonl` export one for
+dashboards. Set ``READVIBE_METRICS=0`` to turn recording off.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+ENABLED = os.environ.get('READVIBE_METRICS', '1') != '0'
+# upper bounds in seconds; a last, unbounded bucket catches the rest
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Estimated ``q`` quantile in seconds, interpolated within its bucket (None if empty)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = self.buckets[i - 1] if i else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(low + (high - low) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+
+class Timer:
+    """Times one operation: use as a context manager, or call :meth:`stop` when it is done."""
+
+    __slots__ = ('metrics', 'op', 'started')
+
+    def __init__(self, metrics, op):
+        self.metrics = metrics
+        self.op = op
+        self.started = time.perf_counter()
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop(error=exc_type is not None)
+        return False
+
+    def stop(self, error=False):
+        self.metrics.observe(self.op, time.perf_counter() - self.started, error)
+
+
+class Metrics:
+    def __init__(self, enabled=ENABLED):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.since = time.time()
+        self._ops = {}  # op -> Histogram
+        self._caches = {}  # name -> stats(), returning at least 'hits' and 'misses'
+
+    def _histogram(self, op):
+        # caller holds self.lock
+        h = self._ops.get(op)
+        if h is None:
+            h = self._ops[op] = Histogram()
+        return h
+
+    def observe(self, op, seconds, error=False):
+        if not self.enabled:
+            return
+        with self.lock:
+            h = self._histogram(op)
+            h.observe(seconds)
+            if error:
+                h.errors += 1
+
+    def error(self, op):
+        """Count a failure of ``op`` that was handled without re-raising."""
+        if self.enabled:
+            with self.lock:
+                self._histogram(op).errors += 1
+
+    def timed(self, op) -> Timer:
+        return Timer(self, op)
+
+    def register_cache(self, name, stats):
+        with self.lock:
+            self._caches[name] = stats
+
+    def reset(self):
+        with self.lock:
+            self._ops = {}
+            self.since = time.time()
+
+    # ---- snapshots ----
+    def operations(self) -> list:
+        """One dict per operation: count, errors, total and mean seconds, p50/p95/p99 and max in ms."""
+        rows = []
+        with self.lock:
+            for op, h in sorted(self._ops.items()):
+                row = {'op': op, 'count': h.count, 'errors': h.errors, 'total_s': h.sum,
+                       'mean_ms': h.sum / h.count * 1000 if h.count else None}
+                for q in QUANTILES:
+                    value = h.quantile(q)
+                    row[f"p{round(q * 100)}_ms"] = value * 1000 if value is not None else None
+                row['max_ms'] = h.max * 1000
+                row['buckets'] = dict(zip([*map(str, h.buckets), '+Inf'], h.counts))
+                rows.append(row)
+        return rows
+
+    def caches(self) -> list:
+        with self.lock:
+            caches = sorted(self._caches.items())
+        rows = []
+        for name, stats in caches:
+            try:
+                s = stats()
+            except Exception:
+                continue
+            lookups = s['hits'] + s['misses']
+            rows.append({'cache': name, 'hits': s['hits'], 'misses': s['misses'],
+                         'hit_ratio': s['hits'] / lookups if lookups else None})
+        return rows
+
+    def prometheus(self) -> str:
+        """The snapshot in the Prometheus text exposition format."""
+        lines = ['# HELP readvibe_operation_seconds Latency of instrumented operations.',
+                 '# TYPE readvibe_operation_seconds histogram']
+        ops = self.operations()
+        for row in ops:
+            cumulative = 0
+            for bound, n in row['buckets'].items():
+                cumulative += n
+                lines.append(f'readvibe_operation_seconds_bucket{{op="{row["op"]}",le="{bound}"}} {cumulative}')
+            lines.append(f'readvibe_operation_seconds_sum{{op="{row["op"]}"}} {row["total_s"]:.6f}')
+            lines.append(f'readvibe_operation_seconds_count{{op="{row["op"]}"}} {row["count"]}')
+        lines += ['# HELP readvibe_operation_errors_total Failed operations, including ones handled by a fallback.',
+                  '# TYPE readvibe_operation_errors_total counter']
+        lines += [f'readvibe_operation_errors_total{{op="{row["op"]}"}} {row["errors"]}' for row in ops]
+        caches = self.caches()
+        for metric, kind, key in (('hits_total', 'counter', 'hits'), ('misses_total', 'counter', 'misses'),
+                                  ('hit_ratio', 'gauge', 'hit_ratio')):
+            lines.append(f'# TYPE readvibe_cache_{metric} {kind}')
+            lines += [f'readvibe_cache_{metric}{{cache="{row["cache"]}"}} {row[key] if row[key] is not None else "NaN"}'
+                      for row in caches]
+        return '\n'.join(lines) + '\n'
+
+    def jsonl(self) -> str:
+        """The snapshot as JSON Lines: one object per operation and per cache, all stamped with the same time."""
+        now = time.time()
+        records = [{'ts': now, 'since': self.since, 'kind': 'operation', **row} for row in self.operations()]
+        records += [{'ts': now, 'since': self.since, 'kind': 'cache', **row} for row in self.caches()]
+        return ''.join(json.dumps(r) + '\n' for r in records)
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """The process-wide registry."""
+    return _metrics
+
+
+def timed(op) -> Timer:
+    return _metrics.timed(op)
+
+
+def error(op):
+    _metrics.error(op)
+
+
+def register_cache(name, stats):
+    _metrics.register_cache(name, stats)
@@ -0,0 +1,304 @@
+"""Versioned, resumable data migrations.
+
+The store records the schema version it has been migrated to (meta key
+``schema_version``). At process start the app calls
+``get_migration_runner(...).start()``, which only compares that number with
+the newest migration and, if behind, runs the missing migrations once. The
+ones up to ``ACCOUNTS_VERSION`` run there and then: until the accounts of
+``users.json`` are in the store, a login would be refused and a sign-up
+could take a legacy username. The rest run on a background thread. Long
+migrations save a checkpoint (meta key ``migration_checkpoint``) as they go
+and pick up from it after a restart, so normal session startup never scans
+user data or the filesystem.
+"""
+import json
+import os
+import threading
+import time
+
+from .blobs import link_or_copy
+from .pagestats import build_page_stats, sidecar_path
+from .pdfdocs import document_digest, get_document_pool, open_pdf
+from .search import page_texts
+
+CHECKPOINT_EVERY = 100
+# migrations up to this version are needed before logins and sign-ups can be served
+ACCOUNTS_VERSION = 1
+
+MIGRATIONS = []  # (version, description, fn), in version order
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def _safe_title(b):
+    return ''.join(c for c in (b.get('title') or 'book') if c.isalnum() or c in (' ', '-', '_')).replace(' ', '_')[:120]
+
+
+def render_cover_png(pdf_path, cover_path):
+    import fitz
+
+    with open_pdf(pdf_path) as doc:
+        doc[0].get_pixmap(matrix=fitz.Matrix(2, 2)).save(cover_path)  # 2x zoom for better quality
+
+
+def migrate_user_books(uname, urec, data_dir) -> bool:
+    """Move in-memory PDFs or PIL covers of one user's books into on-disk files.
+
+    Updates ``urec`` in place and returns True if anything changed.
+    """
+    data = urec.get('data', {}) if isinstance(urec, dict) else {}
+    books = data.get('books', [])
+    if not books:
+        return False
+    # ensure user dir
+    user_folder_name = ''.join(c for c in uname if c.isalnum() or c in ('-', '_'))
+    user_dir = os.path.join(data_dir, user_folder_name)
+    os.makedirs(user_dir, exist_ok=True)
+
+    changed = False
+    new_books = []
+    seen_paths = set()
+    for b in books:
+        # if already stored as paths, keep
+        if b.get('pdf_path') and isinstance(b.get('pdf_path'), str) and os.path.exists(b.get('pdf_path')):
+            new_books.append(b)
+            continue
+
+        # migrate pdf bytes if present
+        pdf_path = b.get('pdf_path')
+        if not pdf_path and b.get('pdf_file'):
+            try:
+                pdf_path = os.path.join(user_dir, f"{_safe_title(b)}_{int(time.time())}.pdf")
+                with open(pdf_path, 'wb') as f:
+                    f.write(b.get('pdf_file'))
+                changed = True
+            except Exception:
+                pdf_path = None
+
+        # migrate cover if present or generate from pdf
+        cover_path = b.get('cover_path')
+        if not cover_path:
+            cover_path = os.path.join(user_dir, f"{_safe_title(b)}_{int(time.time())}.png")
+            try:
+                if b.get('cover_image'):
+                    b.get('cover_image').save(cover_path)  # PIL Image
+                elif pdf_path and os.path.exists(pdf_path):
+                    render_cover_png(pdf_path, cover_path)
+                else:
+                    cover_path = None
+                changed = changed or cover_path is not None
+            except Exception:
+                cover_path = None
+
+        # skip duplicates by pdf path
+        if pdf_path and pdf_path in seen_paths:
+            continue
+
+        new_books.append({
+            'title': b.get('title'),
+            'author': b.get('author'),
+            'pages': b.get('pages'),
+            'current_page': b.get('current_page', 0),
+            'pages_read': b.get('pages_read', 0),
+            'pdf_path': pdf_path,
+            'cover_path': cover_path,
+        })
+        if pdf_path:
+            seen_paths.add(pdf_path)
+
+    if changed:
+        data['books'] = new_books
+        urec['data'] = data
+    return changed
+
+
+@migration(1, "Import users.json into the store")
+def import_users_json(runner, resume):
+    store = runner.store
+    if store.get_meta('legacy_json_imported'):
+        return  # imported by an earlier release
+    try:
+        with open(runner.data_file, 'r', encoding='utf-8') as f:
+            users = json.load(f)
+    except (OSError, ValueError):
+        users = {}
+    names = sorted(u for u, rec in users.items() if not u.startswith('_') and isinstance(rec, dict))
+    if resume:
+        names = [u for u in names if u > resume]
+    for i in range(0, len(names), CHECKPOINT_EVERY):
+        batch = {u: users[u] for u in names[i:i + CHECKPOINT_EVERY]}
+        for uname, urec in batch.items():
+            try:
+                migrate_user_books(uname, urec, runner.data_dir)
+            except Exception:
+                pass
+        store.import_legacy(batch)
+        runner.checkpoint(1, names[i + len(batch) - 1], f"{i + len(batch)}/{len(names)} users")
+    if users.get('_last_user') and store.get_meta('_last_user') is None:
+        store.set_meta('_last_user', users['_last_user'])
+    store.set_meta('legacy_json_imported', True)
+
+
+@migration(2, "Index page statistics of existing books")
+def index_page_stats(runner, resume):
+    done = 0
+    last_id = resume or 0
+    for _, book in runner.store.iter_books(after_id=last_id):
+        p = book.get('pdf_path')
+        try:
+            if p and os.path.exists(p) and not os.path.exists(sidecar_path(p)):
+                build_page_stats(p)
+        except Exception:
+            pass
+        done += 1
+        last_id = book['id']
+        if done % CHECKPOINT_EVERY == 0:
+            runner.checkpoint(2, last_id, f"{done} books")
+
+
+@migration(3, "Move book files into content-addressed storage")
+def move_books_to_blobs(runner, resume):
+    blobs = runner.blobs
+    done = 0
+    last_id = resume or 0
+    for username, book in runner.store.iter_books(after_id=last_id):
+        p = book.get('pdf_path')
+        if not book.get('sha256') and p and os.path.exists(p):
+            try:
+                digest = document_digest(p)
+                with blobs.lock:
+                    pdf_path = blobs.put_file(p, digest)
+                    # artifacts follow the blob so identical books share them
+                    moved = [(p, pdf_path)]
+                    for old, new in ((sidecar_path(p), sidecar_path(pdf_path)),
+                                     (book.get('cover_path'), blobs.derived_path(digest, 'cover.png'))):
+                        if old and os.path.exists(old):
+                            if not os.path.exists(new):
+                                link_or_copy(old, new)
+                            moved.append((old, new))
+                    cover_path = blobs.derived_path(digest, 'cover.png')
+                    runner.store.update_book(username, book['id'], sha256=digest, pdf_path=pdf_path,
+                                             cover_path=cover_path if os.path.exists(cover_path) else book.get('cover_path'))
+                runner.changed(username)
+                # the record points at the blob now; the per-user copies can go
+                get_document_pool().discard(p)
+                for old, _ in moved:
+                    os.remove(old)
+            except Exception:
+                pass
+        done += 1
+        last_id = book['id']
+        if done % CHECKPOINT_EVERY == 0:
+            runner.checkpoint(3, last_id, f"{done} books")
+
+
+@migration(4, "Index the text of existing books for search")
+def index_book_text(runner, resume):
+    done = 0
+    last_id = resume or 0
+    for _, book in runner.store.iter_books(after_id=last_id):
+        p, digest = book.get('pdf_path'), book.get('sha256')
+        try:
+            if runner.search is not None and digest and p and os.path.exists(p) and not runner.search.has(digest):
+                runner.search.add(digest, page_texts(p))
+        except Exception:
+            pass
+        done += 1
+        last_id = book['id']
+        if done % CHECKPOINT_EVERY == 0:
+            runner.checkpoint(4, last_id, f"{done} books")
+
+
+@migration(5, "Roll up logged reading sessions by day, week and month")
+def build_rollups(runner, resume):
+    runner.store.rebuild_rollups()
+
+
+class MigrationRunner:
+    def __init__(self, store, data_file, data_dir, blobs=None, records=None, search=None):
+        self.store = store
+        self.data_file = data_file
+        self.data_dir = data_dir
+        self.blobs = blobs
+        self.records = records
+        self.search = search
+        self.version = store.get_meta('schema_version', 0)
+        self.progress = ''
+        self.error = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def latest(self):
+        return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def accounts_ready(self) -> bool:
+        """Every legacy account is in the store, so logins and sign-ups can be served."""
+        return self.version >= min(ACCOUNTS_VERSION, self.latest)
+
+    def start(self):
+        """Run pending migrations, those up to ``ACCOUNTS_VERSION`` on this thread and the rest in the
+        background; a no-op once up to date. Callers wait here while another thread runs the first ones."""
+        with self._lock:
+            if self.version >= self.latest or self._thread is not None or self.error:
+                return
+            if not self._run(until=ACCOUNTS_VERSION):
+                return
+            self._thread = threading.Thread(target=self._run, name='readvibe-migrations', daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def changed(self, username):
+        """A migration rewrote ``username``'s data behind the shared record cache."""
+        if self.records is not None:
+            self.records.invalidate(username)
+
+    def checkpoint(self, version, state, progress=''):
+        self.store.set_meta('migration_checkpoint', {'version': version, 'state': state})
+        self.progress = progress
+
+    def _run(self, until=None) -> bool:
+        for version, description, fn in MIGRATIONS:
+            if version <= self.version:
+                continue
+            if until is not None and version > until:
+                return True
+            checkpoint = self.store.get_meta('migration_checkpoint') or {}
+            resume = checkpoint.get('state') if checkpoint.get('version') == version else None
+            self.progress = description
+            try:
+                fn(self, resume)
+            except Exception as e:
+                self.error = f"{description}: {e}"
+                return False  # retried from the checkpoint on next start
+            self.store.set_meta('schema_version', version)
+            self.store.set_meta('migration_checkpoint', None)
+            self.version = version
+        self.progress = ''
+        return True
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_migration_runner(store, data_file, data_dir, blobs=None, records=None, search=None) -> MigrationRunner:
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = MigrationRunner(store, data_file, data_dir, blobs, records, search)
+        return _runner
@@ -0,0 +1,123 @@
+"""Two-tier cache of rendered PDF pages.
+
+Encoded page images are kept in an in-memory LRU bounded by bytes and in a
+content-addressed store on disk::
+
+    <root>/<digest[:2]>/<digest>/<page>@<zoom>.<fmt>
+    <root>/<digest[:2]>/<digest>/<page>@<zoom>.t<size>-<col>-<row>.<fmt>   (tiles, see readvibe.pageview)
+
+where ``digest`` is the SHA-256 of the PDF, so the entries stay valid across
+restarts and are shared by identical uploads.
+"""
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+from .metrics import register_cache
+
+MAX_MEMORY_BYTES = int(os.environ.get('READVIBE_PAGE_CACHE_MB', '128')) * 1024 * 1024
+
+
+class PageImageCache:
+    def __init__(self, root, max_bytes=MAX_MEMORY_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self._mem = OrderedDict()  # (digest, page, zoom, fmt[, (tile size, col, row)]) -> bytes
+        self._bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        digest, page, zoom, fmt, *tile = key
+        name = f"{page}@{zoom:g}" + (".t{}-{}-{}".format(*tile[0]) if tile else "")
+        return os.path.join(self.root, digest[:2], digest, f"{name}.{fmt}")
+
+    def _remember(self, key, data):
+        # caller holds self.lock
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        if len(data) > self.max_bytes:
+            return
+        self._mem[key] = data
+        self._bytes += len(data)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._mem.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def get(self, key):
+        with self.lock:
+            data = self._mem.get(key)
+            if data is not None:
+                self._mem.move_to_end(key)
+                self.memory_hits += 1
+                return data
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.disk_hits += 1
+            self._remember(key, data)
+        return data
+
+    def put(self, key, data):
+        with self.lock:
+            self._remember(key, data)
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def contains(self, key) -> bool:
+        with self.lock:
+            if key in self._mem:
+                return True
+        return os.path.exists(self._path(key))
+
+    def drop_document(self, digest):
+        """Forget every cached page of one PDF."""
+        with self.lock:
+            for key in [k for k in self._mem if k[0] == digest]:
+                self._bytes -= len(self._mem.pop(key))
+        shutil.rmtree(os.path.join(self.root, digest[:2], digest), ignore_errors=True)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._mem),
+                'bytes': self._bytes,
+                'hits': self.memory_hits + self.disk_hits,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_ratio': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_page_cache(root) -> PageImageCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PageImageCache(root)
+            register_cache('page_images', _cache.stats)
+        return _cache
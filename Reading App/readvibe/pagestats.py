@@ -0,0 +1,220 @@
+"""Per-page word statistics for read-time estimates.
+
+Counting words needs the page text, and extracting text is the slow part of
+a read-time estimate. The counts are therefore computed once per book and
+stored next to the PDF in a small binary sidecar (``<pdf>.stats``)::
+
+    header   '<4sHHIqQ'  magic, version, reserved, n_pages, pdf mtime_ns, pdf size
+    words    n_pages x uint32
+    chars    n_pages x uint32   (total letters of those words)
+    long     n_pages x uint32   (words longer than 7 characters)
+
+The sidecar is rebuilt whenever the PDF's size or mtime no longer match.
+Ingestion builds it, but it can be missing (e.g. that stage failed). The
+app then passes a ``build`` callable that hands the build to the render
+farm, and gets None until the sidecar is there, instead of extracting the
+whole document on the script thread.
+
+Loaded statistics hold NumPy cumulative sums, so estimating any number of
+page ranges costs the same whatever their length. NumPy is imported when
+statistics are first built or loaded, not with this module, so that the
+login screen does not pay for it.
+"""
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+from .metrics import timed
+from .pdfdocs import open_pdf
+
+MAGIC = b'RVPS'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIqQ')
+LONG_WORD = 7
+DEFAULT_WPM = 200
+EMPTY_PAGE_MINUTES = 0.1
+
+
+def word_stats(text):
+    """(words, chars, long_words) for a page of text, using the app's tokenizer."""
+    words = [w for w in text.split() if w.isalpha() or w.isalnum()]
+    return len(words), sum(len(w) for w in words), sum(1 for w in words if len(w) > LONG_WORD)
+
+
+def difficulty_weight(words, chars, long_words):
+    """Reading effort of a page in words; divide by WPM to get minutes."""
+    if words == 0:
+        return 0.0
+    avg_len = chars / words
+    long_ratio = long_words / words
+    return words * (1 + (long_ratio * 0.35) + max(0, (avg_len - 5) / 10))
+
+
+class PageStats:
+    def __init__(self, words, chars, long_words):
+        import numpy as np
+
+        self.words = np.asarray(words, dtype=np.uint32)
+        self.chars = np.asarray(chars, dtype=np.uint32)
+        self.long_words = np.asarray(long_words, dtype=np.uint32)
+        # same formula as difficulty_weight(), one page per element
+        w = self.words.astype(np.float64)
+        safe = np.maximum(w, 1)
+        factor = 1 + (self.long_words / safe) * 0.35 + np.maximum(0, (self.chars / safe - 5) / 10)
+        weights = np.where(w > 0, w * factor, 0.0)
+        # prefix sums: _weight[i] / _empty[i] cover pages [0, i)
+        self._weight = np.concatenate(([0.0], np.cumsum(weights)))
+        self._empty = np.concatenate(([0], np.cumsum(w == 0)))
+
+    def __len__(self):
+        return len(self.words)
+
+    def ranges_minutes(self, starts, ends, wpm=None):
+        """Estimated minutes for each [start, end) pair, as an array.
+
+        ``wpm`` is one reading speed or an array with one per range; unset (0) speeds use the default.
+        """
+        import numpy as np
+
+        n = len(self)
+        starts = np.clip(np.asarray(starts, dtype=np.int64), 0, n)
+        ends = np.clip(np.asarray(ends, dtype=np.int64), starts, n)
+        weight = self._weight[ends] - self._weight[starts]
+        empty = self._empty[ends] - self._empty[starts]
+        if np.ndim(wpm):
+            wpm = np.asarray(wpm, dtype=np.float64)
+            wpm = np.where(wpm > 0, wpm, DEFAULT_WPM)
+        return weight / (wpm if np.ndim(wpm) else (wpm or DEFAULT_WPM)) + empty * EMPTY_PAGE_MINUTES
+
+    def range_minutes(self, start, end, wpm=None):
+        """Estimated minutes for pages [start, end)."""
+        return float(self.ranges_minutes([start], [end], wpm)[0])
+
+    def page_minutes(self, page, wpm=None):
+        page = min(max(page, 0), len(self) - 1)
+        return self.range_minutes(page, page + 1, wpm)
+
+
+def sidecar_path(pdf_path):
+    return os.path.splitext(pdf_path)[0] + '.stats'
+
+
+def build_page_stats(pdf_path, texts=None) -> PageStats:
+    """Extract every page's text once (unless given ``texts``) and write the sidecar."""
+    import numpy as np
+
+    if texts is None:
+        with open_pdf(pdf_path) as doc, timed('pdf.text'):
+            texts = [page.get_text("text") or "" for page in doc]
+    words, chars, long_words = [], [], []
+    for text in texts:
+        w, c, l = word_stats(text)
+        words.append(w)
+        chars.append(c)
+        long_words.append(l)
+    st = os.stat(pdf_path)
+    path = sidecar_path(pdf_path)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(words), st.st_mtime_ns, st.st_size))
+        for values in (words, chars, long_words):
+            np.asarray(values, dtype='<u4').tofile(f)
+    os.replace(tmp, path)
+    stats = PageStats(words, chars, long_words)
+    _remember((os.path.abspath(pdf_path), st.st_mtime_ns, st.st_size), stats)
+    return stats
+
+
+def write_page_stats(pdf_path):
+    """:func:`build_page_stats` for a render farm worker: writes the sidecar and returns nothing to send back."""
+    build_page_stats(pdf_path)
+
+
+def _read_sidecar(pdf_path, st):
+    import numpy as np
+
+    try:
+        with open(sidecar_path(pdf_path), 'rb') as f:
+            magic, version, _, n, mtime_ns, size = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION or (mtime_ns, size) != (st.st_mtime_ns, st.st_size):
+                return None
+            columns = np.fromfile(f, dtype='<u4', count=3 * n)
+    except (OSError, struct.error):
+        return None
+    if len(columns) != 3 * n:
+        return None
+    return PageStats(*columns.reshape(3, n))
+
+
+_loaded = OrderedDict()  # (path, mtime_ns, size) -> PageStats
+_loaded_lock = threading.Lock()
+_building = set()  # (path, mtime_ns, size) of sidecars handed to a ``build`` callable and not written yet
+MAX_LOADED = 64
+
+
+def _remember(key, stats):
+    with _loaded_lock:
+        _loaded[key] = stats
+        _loaded.move_to_end(key)
+        while len(_loaded) > MAX_LOADED:
+            _loaded.popitem(last=False)
+
+
+def _request_build(key, pdf_path, build):
+    with _loaded_lock:
+        if key in _building:
+            return
+        _building.add(key)
+    try:
+        future = build(write_page_stats, pdf_path)
+    except Exception:
+        future = None  # e.g. the farm's queue is full; asked for again on the next call
+    if future is None:
+        with _loaded_lock:
+            _building.discard(key)
+        return
+    def done(_):
+        with _loaded_lock:
+            _building.discard(key)
+    future.add_done_callback(done)
+
+
+def load_page_stats(pdf_path, build=None):
+    """Page statistics for ``pdf_path``, building the sidecar if it is missing or stale.
+
+    With ``build``, e.g. ``partial(farm.submit, INDEXING, block=False)``, a missing sidecar is built
+    by ``build(write_page_stats, pdf_path)`` (which returns a Future) and None is returned until it
+    is there.
+    """
+    st = os.stat(pdf_path)
+    key = (os.path.abspath(pdf_path), st.st_mtime_ns, st.st_size)
+    with _loaded_lock:
+        stats = _loaded.get(key)
+        if stats is not None:
+            _loaded.move_to_end(key)
+            return stats
+    stats = _read_sidecar(pdf_path, st)
+    if stats is None:
+        if build is not None:
+            _request_build(key, pdf_path, build)
+            return None
+        return build_page_stats(pdf_path)
+    _remember(key, stats)
+    return stats
+
+
+def estimate_minutes(pdf_path, ranges, wpm=None, build=None):
+    """Total estimated minutes over ``ranges``, an iterable of (start, end) page pairs (end exclusive).
+
+    None while the statistics are built by ``build`` (see :func:`load_page_stats`).
+    """
+    import numpy as np
+
+    ranges = np.asarray(list(ranges), dtype=np.int64).reshape(-1, 2)
+    if not len(ranges):
+        return 0.0
+    stats = load_page_stats(pdf_path, build)
+    if stats is None:
+        return None
+    return float(stats.ranges_minutes(ranges[:, 0], ranges[:, 1], wpm).sum())
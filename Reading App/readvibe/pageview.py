@@ -0,0 +1,192 @@
+"""Viewport-aware page rendering for the Read view.
+
+The Read view used to render the whole page at a fixed 2x zoom, so a
+poster-size scan became a pixmap of tens of megapixels and a PNG of several
+megabytes. Here the scale comes from the display instead:
+
+- At zoom level 1 ("Fit") the page is scaled to fit a ``DISPLAY_WIDTH`` x
+  ``DISPLAY_HEIGHT`` pixel box and rendered as one image.
+- Above level 1 the page is larger than the box. It is cut into square
+  ``TILE``-pixel tiles, and only the tiles under the visible window (the
+  box, panned across the page) are rendered. They are clipped from one
+  display list of the page.
+
+Either way a view covers at most the box, so the memory and bytes of a
+page view do not depend on the page size. Images and tiles go in the page
+cache under their scale (and grid position), so panning back or returning
+to a zoom level reuses what is already rendered. The cache is checked
+before the document is borrowed from the pool, and what is missing can be
+rendered by the render farm's worker processes. So can the page size a
+view is laid out from, the first time a page is shown, so the app process
+never opens the document for it.
+"""
+import math
+import os
+import threading
+from collections import OrderedDict
+
+from .metrics import timed
+from .pdfdocs import document_digest, open_pdf
+from .pdfpages import MIME_TYPES, PAGE_FORMAT, PAGE_QUALITY, encode_pixmap
+
+# device pixels of the reading area: a 1200 px wide column, or 600 CSS px on a 2x screen;
+# st.image downsizes (and so re-encodes) images wider than 1460 px
+DISPLAY_WIDTH = int(os.environ.get('READVIBE_DISPLAY_WIDTH', '1200'))
+DISPLAY_HEIGHT = int(os.environ.get('READVIBE_DISPLAY_HEIGHT', '1700'))
+TILE = int(os.environ.get('READVIBE_TILE', '512'))
+ZOOM_LEVELS = (1, 1.5, 2, 3, 4)
+
+
+def fit_zoom(width, height, display=(DISPLAY_WIDTH, DISPLAY_HEIGHT)) -> float:
+    """Scale at which a ``width`` x ``height`` page (points) fits ``display`` (pixels), rounded down to 1/100."""
+    return max(math.floor(min(display[0] / width, display[1] / height) * 100) / 100, 0.01)
+
+
+def pixel_size(width, height, scale):
+    """Size in pixels of a page rendered at ``scale``, rounded as MuPDF rounds it."""
+    return math.ceil(width * scale - 0.001), math.ceil(height * scale - 0.001)
+
+
+def visible_tiles(window, tile=TILE):
+    """(column, row) of every tile that overlaps ``window`` (x, y, width, height in page pixels)."""
+    x, y, w, h = window
+    return [(col, row) for row in range(y // tile, (y + h - 1) // tile + 1)
+            for col in range(x // tile, (x + w - 1) // tile + 1)]
+
+
+class PageView:
+    """What the Read view shows of one page: either one ``image`` or the ``tiles`` under ``window``."""
+
+    def __init__(self, page, level, scale, size, window, fmt, image=None, tiles=()):
+        self.page = page
+        self.level = level
+        self.scale = scale
+        self.size = size  # (width, height) of the whole page at ``scale``, in pixels
+        self.window = window  # (x, y, width, height) shown, in page pixels
+        self.fmt = fmt
+        self.image = image
+        self.tiles = list(tiles)  # (x, y, width, height, encoded bytes), in page pixels
+
+    @property
+    def mime_type(self):
+        return MIME_TYPES.get(self.fmt, f"image/{self.fmt}")
+
+    @property
+    def nbytes(self):
+        return len(self.image) if self.image is not None else sum(len(t[4]) for t in self.tiles)
+
+
+_sizes = OrderedDict()  # (digest, page) -> (number of pages, width, height in points)
+_sizes_lock = threading.Lock()
+MAX_SIZES = 4096
+
+
+def page_size(pdf_path, page_num):
+    """(number of pages, width, height in points) of page ``page_num``, or of the nearest page if out of range."""
+    with open_pdf(pdf_path) as doc:
+        pages = len(doc)
+        rect = doc[min(max(page_num, 0), pages - 1)].rect
+    return pages, rect.width, rect.height
+
+
+def _page_size(pdf_path, digest, page_num, run=None):
+    with _sizes_lock:
+        size = _sizes.get((digest, page_num))
+    if size is None:
+        size = run(page_size, pdf_path, page_num) if run is not None else page_size(pdf_path, page_num)
+        with _sizes_lock:
+            _sizes[(digest, page_num)] = size
+            while len(_sizes) > MAX_SIZES:
+                _sizes.popitem(last=False)
+    return size
+
+
+def render_tiles(pdf_path, page_num, scale, tiles, fmt=PAGE_FORMAT, quality=PAGE_QUALITY, tile=TILE) -> dict:
+    """{tile: encoded bytes} for ``tiles`` ((column, row) pairs, or None for the whole page) of one page at ``scale``.
+
+    Module-level and free of caches so that render farm workers can run it (see :mod:`readvibe.renderfarm`),
+    as is :func:`page_size`.
+    """
+    import fitz
+
+    matrix = fitz.Matrix(scale, scale)
+    rendered = {}
+    with open_pdf(pdf_path) as doc:
+        page = doc[page_num]
+        if None in tiles:
+            with timed('pdf.render'):
+                rendered[None] = encode_pixmap(page.get_pixmap(matrix=matrix), fmt, quality)
+        display_list = None
+        for col, row in (t for t in tiles if t is not None):
+            if display_list is None:
+                display_list = page.get_displaylist()  # the page is interpreted once for all its tiles
+            clip = fitz.Rect(col * tile, row * tile, (col + 1) * tile, (row + 1) * tile) * ~matrix
+            with timed('pdf.render'):
+                pix = display_list.get_pixmap(matrix=matrix, clip=clip & page.rect)
+                rendered[(col, row)] = encode_pixmap(pix, fmt, quality)
+    return rendered
+
+
+def _layout(digest, page_num, level, pan, fmt, measured):
+    # (page, scale, size, window, {tile: cache key}) of a view, given its page's measured size
+    pages, width, height = measured
+    page_num = min(max(page_num, 0), pages - 1)
+    scale = round(fit_zoom(width, height) * max(level, 1), 4)
+    size = pixel_size(width, height, scale)
+    window_w, window_h = min(size[0], DISPLAY_WIDTH), min(size[1], DISPLAY_HEIGHT)
+    window = (round(min(max(pan[0], 0), 1) * (size[0] - window_w)),
+              round(min(max(pan[1], 0), 1) * (size[1] - window_h)), window_w, window_h)
+    if level <= 1:
+        wanted = {None: (digest, page_num, scale, fmt)}
+    else:
+        wanted = {tile: (digest, page_num, scale, fmt, (TILE, *tile)) for tile in visible_tiles(window)}
+    return page_num, scale, size, window, wanted
+
+
+def is_cached(pdf_path, page_num, level=1, pan=(0.5, 0.0), fmt=PAGE_FORMAT, cache=None) -> bool:
+    """Whether :func:`render_view` would find the whole view in ``cache``.
+
+    Never opens the document: a page whose size has not been measured yet counts as not cached.
+    """
+    try:
+        digest = document_digest(pdf_path)
+        with _sizes_lock:
+            measured = _sizes.get((digest, page_num))
+        if measured is None or cache is None:
+            return False
+        *_, wanted = _layout(digest, page_num, level, pan, fmt, measured)
+        return all(cache.contains(key) for key in wanted.values())
+    except Exception:
+        return False
+
+
+def render_view(pdf_path, page_num, level=1, pan=(0.5, 0.0), fmt=PAGE_FORMAT, quality=PAGE_QUALITY, cache=None, run=None):
+    """Render the part of page ``page_num`` seen at zoom ``level`` (see :data:`ZOOM_LEVELS`).
+
+    ``pan`` is the window's (horizontal, vertical) position over the page, 0 to 1 each.
+    ``fmt`` and ``quality`` are as for :func:`readvibe.pdfpages.encode_pixmap`, and ``cache`` is a
+    PageImageCache. What the cache does not have is rendered by ``run(render_tiles, *args)``, e.g.
+    ``partial(farm.call, VISIBLE)``, or on this thread; a page shown for the first time is measured
+    by ``run(page_size, ...)`` the same way. Returns a :class:`PageView`, or None if the page cannot
+    be rendered.
+    """
+    try:
+        digest = document_digest(pdf_path)
+        page_num, scale, size, window, wanted = _layout(
+            digest, page_num, level, pan, fmt, _page_size(pdf_path, digest, page_num, run))
+        found = {tile: cache.get(key) if cache is not None else None for tile, key in wanted.items()}
+        missing = [tile for tile, data in found.items() if data is None]
+        if missing:
+            args = (pdf_path, page_num, scale, missing, fmt, quality, TILE)
+            found.update(run(render_tiles, *args) if run is not None else render_tiles(*args))
+            if cache is not None:
+                for tile in missing:
+                    cache.put(wanted[tile], found[tile])
+
+        if level <= 1:
+            return PageView(page_num, level, scale, size, window, fmt, image=found[None])
+        tiles = [(col * TILE, row * TILE, min(TILE, size[0] - col * TILE), min(TILE, size[1] - row * TILE), data)
+                 for (col, row), data in found.items()]
+        return PageView(page_num, level, scale, size, window, fmt, tiles=tiles)
+    except Exception:
+        return None
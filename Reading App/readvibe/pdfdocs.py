@@ -0,0 +1,172 @@
+"""Process-wide pool of open PyMuPDF documents.
+
+Opening a PDF makes MuPDF parse its xref table, which is slow for large
+revision booklets. The pool keeps recently used documents open, keyed by
+(path, mtime, size) so an overwritten file is never served stale, and closes
+the least recently used ones once the handle or byte cap is reached.
+
+PyMuPDF is not thread-safe, so a document borrowed from the pool is only
+usable inside the ``with`` block, which holds the pool lock.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .metrics import error, register_cache, timed
+
+MAX_OPEN_DOCUMENTS = int(os.environ.get('READVIBE_PDF_POOL_HANDLES', '8'))
+MAX_OPEN_BYTES = int(os.environ.get('READVIBE_PDF_POOL_MB', '512')) * 1024 * 1024
+
+
+class DocumentPool:
+    """LRU cache of open ``fitz.Document`` handles."""
+
+    def __init__(self, max_handles=MAX_OPEN_DOCUMENTS, max_bytes=MAX_OPEN_BYTES):
+        self.max_handles = max(1, max_handles)
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()
+        self._docs = OrderedDict()  # (path, mtime_ns, size) -> fitz.Document
+        self._keys = {}  # path -> current key
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(path):
+        st = os.stat(path)
+        return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+    @contextmanager
+    def document(self, path):
+        """Borrow the open document for ``path``."""
+        with self.lock:
+            yield self._get(path)
+
+    def _get(self, path):
+        key = self._key(path)
+        doc = self._docs.get(key)
+        if doc is not None:
+            self._docs.move_to_end(key)
+            self.hits += 1
+            return doc
+
+        # the file changed on disk since we opened it
+        stale = self._keys.get(key[0])
+        if stale is not None:
+            self._close(stale)
+
+        import fitz  # on first use, to keep PyMuPDF off the app's start-up
+
+        with timed('pdf.open'):
+            doc = fitz.open(key[0])
+        self.misses += 1
+        self._docs[key] = doc
+        self._keys[key[0]] = key
+        self._bytes += key[2]
+        self._evict(keep=key)
+        return doc
+
+    def _evict(self, keep):
+        while len(self._docs) > self.max_handles or self._bytes > self.max_bytes:
+            oldest = next(iter(self._docs))
+            if oldest == keep:
+                break
+            self._close(oldest)
+            self.evictions += 1
+
+    def _close(self, key):
+        doc = self._docs.pop(key, None)
+        if self._keys.get(key[0]) == key:
+            del self._keys[key[0]]
+        if doc is not None:
+            self._bytes -= key[2]
+            try:
+                doc.close()
+            except Exception:
+                pass
+
+    def discard(self, path):
+        """Close ``path`` if it is open, e.g. before deleting the file."""
+        with self.lock:
+            key = self._keys.get(os.path.abspath(path))
+            if key is not None:
+                self._close(key)
+
+    def close_all(self):
+        with self.lock:
+            for key in list(self._docs):
+                self._close(key)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'open': len(self._docs),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_document_pool() -> DocumentPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DocumentPool()
+            register_cache('pdf_documents', _pool.stats)
+        return _pool
+
+
+@contextmanager
+def open_pdf(source):
+    """Yield a document for a file path (pooled) or raw PDF bytes (closed on exit)."""
+    if isinstance(source, (bytes, bytearray)):
+        import fitz
+
+        with timed('pdf.open'):
+            doc = fitz.open(stream=source, filetype="pdf")
+        try:
+            yield doc
+        finally:
+            doc.close()
+    elif isinstance(source, str) and os.path.exists(source):
+        with get_document_pool().document(source) as doc:
+            yield doc
+    else:
+        error('pdf.open')
+        raise FileNotFoundError(source)
+
+
+_digests = {}  # (path, mtime_ns, size) -> sha256 hex
+_digests_lock = threading.Lock()
+
+
+def remember_digest(path, digest):
+    """Record a digest that is already known, e.g. for a content-addressed blob."""
+    with _digests_lock:
+        _digests[DocumentPool._key(path)] = digest
+
+
+def document_digest(source) -> str:
+    """SHA-256 of a PDF's bytes; for files it is computed once per (path, mtime, size)."""
+    if isinstance(source, (bytes, bytearray)):
+        return hashlib.sha256(source).hexdigest()
+    key = DocumentPool._key(source)
+    with _digests_lock:
+        digest = _digests.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with _digests_lock:
+            _digests[key] = digest
+    return digest
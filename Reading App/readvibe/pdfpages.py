@@ -0,0 +1,38 @@
+"""Page image encoding shared by the Read view and the Library thumbnails.
+
+Rendering itself lives in :mod:`readvibe.pageview` (pages) and
+:mod:`readvibe.thumbnails` (covers); both encode through
+:func:`encode_pixmap` with the format and quality configured here. Pillow
+is imported on first use.
+
+Renders come back as encoded bytes, ready to send. The app hands them to
+the browser as they are (see ``show_image`` in ``app.py``), so a page view
+costs one rasterization and one encode. Before, it cost a PNG encode, then
+a decode and a JPEG re-encode inside ``st.image``.
+"""
+import io
+import os
+
+# page images: 'jpg' (default), 'png' or 'webp'; quality applies to jpg and webp
+PAGE_FORMAT = os.environ.get('READVIBE_PAGE_FORMAT', 'jpg')
+# cached pages keep the quality they were encoded at, so clear data/_cache/pages after changing it
+PAGE_QUALITY = int(os.environ.get('READVIBE_PAGE_QUALITY', '80'))
+MIME_TYPES = {'png': 'image/png', 'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'webp': 'image/webp'}
+_PIL_MODES = {1: 'L', 3: 'RGB', 4: 'RGBA'}
+
+
+def encode_pixmap(pix, fmt=PAGE_FORMAT, quality=PAGE_QUALITY) -> bytes:
+    """Encode a rendered pixmap once, as ``fmt``.
+
+    PNG is written by MuPDF. JPEG and WebP go to Pillow, which reads the pixmap's samples in place
+    (libjpeg-turbo is about ten times faster than MuPDF's JPEG writer).
+    """
+    if fmt in ('jpg', 'jpeg', 'webp'):
+        from PIL import Image
+
+        mode = _PIL_MODES[pix.n]
+        image = Image.frombuffer(mode, (pix.width, pix.height), pix.samples_mv, 'raw', mode, pix.stride, 1)
+        out = io.BytesIO()
+        image.save(out, 'WEBP' if fmt == 'webp' else 'JPEG', quality=quality)
+        return out.getvalue()
+    return pix.tobytes(fmt)
@@ -0,0 +1,116 @@
+"""Background prefetch of the pages a reader is likely to open next.
+
+After a page is shown the Read view asks for a window of neighbouring pages
+to be rendered into the page cache on a small thread pool. The window leans
+towards the direction the reader is moving and grows with their page-turn
+rate. Pages already in the cache, or still queued for the same reader, are
+not queued again. Jumping elsewhere in the book cancels whatever is still
+queued. A reader's bookkeeping is dropped once their last job is done, so
+it does not outlive their session.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+WORKERS = int(os.environ.get('READVIBE_PREFETCH_WORKERS', '2'))
+MIN_AHEAD = 2
+MAX_AHEAD = 8
+HISTORY_SECONDS = 60
+
+
+def record_move(history, page, now=None):
+    """Append a page visit to ``history`` (a list of (time, page)) and trim old entries."""
+    now = time.time() if now is None else now
+    if not history or history[-1][1] != page:
+        history.append((now, page))
+    while history and now - history[0][0] > HISTORY_SECONDS:
+        history.pop(0)
+    return history
+
+
+def prefetch_window(history, total_pages):
+    """Pages to warm, most urgent first, for the last page in ``history``."""
+    if not history:
+        return []
+    current = history[-1][1]
+    # only single-page steps tell us about reading pace
+    steps = [(b[0] - a[0], b[1] - a[1]) for a, b in zip(history, history[1:]) if abs(b[1] - a[1]) == 1]
+    direction = -1 if steps and steps[-1][1] < 0 else 1
+    elapsed = sum(dt for dt, _ in steps)
+    pages_per_second = len(steps) / elapsed if elapsed > 0 else 0
+    ahead = max(MIN_AHEAD, min(MAX_AHEAD, MIN_AHEAD + round(pages_per_second * 10)))
+
+    pages = [current + direction * i for i in range(1, ahead + 1)]
+    pages.append(current - direction)
+    return [p for p in pages if 0 <= p < total_pages]
+
+
+class PagePrefetcher:
+    def __init__(self, workers=WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='page-prefetch')
+        # reentrant: cancelling a future runs its done callback, _finished, on the cancelling thread
+        self.lock = threading.RLock()
+        self._jobs = {}  # owner -> {(pdf_path, page): Future}, until each job is done
+        self._generation = {}  # owner -> int, bumped by cancel(); dropped with the owner's last job
+
+    def schedule(self, owner, render, pdf_path, pages, cached=None):
+        """Queue ``render(pdf_path, page)`` for each page on behalf of ``owner`` (a session id).
+
+        Pages already queued for ``owner`` are skipped, as are those for which ``cached(pdf_path, page)`` is true.
+        """
+        if cached is not None:
+            pages = [page for page in pages if not cached(pdf_path, page)]
+        with self.lock:
+            generation = self._generation.get(owner, 0)
+            for page in pages:
+                key = (pdf_path, page)
+                if key in self._jobs.get(owner, {}):
+                    continue
+                future = self._pool.submit(self._run, owner, generation, render, pdf_path, page)
+                self._jobs.setdefault(owner, {})[key] = future
+                future.add_done_callback(partial(self._finished, owner, key))
+
+    def cancel(self, owner):
+        """Drop queued jobs for ``owner``; running ones finish their current page only."""
+        with self.lock:
+            self._generation[owner] = self._generation.get(owner, 0) + 1
+            for f in list(self._jobs.get(owner, {}).values()):
+                f.cancel()
+            if owner not in self._jobs:
+                del self._generation[owner]  # nothing left running that could see the old generation
+
+    def _finished(self, owner, key, future):
+        with self.lock:
+            jobs = self._jobs.get(owner)
+            if jobs is None or jobs.get(key) is not future:
+                return
+            del jobs[key]
+            if not jobs:
+                del self._jobs[owner]
+                self._generation.pop(owner, None)
+
+    def _run(self, owner, generation, render, pdf_path, page):
+        if self._generation.get(owner, 0) != generation:
+            return
+        try:
+            render(pdf_path, page)
+        except Exception:
+            pass
+
+    def pending(self, owner) -> int:
+        with self.lock:
+            return sum(1 for f in self._jobs.get(owner, {}).values() if not f.done())
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher() -> PagePrefetcher:
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = PagePrefetcher()
+        return _prefetcher
@@ -0,0 +1,137 @@
+"""Process-wide, copy-on-write view of user records.
+
+Browser sessions used to keep a private copy of the whole user database and
+write it back wholesale, so memory grew with sessions x users and sessions
+overwrote each other's changes. Now every session shares one
+:class:`UserRecords` and keeps only a :class:`UserHandle` (a username).
+
+Records are loaded lazily from the store and are never mutated in place:
+each write goes to the store under that user's lock and then swaps in a
+freshly loaded record. A reader holding the previous record keeps a
+consistent (if slightly stale) snapshot, so records must be treated as
+read-only. The user locks are striped: a fixed set of locks, picked by
+username, so their number stays the same however many users log in.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from .metrics import timed
+
+MAX_CACHED_USERS = int(os.environ.get('READVIBE_CACHED_USERS', '10000'))
+LOCK_STRIPES = 64
+
+
+class UserRecords:
+    def __init__(self, store, max_users=MAX_CACHED_USERS):
+        self.store = store
+        self.max_users = max_users
+        self._records = OrderedDict()  # username -> record (read-only)
+        # users sharing a stripe only wait on each other; nothing holds two users' locks at once
+        self._locks = [threading.RLock() for _ in range(LOCK_STRIPES)]
+        self._lock = threading.Lock()
+        # called as listener(username, record) after every write, e.g. to keep the leaderboard current
+        self.listeners = []
+
+    def lock(self, username):
+        return self._locks[hash(username) % len(self._locks)]
+
+    def get(self, username):
+        """The current record for ``username`` (None if there is no such user)."""
+        with self._lock:
+            rec = self._records.get(username)
+            if rec is not None:
+                self._records.move_to_end(username)
+                return rec
+        with self.lock(username):
+            return self._reload(username)
+
+    def _reload(self, username):
+        # caller holds the user's lock
+        with timed('users.load'):
+            rec = self.store.get_user(username)
+        with self._lock:
+            if rec is None:
+                self._records.pop(username, None)
+                return None
+            self._records[username] = rec
+            self._records.move_to_end(username)
+            while len(self._records) > self.max_users:
+                self._records.popitem(last=False)
+        return rec
+
+    def write(self, username, method, *args, **kwargs):
+        """Call ``store.<method>(username, ...)`` and publish the updated record."""
+        with self.lock(username):
+            with timed('users.save'):
+                result = getattr(self.store, method)(username, *args, **kwargs)
+            self.refresh(username)
+            return result
+
+    def refresh(self, username):
+        """Reload ``username`` from the store and tell the listeners, e.g. after a bulk import wrote to the store directly."""
+        with self.lock(username):
+            rec = self._reload(username)
+            for listener in self.listeners:
+                listener(username, rec)
+            return rec
+
+    def invalidate(self, username):
+        """Drop the cached record, e.g. after a background job changed it in the store."""
+        with self.lock(username):
+            with self._lock:
+                self._records.pop(username, None)
+
+    def handle(self, username):
+        return UserHandle(self, username)
+
+
+class UserHandle:
+    """What a browser session keeps: its username and a way to reach the shared record."""
+
+    def __init__(self, records, username):
+        self._records = records
+        self.username = username
+
+    @property
+    def record(self):
+        return self._records.get(self.username) or {'data': {}}
+
+    @property
+    def data(self):
+        return self.record.get('data', {})
+
+    def create(self, password_hash):
+        return self._records.write(self.username, 'create_user', password_hash)
+
+    def add_book(self, book):
+        return self._records.write(self.username, 'add_book', book)
+
+    def update_book(self, book_id, **fields):
+        self._records.write(self.username, 'update_book', book_id, **fields)
+
+    def delete_book(self, book_id):
+        """Returns how many books still use the deleted book's PDF blob."""
+        return self._records.write(self.username, 'delete_book', book_id)
+
+    def log_session(self, book_id, start_page, end_page, minutes, points):
+        self._records.write(self.username, 'log_session', book_id, start_page, end_page, minutes, points)
+
+    def update_settings(self, **fields):
+        self._records.write(self.username, 'update_settings', **fields)
+
+    def rollups(self):
+        """This day's, week's and month's reading totals; read fresh so periods roll over on time."""
+        return self._records.store.get_rollups(self.username)
+
+
+_records = None
+_records_lock = threading.Lock()
+
+
+def get_user_records(store) -> UserRecords:
+    global _records
+    with _records_lock:
+        if _records is None:
+            _records = UserRecords(store)
+        return _records
@@ -0,0 +1,209 @@
+"""Process pool that runs rasterization and text extraction for every session.
+
+PyMuPDF holds the GIL and the document pool lock while it renders, so
+renders on the script threads ran one at a time on a single core, however
+many readers were waiting. A :class:`RenderFarm` runs them in worker
+processes instead. Each worker opens documents through its own
+:mod:`readvibe.pdfdocs` pool and keeps them open between jobs.
+
+Jobs from all sessions go through one priority queue::
+
+    VISIBLE    the page a reader is looking at
+    PREFETCH   pages a reader is likely to open next (see readvibe.prefetch)
+    INDEXING   ingestion stages of new uploads (see readvibe.ingest)
+
+One dispatcher thread per worker takes the most urgent job and waits for
+its result, so the process pool never holds a backlog of its own to run
+in the wrong order. A priority queue alone does not stop indexing jobs,
+which can extract the text of a whole document, from taking every worker
+between two page views. So at most ``indexing`` of them run at once, one
+fewer than the workers, and a farm has at least two workers. Backpressure
+applies once ``QUEUE_LIMIT`` jobs are waiting:
+
+- Visible jobs are always queued.
+- Prefetch jobs are refused with :class:`QueueFull`. They can be asked for again.
+- Indexing jobs wait for room, or are refused as well when submitted with
+  ``block=False`` (e.g. from a script thread).
+
+Workers are started on the first job, so the farm costs nothing at start-up.
+:meth:`RenderFarm.shutdown` stops them; farms made for a while (e.g. in the
+benchmarks) are used as context managers.
+"""
+import heapq
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .metrics import error, get_metrics
+
+VISIBLE, PREFETCH, INDEXING = 0, 1, 2
+PRIORITY_NAMES = {VISIBLE: 'visible', PREFETCH: 'prefetch', INDEXING: 'indexing'}
+RENDER_WORKERS = int(os.environ.get('READVIBE_RENDER_WORKERS', str(os.cpu_count() or 1)))
+# indexing jobs run at once; by default all workers but one, which is kept for visible and prefetch jobs
+INDEXING_WORKERS = int(os.environ.get('READVIBE_RENDER_INDEXING', '0')) or None
+# 0 runs jobs on the dispatcher threads instead of in worker processes
+RENDER_PROCESSES = os.environ.get('READVIBE_RENDER_PROCESSES', '1') != '0'
+QUEUE_LIMIT = int(os.environ.get('READVIBE_RENDER_QUEUE', '64'))
+
+
+class QueueFull(RuntimeError):
+    pass
+
+
+class RenderFarm:
+    def __init__(self, workers=RENDER_WORKERS, limit=QUEUE_LIMIT, processes=RENDER_PROCESSES, indexing=INDEXING_WORKERS):
+        self.indexing = max(1, indexing or workers - 1)
+        self.workers = max(workers, self.indexing + 1)
+        self.limit = limit
+        self.processes = processes
+        self.lock = threading.Lock()
+        self._work = threading.Condition(self.lock)  # a job was queued
+        self._room = threading.Condition(self.lock)  # a job left the queue
+        self._heap = []  # (priority, seq, queued at, Future, fn, args)
+        self._seq = itertools.count()
+        self._procs = None
+        self._dispatchers = []
+        self._closed = False
+        self.running = 0
+        self.running_indexing = 0
+        self.completed = 0
+        self.refused = 0
+
+    def _start(self):
+        # caller holds self.lock
+        if self._dispatchers:
+            return
+        if self.processes:
+            self._procs = self._new_pool()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._dispatch, name=f'render-farm-{i}', daemon=True)
+            thread.start()
+            self._dispatchers.append(thread)
+
+    def _new_pool(self):
+        # spawn: forking a process that runs server threads is not safe
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def submit(self, priority, fn, *args, block=True) -> Future:
+        """Queue ``fn(*args)`` (a module-level function, so workers can unpickle it) at ``priority``.
+
+        With ``block=False`` an indexing job is refused with :class:`QueueFull` rather than wait for room.
+        """
+        future = Future()
+        with self.lock:
+            if self._closed:
+                raise RuntimeError("render farm is shut down")
+            self._start()
+            if (priority == PREFETCH or not block) and len(self._heap) >= self.limit:
+                self.refused += 1
+                error(f"farm.{PRIORITY_NAMES[priority]}")
+                raise QueueFull(f"{len(self._heap)} render jobs waiting")
+            while priority == INDEXING and len(self._heap) >= self.limit:
+                self._room.wait()
+            heapq.heappush(self._heap, (priority, next(self._seq), time.perf_counter(), future, fn, args))
+            self._work.notify()
+        return future
+
+    def call(self, priority, fn, *args):
+        """``fn(*args)`` run by a worker at ``priority``; waits for the result."""
+        return self.submit(priority, fn, *args).result()
+
+    def _runnable(self) -> bool:
+        # caller holds self.lock; indexing sorts last, so an indexing job on top means nothing else waits
+        return bool(self._heap) and (self._heap[0][0] != INDEXING or self.running_indexing < self.indexing)
+
+    def _dispatch(self):
+        metrics = get_metrics()
+        while True:
+            with self.lock:
+                while not self._runnable():
+                    if self._closed:
+                        return
+                    self._work.wait()
+                priority, _, queued_at, future, fn, args = heapq.heappop(self._heap)
+                self._room.notify()
+                procs = self._procs
+                if priority == INDEXING:
+                    self.running_indexing += 1
+            if not future.set_running_or_notify_cancel():
+                self._finished(priority)
+                continue
+            name = PRIORITY_NAMES[priority]
+            started = time.perf_counter()
+            metrics.observe(f"farm.{name}.wait", started - queued_at)
+            with self.lock:
+                self.running += 1
+            try:
+                result = procs.submit(fn, *args).result() if procs is not None else fn(*args)
+            except BrokenProcessPool as e:
+                # a worker died (e.g. MuPDF crashed on a bad file); replace the pool for later jobs
+                with self.lock:
+                    if self._procs is procs:
+                        self._procs = self._new_pool()
+                future.set_exception(e)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            finally:
+                with self.lock:
+                    self.running -= 1
+                    self.completed += 1
+                self._finished(priority)
+            metrics.observe(f"farm.{name}", time.perf_counter() - queued_at, future.exception() is not None)
+
+    def _finished(self, priority):
+        if priority == INDEXING:
+            with self.lock:
+                self.running_indexing -= 1
+                self._work.notify()  # a held-back indexing job may run now
+
+    def shutdown(self):
+        """Cancel the jobs still queued, let the running ones finish and stop the workers."""
+        with self.lock:
+            self._closed = True
+            for _, _, _, future, _, _ in self._heap:
+                future.cancel()
+            self._heap.clear()
+            self._work.notify_all()
+            self._room.notify_all()
+            dispatchers, procs = self._dispatchers, self._procs
+        for thread in dispatchers:
+            thread.join()
+        if procs is not None:
+            procs.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'workers': self.workers,
+                'indexing': self.indexing,
+                'processes': self.processes,
+                'queued': len(self._heap),
+                'running': self.running,
+                'running_indexing': self.running_indexing,
+                'completed': self.completed,
+                'refused': self.refused,
+            }
+
+
+_farm = None
+_farm_lock = threading.Lock()
+
+
+def get_render_farm() -> RenderFarm:
+    global _farm
+    with _farm_lock:
+        if _farm is None:
+            _farm = RenderFarm()
+        return _farm
@@ -0,0 +1,38 @@
+"""Daily, weekly and monthly reading totals.
+
+Every logged session is appended to the store's session log and added to
+three rollup buckets: its day, its ISO week and its month. A dashboard
+read is therefore three key lookups, however long the history grows.
+Buckets are named after the period they cover (``2025-11-12``,
+``2025-W46``, ``2025-11``, server local time). A new period simply has no
+bucket yet and reads as zero, so nothing ever needs resetting.
+"""
+import time
+from datetime import date
+
+PERIODS = ('day', 'week', 'month')
+FIELDS = ('pages', 'minutes', 'points', 'sessions')
+
+
+def bucket_keys(ts=None) -> dict:
+    """{period: bucket} for the periods containing timestamp ``ts`` (default: now)."""
+    t = time.localtime(ts)
+    year, week, _ = date(t.tm_year, t.tm_mon, t.tm_mday).isocalendar()
+    return {'day': time.strftime('%Y-%m-%d', t), 'week': f"{year}-W{week:02d}", 'month': time.strftime('%Y-%m', t)}
+
+
+def empty_rollup() -> dict:
+    return dict.fromkeys(FIELDS, 0)
+
+
+def aggregate(events) -> dict:
+    """Fold (username, logged_at, pages, minutes, points) events into {(username, period, bucket): rollup}."""
+    buckets = {}
+    for username, logged_at, pages, minutes, points in events:
+        for period, bucket in bucket_keys(logged_at).items():
+            r = buckets.setdefault((username, period, bucket), empty_rollup())
+            r['pages'] += pages
+            r['minutes'] += minutes
+            r['points'] += points
+            r['sessions'] += 1
+    return buckets
@@ -0,0 +1,131 @@
+"""Full-text search over the pages of every stored PDF.
+
+Page text lives in an SQLite FTS5 table, one row per page, keyed by blob
+digest like the other artifacts. A booklet owned by a whole class is
+therefore indexed once. A search covers only the digests of the caller's
+own books and is ranked by BM25. The ingestion workers add documents, and
+a document is dropped when the last book using it is deleted. SQLite
+builds without FTS5 fall back to a plain table searched with LIKE.
+"""
+import html
+import re
+import sqlite3
+import threading
+
+from .metrics import timed
+from .pdfdocs import open_pdf
+
+SNIPPET_TOKENS = 12
+_START, _END = '\x02', '\x03'  # hit markers, swapped for <mark> tags after escaping
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS page_text USING fts5(
+    body, digest UNINDEXED, page UNINDEXED, tokenize='unicode61 remove_diacritics 2'
+);
+"""
+PLAIN_SCHEMA = """
+CREATE TABLE IF NOT EXISTS page_text (body TEXT, digest TEXT NOT NULL, page INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS page_text_by_digest ON page_text(digest);
+"""
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS indexed_documents (
+    digest TEXT PRIMARY KEY,
+    pages INTEGER NOT NULL
+);
+"""
+
+
+def page_texts(pdf_path) -> list:
+    """The text of every page, in order."""
+    with open_pdf(pdf_path) as doc, timed('pdf.text'):
+        return [page.get_text("text") or "" for page in doc]
+
+
+def _highlight(snippet) -> str:
+    return html.escape(' '.join(snippet.split())).replace(_START, '<mark>').replace(_END, '</mark>')
+
+
+class SearchIndex:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+            try:
+                conn.executescript(FTS_SCHEMA)
+                self.fts = True
+            except sqlite3.OperationalError:
+                conn.executescript(PLAIN_SCHEMA)
+                self.fts = False
+
+    def _conn(self):
+        # sqlite3 connections must stay on the thread that made them
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def has(self, digest) -> bool:
+        return self._conn().execute("SELECT 1 FROM indexed_documents WHERE digest = ?", (digest,)).fetchone() is not None
+
+    def add(self, digest, texts):
+        """(Re)index a document from its page texts."""
+        with self._conn() as conn:
+            conn.execute("DELETE FROM page_text WHERE digest = ?", (digest,))
+            conn.executemany("INSERT INTO page_text(body, digest, page) VALUES (?, ?, ?)",
+                             ((text, digest, page) for page, text in enumerate(texts) if text.strip()))
+            conn.execute("INSERT OR REPLACE INTO indexed_documents(digest, pages) VALUES (?, ?)", (digest, len(texts)))
+
+    def remove(self, digest):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM page_text WHERE digest = ?", (digest,))
+            conn.execute("DELETE FROM indexed_documents WHERE digest = ?", (digest,))
+
+    def search(self, query, digests, limit=20) -> list:
+        """Best matches of ``query`` within ``digests``: [(digest, page, snippet_html), ...].
+
+        The snippet is HTML-escaped, with the matched terms wrapped in ``<mark>``.
+        """
+        words = re.findall(r'\w+', query)
+        digests = [d for d in digests if d]
+        if not words or not digests:
+            return []
+        marks = ','.join('?' * len(digests))
+        if self.fts:
+            # every word must appear; the last one may still be being typed
+            match = ' '.join(f'"{w}"' for w in words) + '*'
+            rows = self._conn().execute(
+                f"SELECT digest, page, snippet(page_text, 0, ?, ?, '…', ?) FROM page_text "
+                f"WHERE page_text MATCH ? AND digest IN ({marks}) ORDER BY rank LIMIT ?",
+                (_START, _END, SNIPPET_TOKENS, match, *digests, limit)).fetchall()
+            return [(d, p, _highlight(s)) for d, p, s in rows]
+        where = ' AND '.join(['body LIKE ?'] * len(words))
+        rows = self._conn().execute(
+            f"SELECT digest, page, body FROM page_text WHERE {where} AND digest IN ({marks})",
+            (*(f'%{w}%' for w in words), *digests)).fetchall()
+        lowered = [w.casefold() for w in words]
+        rows.sort(key=lambda r: -sum(r[2].casefold().count(w) for w in lowered))
+        return [(d, p, self._snippet(body, lowered[0])) for d, p, body in rows[:limit]]
+
+    @staticmethod
+    def _snippet(body, word):
+        at = body.casefold().find(word)
+        start = max(0, at - 60)
+        text = body[start:at] + _START + body[at:at + len(word)] + _END + body[at + len(word):at + len(word) + 60]
+        return _highlight(('…' if start else '') + text + '…')
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(path) -> SearchIndex:
+    """One index object per database file and process."""
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = SearchIndex(path)
+        return index
@@ -0,0 +1,268 @@
+"""Reading-session points, pace checks and bulk import.
+
+The Read page logs one session at a time. E-reader exports and classroom
+spreadsheets are backfilled with :func:`import_sessions` instead, or from
+the command line::
+
+    python -m readvibe.sessions sessions.csv [--db users.db] [--store sqlite|json] [--dry-run] [--strict]
+
+Input is CSV (with a header row) or JSON Lines, one session per row with
+the columns ``user, book, start_page, end_page, minutes, timestamp``.
+
+- ``book`` is a book id or title of that user's library.
+- Pages are numbered as on the Read page (first page 1, ``end_page - start_page`` pages read).
+- ``timestamp`` is Unix seconds or an ISO 8601 date/time (local time unless it has an offset). Empty means now.
+
+Rows are checked together. The page statistics of each book are loaded
+once, and all of its ranges are estimated in one vectorized call (see
+:meth:`readvibe.pagestats.PageStats.ranges_minutes`). They go through the
+same pace rule as the Read page. Points come from :func:`calc_points`, and
+every accepted row is written in one store transaction.
+
+A running app keeps its user records in memory. Pass its ``records`` to
+publish the new totals, or restart it after a command-line import. Stop
+the app before importing into the ``json`` store, which is only written by
+the process that holds it.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from .pagestats import estimate_minutes, load_page_stats
+
+COLUMNS = ('user', 'book', 'start_page', 'end_page', 'minutes', 'timestamp')
+# actual / estimated minutes accepted as a realistic pace
+MIN_PACE_RATIO = 1.0
+MAX_PACE_RATIO = 3.0
+
+
+def calc_points(pages, minutes):
+    points = (pages // 10) * 5
+    if minutes >= 20: points += 15
+    elif minutes >= 10: points += 8
+    if minutes >= 30: points += 20
+    return points
+
+
+def _realistic_speed(start_page, end_page, minutes):
+    if minutes < 2:
+        return False
+    speed = (end_page - start_page) / minutes
+    return 0.3 <= speed <= 0.7
+
+
+def is_realistic(book_pdf_path, start_page, end_page, minutes, user_wpm=None, build=None):
+    """Validate reading speed by estimating time for the range and comparing to actual time spent.
+    Uses word count estimation for more accuracy.
+
+    ``build`` is as for :func:`readvibe.pagestats.load_page_stats`; until the book's statistics
+    are built, the simple speed check is used.
+    """
+    if minutes < 1:
+        return False
+    try:
+        # Estimate total time for reading this page range (prefix sums over the book's page stats)
+        total_estimated_minutes = 0
+        if isinstance(book_pdf_path, str) and os.path.exists(book_pdf_path):
+            total_estimated_minutes = estimate_minutes(book_pdf_path, [(start_page, end_page)], wpm=user_wpm, build=build)
+            if total_estimated_minutes is None:
+                return _realistic_speed(start_page, end_page, minutes)
+        
+        if total_estimated_minutes == 0:
+            return True  # fallback if estimation fails
+        
+        # Check if actual time is within reasonable bounds (1x to 3x estimated time)
+        # This allows for slower reading, breaks, and distractions
+        ratio = minutes / total_estimated_minutes
+        return MIN_PACE_RATIO <= ratio <= MAX_PACE_RATIO
+    except Exception:
+        # Fallback to simple speed check if word-count estimation fails
+        return _realistic_speed(start_page, end_page, minutes)
+
+
+def realistic_mask(stats, starts, ends, minutes, wpm=None):
+    """``is_realistic`` for many [start, end) ranges of one book at once, as a boolean array.
+
+    ``stats`` is the book's :class:`PageStats`; without any (None) only the minimum time is checked.
+    """
+    import numpy as np
+
+    minutes = np.asarray(minutes, dtype=np.float64)
+    if stats is None:
+        return minutes >= 1
+    estimated = stats.ranges_minutes(starts, ends, wpm)
+    ratio = np.divide(minutes, estimated, out=np.zeros_like(minutes), where=estimated > 0)
+    return (minutes >= 1) & ((estimated == 0) | ((ratio >= MIN_PACE_RATIO) & (ratio <= MAX_PACE_RATIO)))
+
+
+def speed_mask(starts, ends, minutes):
+    """The pages-per-minute fallback ``is_realistic`` uses when a book's pages cannot be estimated, as a boolean array."""
+    import numpy as np
+
+    minutes = np.asarray(minutes, dtype=np.float64)
+    speed = (np.asarray(ends) - np.asarray(starts)) / np.maximum(minutes, 1)
+    return (minutes >= 2) & (speed >= 0.3) & (speed <= 0.7)
+
+
+def read_rows(path):
+    """Yield one dict per session from a CSV or JSON Lines (``.jsonl``/``.ndjson``) file."""
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if os.path.splitext(path)[1].lower() in ('.jsonl', '.ndjson'):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def parse_timestamp(value, now=None) -> float:
+    if value is None or str(value).strip() == '':
+        return now or time.time()
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+def _number(value):
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.points = 0
+        self.users = set()
+        self.rejected = []  # (row number, reason), rows numbered from 1
+
+    def reject(self, row, reason):
+        self.rejected.append((row, reason))
+
+
+def _library(books) -> dict:
+    """{book id or case-folded title: book}; the first book with a title wins."""
+    index = {}
+    for b in books:
+        index.setdefault((b.get('title') or '').strip().casefold(), b)
+    index.update((str(b.get('id')), b) for b in books)
+    return index
+
+
+def import_sessions(store, rows, records=None, dry_run=False, strict=False) -> ImportReport:
+    """Validate ``rows`` (dicts with :data:`COLUMNS`) and log the valid ones in a single transaction.
+
+    ``dry_run`` only validates. ``strict`` imports nothing if any row is rejected.
+    Rejected rows and their reasons are listed in the returned report.
+    """
+    import numpy as np
+
+    report = ImportReport()
+    now = time.time()
+    libraries = {}  # username -> (book index, wpm), or None for unknown users
+    parsed = []  # (row number, username, book, start_page, end_page, minutes, logged_at)
+    for number, row in enumerate(rows, 1):
+        report.rows += 1
+        try:
+            username = str(row['user']).strip()
+            start_page, end_page = int(row['start_page']), int(row['end_page'])
+            minutes = _number(row['minutes'])
+            logged_at = parse_timestamp(row.get('timestamp'), now)
+            book_ref = row['book']
+        except (KeyError, TypeError, ValueError) as e:
+            report.reject(number, f"unreadable row: {e}")
+            continue
+        if username not in libraries:
+            rec = store.get_user(username) if username and not username.startswith('_') else None
+            libraries[username] = (_library(rec['data'].get('books', [])), rec['data'].get('wpm') or 0) if rec else None
+        if libraries[username] is None:
+            report.reject(number, f"unknown user {username!r}")
+            continue
+        books, ref = libraries[username][0], str(book_ref).strip()
+        book = books.get(ref) or books.get(ref.casefold())
+        if book is None:
+            report.reject(number, f"unknown book {book_ref!r}")
+            continue
+        if end_page <= start_page or minutes <= 0:
+            report.reject(number, "no pages or minutes read")
+            continue
+        if start_page < 1 or (book.get('pages') and end_page > book['pages']):
+            report.reject(number, f"pages outside 1-{book.get('pages')}")
+            continue
+        parsed.append((number, username, book, start_page, end_page, minutes, logged_at))
+
+    by_pdf = {}  # pdf path -> positions in ``parsed``
+    for i, (_, _, book, *_) in enumerate(parsed):
+        by_pdf.setdefault(book.get('pdf_path'), []).append(i)
+    realistic = np.zeros(len(parsed), dtype=bool)
+    for pdf_path, positions in by_pdf.items():
+        starts = np.array([parsed[i][3] - 1 for i in positions])
+        ends = np.array([parsed[i][4] for i in positions])
+        minutes = np.array([parsed[i][5] for i in positions], dtype=np.float64)
+        wpm = np.array([libraries[parsed[i][1]][1] for i in positions], dtype=np.float64)
+        try:
+            stats = load_page_stats(pdf_path) if isinstance(pdf_path, str) and os.path.exists(pdf_path) else None
+            realistic[positions] = realistic_mask(stats, starts, ends, minutes, wpm)
+        except Exception:
+            realistic[positions] = speed_mask(starts, ends, minutes)
+
+    sessions = []
+    for ok, (number, username, book, start_page, end_page, minutes, logged_at) in zip(realistic, parsed):
+        if not ok:
+            report.reject(number, "unrealistic reading pace")
+            continue
+        points = calc_points(end_page - start_page, minutes)
+        sessions.append((username, book['id'], start_page, end_page, minutes, points, logged_at))
+        report.points += points
+        report.users.add(username)
+    report.rejected.sort()
+    if dry_run or (strict and report.rejected):
+        return report
+    report.imported = store.log_sessions(sessions)
+    if records is not None:
+        for username in report.users:
+            records.refresh(username)
+    return report
+
+
+def main(argv=None):
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(prog='python -m readvibe.sessions', description="Bulk-import reading sessions.")
+    parser.add_argument('file', help="CSV or JSON Lines file with columns " + ', '.join(COLUMNS))
+    parser.add_argument('--store', choices=('sqlite', 'json'), default=os.environ.get('READVIBE_STORE', 'sqlite'))
+    parser.add_argument('--db', help="users.db (sqlite) or users.json (json); defaults to the app's")
+    parser.add_argument('--dry-run', action='store_true', help="validate only")
+    parser.add_argument('--strict', action='store_true', help="import nothing if any row is rejected")
+    args = parser.parse_args(argv)
+
+    from .store import get_user_store
+    db = args.db or os.path.join(app_dir, 'users.json' if args.store == 'json' else 'users.db')
+    store = get_user_store(db, args.store)
+    started = time.perf_counter()
+    report = import_sessions(store, read_rows(args.file), dry_run=args.dry_run, strict=args.strict)
+    elapsed = time.perf_counter() - started
+    for number, reason in report.rejected[:50]:
+        print(f"row {number}: {reason}", file=sys.stderr)
+    if len(report.rejected) > 50:
+        print(f"... and {len(report.rejected) - 50} more rejected rows", file=sys.stderr)
+    valid = report.rows - len(report.rejected)
+    if args.dry_run:
+        print(f"{valid} of {report.rows} sessions are valid ({len(report.rejected)} rejected) in {elapsed:.2f}s")
+    elif args.strict and report.rejected:
+        print(f"nothing imported: {len(report.rejected)} of {report.rows} sessions rejected")
+    else:
+        print(f"imported {report.imported} of {report.rows} sessions for {len(report.users)} users "
+              f"(+{report.points} points, {len(report.rejected)} rejected) in {elapsed:.2f}s")
+    return 1 if report.rejected and (args.strict or not valid) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,374 @@
+"""Per-row persistence for accounts, books and reading sessions.
+
+``users.json`` used to be rewritten in full on every change. The store keeps
+one row per user, one per book and one per logged reading session in SQLite
+(WAL mode, so readers never block the writer), and every app action is a
+single small transaction.
+Each session also updates its day, week and month rollup rows (see
+:mod:`readvibe.rollups`) in the same transaction, and a bulk import
+(:meth:`SQLiteUserStore.log_sessions`) is one transaction for all its rows.
+
+Records are handed out in the legacy ``users.json`` layout::
+
+    {'password': ..., 'data': {'books': [...], 'stats': {...}, 'wpm': ..., 'goals': {...}, ...}}
+
+so the UI code did not have to change shape; books additionally carry their
+row ``id``.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .rollups import PERIODS, aggregate, bucket_keys, empty_rollup
+
+STAT_FIELDS = ('total_pages', 'total_time', 'points', 'weekly_pages', 'monthly_pages')
+BOOK_FIELDS = ('title', 'author', 'pages', 'current_page', 'pages_read', 'pdf_path', 'cover_path', 'sha256', 'status')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    total_pages INTEGER NOT NULL DEFAULT 0,
+    total_time INTEGER NOT NULL DEFAULT 0,
+    points INTEGER NOT NULL DEFAULT 0,
+    weekly_pages INTEGER NOT NULL DEFAULT 0,
+    monthly_pages INTEGER NOT NULL DEFAULT 0,
+    settings TEXT NOT NULL DEFAULT '{}',
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL REFERENCES users(username) ON DELETE CASCADE,
+    title TEXT,
+    author TEXT,
+    pages INTEGER,
+    current_page INTEGER NOT NULL DEFAULT 0,
+    pages_read INTEGER NOT NULL DEFAULT 0,
+    pdf_path TEXT,
+    cover_path TEXT,
+    sha256 TEXT,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS books_by_user ON books(username, id);
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    refcount INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS reading_sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL REFERENCES users(username) ON DELETE CASCADE,
+    book_id INTEGER,
+    start_page INTEGER NOT NULL,
+    end_page INTEGER NOT NULL,
+    pages INTEGER NOT NULL,
+    minutes INTEGER NOT NULL,
+    points INTEGER NOT NULL,
+    logged_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_by_user ON reading_sessions(username, logged_at);
+CREATE TABLE IF NOT EXISTS reading_rollups (
+    username TEXT NOT NULL REFERENCES users(username) ON DELETE CASCADE,
+    period TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    pages INTEGER NOT NULL DEFAULT 0,
+    minutes INTEGER NOT NULL DEFAULT 0,
+    points INTEGER NOT NULL DEFAULT 0,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (username, period, bucket)
+) WITHOUT ROWID;
+"""
+
+
+class ImportConflict(ValueError):
+    """A legacy account's username is taken by a different account."""
+
+
+def empty_stats() -> dict:
+    return {k: 0 for k in STAT_FIELDS}
+
+
+class SQLiteUserStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            self._add_missing_columns(conn)
+            conn.executescript(SCHEMA)
+
+    @staticmethod
+    def _add_missing_columns(conn):
+        # databases created by older releases
+        cols = {r[1] for r in conn.execute("PRAGMA table_info(books)")}
+        for name in ('sha256', 'status'):
+            if cols and name not in cols:
+                conn.execute(f"ALTER TABLE books ADD COLUMN {name} TEXT")
+        cols = {r[1] for r in conn.execute("PRAGMA table_info(users)")}
+        if cols and 'version' not in cols:
+            conn.execute("ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    def _conn(self):
+        # sqlite3 connections must stay on the thread that made them
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    # ---- meta ----
+    def get_meta(self, key, default=None):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row['value']) if row else default
+
+    def set_meta(self, key, value):
+        with self._conn() as conn:
+            conn.execute("INSERT INTO meta(key, value) VALUES (?, ?) "
+                         "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, json.dumps(value)))
+
+    # ---- users ----
+    def _record(self, row):
+        data = json.loads(row['settings'] or '{}')
+        data['stats'] = {k: row[k] for k in STAT_FIELDS}
+        data['books'] = self.get_books(row['username'])
+        data['version'] = row['version']
+        return {'password': row['password'], 'data': data}
+
+    def get_user(self, username):
+        row = self._conn().execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
+        return self._record(row) if row else None
+
+    def has_user(self, username) -> bool:
+        return self._conn().execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone() is not None
+
+    def create_user(self, username, password_hash, data=None):
+        """Insert a new account from a legacy-layout ``data`` dict; False if the name is taken."""
+        data = dict(data or {})
+        stats = {**empty_stats(), **(data.pop('stats', None) or {})}
+        books = data.pop('books', None) or []
+        try:
+            with self._conn() as conn:
+                conn.execute(
+                    "INSERT INTO users(username, password, total_pages, total_time, points, weekly_pages, monthly_pages, settings) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (username, password_hash, *(int(stats[k] or 0) for k in STAT_FIELDS), json.dumps(data, ensure_ascii=False)))
+                for b in books:
+                    self._insert_book(conn, username, b)
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def update_settings(self, username, **fields):
+        """Merge profile settings (wpm, goals, name, country, ...) into the user's row."""
+        with self._conn() as conn:
+            row = conn.execute("SELECT settings FROM users WHERE username = ?", (username,)).fetchone()
+            if row is None:
+                return
+            settings = json.loads(row['settings'] or '{}')
+            settings.update(fields)
+            conn.execute("UPDATE users SET settings = ? WHERE username = ?",
+                         (json.dumps(settings, ensure_ascii=False), username))
+
+    def load_all(self) -> dict:
+        """Every user in the legacy ``users.json`` layout, plus ``_last_user``."""
+        users = {row['username']: self._record(row) for row in self._conn().execute("SELECT * FROM users")}
+        users['_last_user'] = self.get_meta('_last_user')
+        return users
+
+    @staticmethod
+    def _bump(conn, username):
+        # the user's books or reading totals changed; lets derived views (charts) know they are stale
+        conn.execute("UPDATE users SET version = version + 1 WHERE username = ?", (username,))
+
+    def leaderboard_rows(self):
+        """(username, points, total_pages) for every user."""
+        return [tuple(r) for r in self._conn().execute("SELECT username, points, total_pages FROM users")]
+
+    # ---- books ----
+    @staticmethod
+    def _book(row) -> dict:
+        return {'id': row['id'], **{k: row[k] for k in BOOK_FIELDS}}
+
+    def get_books(self, username) -> list:
+        rows = self._conn().execute("SELECT * FROM books WHERE username = ? ORDER BY id", (username,))
+        return [self._book(r) for r in rows]
+
+    @staticmethod
+    def _ref_blob(conn, digest, delta):
+        if not digest:
+            return None
+        conn.execute("INSERT INTO blobs(digest, refcount) VALUES (?, ?) "
+                     "ON CONFLICT(digest) DO UPDATE SET refcount = refcount + excluded.refcount", (digest, delta))
+        return conn.execute("SELECT refcount FROM blobs WHERE digest = ?", (digest,)).fetchone()[0]
+
+    def _insert_book(self, conn, username, book):
+        cur = conn.execute(
+            "INSERT INTO books(username, title, author, pages, current_page, pages_read, pdf_path, cover_path, sha256, status) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (username, book.get('title'), book.get('author'), book.get('pages'), book.get('current_page') or 0,
+             book.get('pages_read') or 0, book.get('pdf_path'), book.get('cover_path'), book.get('sha256'),
+             book.get('status')))
+        self._ref_blob(conn, book.get('sha256'), 1)
+        return cur.lastrowid
+
+    def add_book(self, username, book) -> dict:
+        """Insert a book for ``username`` and return it with its new ``id``."""
+        with self._conn() as conn:
+            book_id = self._insert_book(conn, username, book)
+            self._bump(conn, username)
+        return {**book, 'id': book_id}
+
+    def update_book(self, username, book_id, **fields):
+        fields = {k: v for k, v in fields.items() if k in BOOK_FIELDS}
+        if not fields:
+            return
+        with self._conn() as conn:
+            if 'sha256' in fields:
+                row = conn.execute("SELECT sha256 FROM books WHERE id = ? AND username = ?", (book_id, username)).fetchone()
+                if row is None:
+                    return
+                if row['sha256'] != fields['sha256']:
+                    self._ref_blob(conn, row['sha256'], -1)
+                    self._ref_blob(conn, fields['sha256'], 1)
+            conn.execute(f"UPDATE books SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ? AND username = ?",
+                         (*fields.values(), book_id, username))
+            self._bump(conn, username)
+
+    def delete_book(self, username, book_id):
+        """Delete a book; returns how many books still reference its PDF blob (None for legacy books)."""
+        with self._conn() as conn:
+            row = conn.execute("SELECT sha256 FROM books WHERE id = ? AND username = ?", (book_id, username)).fetchone()
+            conn.execute("DELETE FROM books WHERE id = ? AND username = ?", (book_id, username))
+            self._bump(conn, username)
+            return self._ref_blob(conn, row['sha256'], -1) if row else None
+
+    def blob_refs(self, digest) -> int:
+        row = self._conn().execute("SELECT refcount FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        return row['refcount'] if row else 0
+
+    def iter_books(self, after_id=0, batch=500):
+        """Yield (username, book) for every book with ``id > after_id``, in id order."""
+        while True:
+            rows = self._conn().execute("SELECT * FROM books WHERE id > ? ORDER BY id LIMIT ?",
+                                        (after_id, batch)).fetchall()
+            if not rows:
+                return
+            for r in rows:
+                yield r['username'], self._book(r)
+            after_id = rows[-1]['id']
+
+    # ---- reading sessions ----
+    def log_session(self, username, book_id, start_page, end_page, minutes, points, logged_at=None):
+        """Record one reading session and apply it to the book's progress, the user's totals and rollups."""
+        self.log_sessions([(username, book_id, start_page, end_page, minutes, points, logged_at or time.time())])
+
+    def log_sessions(self, sessions) -> int:
+        """Record many sessions, given as (username, book_id, start_page, end_page, minutes, points, logged_at)
+        tuples, in a single transaction.
+
+        Sessions are applied in ``logged_at`` order, so a book ends up on the end page of its latest one.
+        Returns the number of sessions recorded.
+        """
+        sessions = sorted(sessions, key=lambda s: s[6])
+        books, users = {}, {}  # (username, book_id) -> [current_page, pages]; username -> [pages, minutes, points]
+        for username, book_id, start_page, end_page, minutes, points, _ in sessions:
+            book = books.setdefault((username, book_id), [0, 0])
+            book[0] = end_page
+            book[1] += end_page - start_page
+            totals = users.setdefault(username, [0, 0, 0])
+            totals[0] += end_page - start_page
+            totals[1] += minutes
+            totals[2] += points
+        buckets = aggregate((u, at, end - start, minutes, points) for u, _, start, end, minutes, points, at in sessions)
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT INTO reading_sessions(username, book_id, start_page, end_page, pages, minutes, points, logged_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                ((u, b, start, end, end - start, minutes, points, at) for u, b, start, end, minutes, points, at in sessions))
+            conn.executemany(
+                "INSERT INTO reading_rollups(username, period, bucket, pages, minutes, points, sessions) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(username, period, bucket) DO UPDATE SET "
+                "pages = pages + excluded.pages, minutes = minutes + excluded.minutes, "
+                "points = points + excluded.points, sessions = sessions + excluded.sessions",
+                [(*key, r['pages'], r['minutes'], r['points'], r['sessions']) for key, r in buckets.items()])
+            conn.executemany("UPDATE books SET current_page = ?, pages_read = pages_read + ? WHERE id = ? AND username = ?",
+                             [(current, pages, book_id, u) for (u, book_id), (current, pages) in books.items()])
+            conn.executemany("UPDATE users SET total_pages = total_pages + ?, total_time = total_time + ?, points = points + ?, "
+                             "weekly_pages = weekly_pages + ?, monthly_pages = monthly_pages + ?, version = version + 1 "
+                             "WHERE username = ?",
+                             [(pages, minutes, points, pages, pages, u) for u, (pages, minutes, points) in users.items()])
+        return len(sessions)
+
+    def get_rollups(self, username, ts=None) -> dict:
+        """{period: {pages, minutes, points, sessions}} for the day, week and month containing ``ts``."""
+        keys = bucket_keys(ts)
+        rollups = {period: empty_rollup() for period in PERIODS}
+        rows = self._conn().execute(
+            "SELECT * FROM reading_rollups WHERE username = ? AND bucket IN (?, ?, ?)",
+            (username, *keys.values()))
+        for row in rows:
+            if keys.get(row['period']) == row['bucket']:
+                rollups[row['period']] = {k: row[k] for k in rollups[row['period']]}
+        return rollups
+
+    def day_series(self, username, since) -> dict:
+        """{day bucket: pages} for the days from ``since`` (a day bucket, e.g. '2025-01-31') on."""
+        rows = self._conn().execute(
+            "SELECT bucket, pages FROM reading_rollups WHERE username = ? AND period = 'day' AND bucket >= ? ORDER BY bucket",
+            (username, since))
+        return {r['bucket']: r['pages'] for r in rows}
+
+    def rebuild_rollups(self) -> int:
+        """Recompute every rollup bucket from the session log; returns the number of buckets."""
+        with self._conn() as conn:
+            buckets = aggregate(conn.execute("SELECT username, logged_at, pages, minutes, points FROM reading_sessions"))
+            conn.execute("DELETE FROM reading_rollups")
+            conn.executemany(
+                "INSERT INTO reading_rollups(username, period, bucket, pages, minutes, points, sessions) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(*key, r['pages'], r['minutes'], r['points'], r['sessions']) for key, r in buckets.items()])
+        return len(buckets)
+
+    # ---- legacy import ----
+    def import_legacy(self, users: dict) -> int:
+        """Import accounts from a ``users.json`` dict (its books already moved by ``migrate_user_books``).
+
+        An account that already exists with the same password was imported before (e.g. by an
+        interrupted run) and is left untouched; one with another password raises :class:`ImportConflict`.
+        Returns the number of users imported.
+        """
+        imported = 0
+        for username, rec in users.items():
+            if username.startswith('_') or not isinstance(rec, dict):
+                continue
+            if self.create_user(username, rec.get('password') or '', rec.get('data') or {}):
+                imported += 1
+            elif self.get_user(username)['password'] != (rec.get('password') or ''):
+                raise ImportConflict(f"username {username!r} is taken by a different account")
+        return imported
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_user_store(path, backend='sqlite'):
+    """The process-wide store: ``'sqlite'`` (``path`` is the database) or
+    ``'json'`` (``path`` is ``users.json``, see :mod:`readvibe.jsonstore`)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            if backend == 'json':
+                from .jsonstore import JournaledJsonStore
+                _store = JournaledJsonStore(path)
+            else:
+                _store = SQLiteUserStore(path)
+        return _store
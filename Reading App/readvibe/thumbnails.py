@@ -0,0 +1,100 @@
+"""Cover thumbnails.
+
+Covers used to be page 0 rendered at 2x and saved as a full-size PNG, which
+the Library then sent to the browser for every book on every rerun. Now the
+first page is rendered straight at the pixel width it is shown at and saved
+next to the blob it came from::
+
+    <blobs>/<digest[:2]>/<digest>.cover-grid.jpg
+    <blobs>/<digest[:2]>/<digest>.cover-detail.webp
+
+They are named after the blob's digest, so identical uploads share their
+thumbnails and they go when the blob does.
+
+The grid cover is JPEG: ``st.image`` serves JPEG by URL, which the browser
+caches across reruns, while WebP could only go inline as base64, a third
+larger and sent again on every rerun. Other sizes are WebP (JPEG if Pillow
+was built without WebP).
+"""
+import os
+import threading
+from functools import lru_cache, partial
+
+from .pdfdocs import open_pdf
+from .pdfpages import encode_pixmap
+
+# width in pixels; the grid shows three covers a row, about twice their CSS width for sharp HiDPI screens
+SIZES = {'grid': 320, 'detail': 800}
+# sizes shown many at a time on every rerun, in a format st.image serves as is
+FORMATS = {'grid': 'jpg'}
+QUALITY = int(os.environ.get('READVIBE_THUMB_QUALITY', '80'))
+
+
+def _webp_supported() -> bool:
+    try:
+        from PIL import features
+        return bool(features.check('webp'))
+    except Exception:
+        return False
+
+
+@lru_cache(maxsize=None)
+def thumbnail_format() -> str:
+    """``webp``, or ``jpg`` without WebP support; checked on first use since it imports Pillow."""
+    return os.environ.get('READVIBE_THUMB_FORMAT') or ('webp' if _webp_supported() else 'jpg')
+
+
+def size_format(size) -> str:
+    return FORMATS.get(size) or thumbnail_format()
+
+
+def thumbnail_name(size) -> str:
+    """Artifact name for :meth:`BlobStore.derived_path`, e.g. ``cover-detail.webp``."""
+    return f"cover-{size}.{size_format(size)}"
+
+
+def render_thumbnails(pdf_path, targets):
+    """Render page 0 once per size in ``targets`` ({size: path}), skipping ones already on disk."""
+    import fitz
+
+    missing = {size: path for size, path in targets.items() if not os.path.exists(path)}
+    if not missing:
+        return
+    with open_pdf(pdf_path) as doc:
+        page = doc[0]
+        for size, path in missing.items():
+            zoom = SIZES[size] / max(page.rect.width, 1)
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            data = encode_pixmap(pix, size_format(size), QUALITY)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+
+def thumbnail_targets(blobs, digest, sizes=SIZES) -> dict:
+    return {size: blobs.derived_path(digest, thumbnail_name(size)) for size in sizes}
+
+
+_rendering = {}  # cover path -> Future of its render
+_rendering_lock = threading.Lock()
+
+
+def render_cover(blobs, digest, pdf_path, submit, size='grid'):
+    """Have the ``size`` cover of a stored PDF rendered by ``submit(render_thumbnails, pdf_path, {size: path})``,
+    e.g. ``partial(farm.submit, VISIBLE)``; returns the render's Future, which everyone asking meanwhile shares."""
+    path = blobs.derived_path(digest, thumbnail_name(size))
+    with _rendering_lock:
+        future = _rendering.get(path)
+        if future is not None:
+            return future
+        future = _rendering[path] = submit(render_thumbnails, pdf_path, {size: path})
+    # outside the lock: a future that is already done runs the callback at once
+    future.add_done_callback(partial(_rendered, path))
+    return future
+
+
+def _rendered(path, future):
+    with _rendering_lock:
+        if _rendering.get(path) is future:
+            del _rendering[path]
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+# the app is run from its own directory (``streamlit run app.py``), so ``readvibe`` is imported from there
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def make_pdf(tmp_path):
+    """``make_pdf(name, texts)`` writes a PDF with one page per text and returns its path."""
+    def make(name, texts):
+        import fitz
+
+        path = str(tmp_path / name)
+        doc = fitz.open()
+        for text in texts:
+            doc.new_page().insert_textbox(fitz.Rect(36, 36, 559, 806), text, fontsize=10)
+        doc.save(path)
+        doc.close()
+        return path
+    return make
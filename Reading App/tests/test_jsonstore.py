@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from readvibe.jsonstore import JournaledJsonStore
+
+
+def journal_seqs(store):
+    with open(store.journal_path, encoding='utf-8') as f:
+        return [json.loads(line)['seq'] for line in f]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JournaledJsonStore(str(tmp_path / 'users.json'))
+    store.create_user('alice', 'hash')
+    store.add_book('alice', {'title': 'Dune', 'total_pages': 400, 'sha256': 'abc'})
+    return store
+
+
+def test_failing_mutation_leaves_the_journal_loadable(store):
+    seqs = journal_seqs(store)
+    with pytest.raises(KeyError):
+        store.log_session('ghost', 1, 0, 5, 5, 5)
+    assert journal_seqs(store) == seqs
+
+    store.update_book('alice', 1, current_page=10)
+    assert journal_seqs(store) == seqs + [seqs[-1] + 1]
+
+    reloaded = JournaledJsonStore(store.path)
+    assert reloaded.get_books('alice')[0]['current_page'] == 10
+
+
+def test_failing_batch_changes_nothing(store):
+    with pytest.raises(KeyError):
+        store.log_sessions([('alice', 1, 0, 20, 30, 20, 1.0), ('ghost', 1, 0, 5, 5, 5, 2.0)])
+    assert store.get_books('alice')[0]['pages_read'] == 0
+    assert store.get_user('alice')['data']['stats']['total_pages'] == 0
+
+
+def test_replay_after_crash(store):
+    store.log_session('alice', 1, 0, 12, 15, 12)
+    reloaded = JournaledJsonStore(store.path)
+    assert reloaded.get_books('alice')[0]['current_page'] == 12
+    assert reloaded.blob_refs('abc') == 1
+
+
+def test_torn_last_line_is_ignored(store):
+    with open(store.journal_path, 'a', encoding='utf-8') as f:
+        f.write('{"seq": 99, "op": "upd')
+    reloaded = JournaledJsonStore(store.path)
+    assert [b['title'] for b in reloaded.get_books('alice')] == ['Dune']
+    reloaded.update_book('alice', 1, current_page=7)
+    assert JournaledJsonStore(store.path).get_books('alice')[0]['current_page'] == 7
+
+
+def test_failing_record_is_set_aside_on_replay(store):
+    # e.g. written by an older version that journaled before applying
+    with open(store.journal_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'seq': store._seq + 1, 'op': 'update_book', 'user': 'ghost', 'id': 1, 'fields': {}}) + '\n')
+        f.write(json.dumps({'seq': store._seq + 2, 'op': 'update_book', 'user': 'alice', 'id': 1,
+                            'fields': {'current_page': 5}}) + '\n')
+    reloaded = JournaledJsonStore(store.path)
+    assert reloaded.get_books('alice')[0]['current_page'] == 5
+    with open(reloaded.rejected_path, encoding='utf-8') as f:
+        assert json.loads(f.read())['user'] == 'ghost'
+    assert JournaledJsonStore(store.path).get_books('alice')[0]['current_page'] == 5
+
+
+def logged_sessions(store):
+    with open(store.sessions_path, encoding='utf-8') as f:
+        return [s for line in f for s in json.loads(line)['sessions']]
+
+
+def test_session_log_outlives_compaction(store):
+    store.log_session('alice', 1, 0, 12, 15, 12, logged_at=1000.0)
+    store.log_sessions([('alice', 1, 12, 20, 10, 8, 2000.0)])
+    store.compact()
+    assert journal_seqs(store) == []
+    assert logged_sessions(store) == [['alice', 1, 0, 12, 15, 12, 1000.0], ['alice', 1, 12, 20, 10, 8, 2000.0]]
+
+
+def test_session_log_catches_up_after_crash(store):
+    store.log_session('alice', 1, 0, 12, 15, 12, logged_at=1000.0)
+    with open(store.sessions_path, 'a', encoding='utf-8') as f:
+        f.write('{"seq": 99, "sess')  # torn append
+    store.log_session('alice', 1, 12, 20, 10, 8, logged_at=2000.0)
+    # crash before the second record reached the session log
+    with open(store.sessions_path, 'rb') as f:
+        first = f.readline()
+    with open(store.sessions_path, 'wb') as f:
+        f.write(first + b'{"seq": 99, "sess')
+    reloaded = JournaledJsonStore(store.path)
+    assert [s[6] for s in logged_sessions(reloaded)] == [1000.0, 2000.0]
@@ -0,0 +1,61 @@
+import json
+import random
+
+from readvibe.leaderboard import Leaderboard, load_tiers, tier_for
+
+
+def test_ranks_share_ties_and_follow_updates():
+    board = Leaderboard()
+    board.load([('ann', 50, 10), ('bob', 80, 5), ('cy', 50, 30), ('dee', None, None)])
+    assert board.top(3) == [(1, 'bob', 80), (2, 'ann', 50), (2, 'cy', 50)]
+    assert [board.rank(u) for u in ('bob', 'ann', 'cy', 'dee')] == [1, 2, 2, 4]
+    assert board.rank('cy', by='pages') == 1
+    assert board.rank('nobody') is None
+
+    board.update('dee', 90, 1)
+    assert board.top(1) == [(1, 'dee', 90)]
+    assert board.rank('bob') == 2 and board.rank('ann') == 3
+    assert len(board) == 4
+
+
+def test_load_keeps_totals_written_meanwhile():
+    board = Leaderboard()
+    board.on_record('ann', {'data': {'stats': {'points': 70, 'total_pages': 7}}})
+    board.load([('ann', 10, 1), ('bob', 20, 2)])
+    assert board.totals('ann') == (70, 7)
+
+
+def test_tier_counts_at_the_boundaries():
+    board = Leaderboard()
+    points = [-5, 0, 200, 201, 500, 501, 1000, 1001, 99999]
+    board.load([(f"u{i}", p, 0) for i, p in enumerate(points)])
+    assert board.tier_counts() == {'Bronze': 3, 'Silver': 2, 'Gold': 2, 'Platinum': 2}
+    assert [tier_for(p)['name'] for p in (-5, 200, 201, 1001)] == ['Bronze', 'Bronze', 'Silver', 'Platinum']
+
+
+def test_ranks_and_counts_match_a_full_scan():
+    rnd = random.Random(0)
+    board = Leaderboard()
+    board.load([(f"u{i}", rnd.randint(0, 1500), rnd.randint(0, 100)) for i in range(300)])
+    for _ in range(500):
+        board.update(f"u{rnd.randrange(320)}", rnd.randint(0, 1500), rnd.randint(0, 100))
+    totals = {u: board.totals(u) for u in (f"u{i}" for i in range(320)) if board.totals(u)}
+    for u, (points, pages) in totals.items():
+        assert board.rank(u) == 1 + sum(1 for p, _ in totals.values() if p > points)
+        assert board.rank(u, by='pages') == 1 + sum(1 for _, n in totals.values() if n > pages)
+    expected = {}
+    for points, _ in totals.values():
+        name = tier_for(points)['name']
+        expected[name] = expected.get(name, 0) + 1
+    assert {k: v for k, v in board.tier_counts().items() if v} == expected
+
+
+def test_tiers_from_a_file(tmp_path):
+    path = tmp_path / 'tiers.json'
+    path.write_text(json.dumps([{'name': 'Pro', 'min': 100, 'reward': 'Badge'},
+                                {'name': 'Starter', 'min': 0, 'reward': None}]), encoding='utf-8')
+    tiers = load_tiers(str(path))
+    assert [(t['name'], t['range']) for t in tiers] == [('Starter', '0-99'), ('Pro', '100+')]
+    board = Leaderboard(tiers)
+    board.load([('ann', 99, 0), ('bob', 100, 0), ('cy', 5000, 0)])
+    assert board.tier_counts() == {'Starter': 1, 'Pro': 2}
@@ -0,0 +1,81 @@
+import json
+import os
+
+import pytest
+
+from readvibe.blobs import BlobStore
+from readvibe.migrations import MigrationRunner
+from readvibe.store import SQLiteUserStore
+
+
+@pytest.fixture
+def legacy(tmp_path):
+    import fitz
+
+    pdf_path = str(tmp_path / 'dune.pdf')
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Arrakis")
+    doc.save(pdf_path)
+    users = {
+        'alice': {'password': 'h1', 'data': {'books': [{'title': 'Dune', 'pages': 1, 'pdf_path': pdf_path}]}},
+        'bob': {'password': 'h2', 'data': {'wpm': 250}},
+        '_last_user': 'bob',
+    }
+    data_file = tmp_path / 'users.json'
+    data_file.write_text(json.dumps(users), encoding='utf-8')
+    return str(data_file)
+
+
+def run(store, data_file):
+    data_dir = os.path.dirname(data_file)
+    runner = MigrationRunner(store, data_file, data_dir, blobs=BlobStore(os.path.join(data_dir, 'blobs')))
+    runner.start()
+    runner.wait()
+    assert runner.error is None
+    return runner
+
+
+def test_migrations_run_once(tmp_path, legacy):
+    store = SQLiteUserStore(str(tmp_path / 'users.db'))
+    runner = run(store, legacy)
+    assert runner.accounts_ready and runner.version == runner.latest
+    assert store.get_meta('_last_user') == 'bob'
+    dune = store.get_books('alice')[0]
+    assert dune['sha256'] and os.path.exists(dune['pdf_path'])
+    assert store.blob_refs(dune['sha256']) == 1
+
+    before = store.load_all()
+    again = run(store, legacy)
+    assert again.version == again.latest and again._thread is None  # up to date: nothing started
+    assert store.load_all() == before
+
+
+def test_migrations_rerun_change_nothing(tmp_path, legacy):
+    store = SQLiteUserStore(str(tmp_path / 'users.db'))
+    run(store, legacy)
+    before = store.load_all()
+    store.set_meta('schema_version', 0)  # as if the version had never been saved
+    run(store, legacy)
+    assert store.load_all() == before
+
+
+def test_import_resumes_from_checkpoint(tmp_path, legacy):
+    # a crash after alice's batch was imported but before its checkpoint was saved
+    store = SQLiteUserStore(str(tmp_path / 'users.db'))
+    with open(legacy, encoding='utf-8') as f:
+        store.import_legacy({'alice': json.load(f)['alice']})
+    store.set_meta('migration_checkpoint', {'version': 1, 'state': None})
+    run(store, legacy)
+    assert sorted(u for u in store.load_all() if not u.startswith('_')) == ['alice', 'bob']
+    assert len(store.get_books('alice')) == 1
+
+
+def test_username_conflict_stops_the_import(tmp_path, legacy):
+    store = SQLiteUserStore(str(tmp_path / 'users.db'))
+    store.create_user('bob', 'someone else')
+    runner = MigrationRunner(store, legacy, str(tmp_path))
+    runner.start()
+    assert not runner.accounts_ready
+    assert 'bob' in runner.error
+    assert runner._thread is None
+    assert store.get_user('bob')['password'] == 'someone else'
@@ -0,0 +1,49 @@
+from readvibe.pagecache import PageImageCache
+
+DIGEST = 'ab' * 32
+
+
+def key(page, *tile):
+    return (DIGEST, page, 2, 'jpg', *tile)
+
+
+def test_memory_is_bounded_by_bytes_least_recently_used_first(tmp_path):
+    cache = PageImageCache(str(tmp_path), max_bytes=10)
+    cache.put(key(0), b'aaaa')
+    cache.put(key(1), b'bbbb')
+    assert cache.get(key(0)) == b'aaaa'  # page 1 is now the oldest
+    cache.put(key(2), b'cccc')
+    assert cache.stats()['entries'] == 2 and cache.stats()['bytes'] == 8
+    cache.get(key(0))
+    cache.get(key(1))  # evicted from memory, still on disk
+    assert (cache.stats()['memory_hits'], cache.stats()['disk_hits']) == (2, 1)
+
+
+def test_disk_round_trip(tmp_path):
+    PageImageCache(str(tmp_path)).put(key(3), b'page three')
+    PageImageCache(str(tmp_path)).put(key(3, (256, 1, 0)), b'a tile')
+    # a new cache (e.g. after a restart) reads the pages back from disk, then keeps them in memory
+    cache = PageImageCache(str(tmp_path))
+    assert cache.get(key(3)) == b'page three'
+    assert cache.get(key(3, (256, 1, 0))) == b'a tile'
+    assert cache.get(key(3)) == b'page three'
+    assert cache.get(key(4)) is None
+    stats = cache.stats()
+    assert (stats['disk_hits'], stats['memory_hits'], stats['misses']) == (2, 1, 1)
+
+
+def test_oversized_entries_go_to_disk_only(tmp_path):
+    cache = PageImageCache(str(tmp_path), max_bytes=4)
+    cache.put(key(0), b'too big for memory')
+    assert cache.stats()['entries'] == 0
+    assert cache.contains(key(0))
+    assert cache.get(key(0)) == b'too big for memory'
+
+
+def test_drop_document(tmp_path):
+    cache = PageImageCache(str(tmp_path))
+    cache.put(key(0), b'page')
+    cache.put(('cd' * 32, 0, 2, 'jpg'), b'other book')
+    cache.drop_document(DIGEST)
+    assert not cache.contains(key(0))
+    assert cache.get(('cd' * 32, 0, 2, 'jpg')) == b'other book'
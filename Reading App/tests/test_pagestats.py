@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from readvibe.pagestats import (EMPTY_PAGE_MINUTES, difficulty_weight, estimate_minutes, load_page_stats,
+                                sidecar_path, word_stats)
+
+TEXTS = [
+    "The river ran past the garden in the morning.",
+    "",
+    "Photosynthesis nevertheless requires approximately characteristic environmental understanding " * 5,
+    "a b c 1945 2025 x y " * 40,
+]
+
+
+def old_page_minutes(text, wpm=None):
+    # the per-page estimate the Read view made from the page text before the index existed
+    words, chars, long_words = word_stats(text)
+    if words == 0:
+        return EMPTY_PAGE_MINUTES
+    return difficulty_weight(words, chars, long_words) / (wpm or 200)
+
+
+@pytest.fixture
+def book(make_pdf):
+    import fitz
+
+    path = make_pdf('book.pdf', TEXTS)
+    with fitz.open(path) as doc:
+        texts = [page.get_text("text") for page in doc]
+    return path, texts
+
+
+@pytest.mark.parametrize('wpm', [None, 120, 350])
+def test_pages_and_ranges_match_the_per_page_formula(book, wpm):
+    path, texts = book
+    stats = load_page_stats(path)
+    assert os.path.exists(sidecar_path(path))
+    for page, text in enumerate(texts):
+        assert stats.page_minutes(page, wpm) == pytest.approx(old_page_minutes(text, wpm))
+    for start in range(len(texts)):
+        for end in range(start, len(texts) + 1):
+            expected = sum(old_page_minutes(t, wpm) for t in texts[start:end])
+            assert stats.range_minutes(start, end, wpm) == pytest.approx(expected)
+    assert estimate_minutes(path, [(0, 2), (2, 4)], wpm) == pytest.approx(sum(old_page_minutes(t, wpm) for t in texts))
+
+
+def test_per_range_speeds_and_clipping(book):
+    path, texts = book
+    stats = load_page_stats(path)
+    minutes = stats.ranges_minutes([0, 2, 3], [2, 3, 99], [0, 100, 300])
+    assert list(minutes) == pytest.approx([old_page_minutes(texts[0]) + EMPTY_PAGE_MINUTES,
+                                           old_page_minutes(texts[2], 100), old_page_minutes(texts[3], 300)])
+
+
+def test_changed_pdf_is_indexed_again(book, make_pdf):
+    path, _ = book
+    assert len(load_page_stats(path)) == 4
+    make_pdf('book.pdf', ["one page now"])
+    assert len(load_page_stats(path)) == 1
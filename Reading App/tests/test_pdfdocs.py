@@ -0,0 +1,53 @@
+import os
+
+from readvibe.pdfdocs import DocumentPool
+
+
+def test_least_recently_used_document_is_closed(make_pdf):
+    a, b, c = (make_pdf(f"{name}.pdf", ["text"]) for name in 'abc')
+    pool = DocumentPool(max_handles=2)
+    for path in (a, b, a, c):
+        with pool.document(path):
+            pass
+    # a was used after b, so b went when c came in
+    assert pool.stats() == {'open': 2, 'bytes': os.path.getsize(a) + os.path.getsize(c),
+                            'hits': 1, 'misses': 3, 'evictions': 1}
+    with pool.document(a):
+        pass
+    with pool.document(b):
+        pass
+    assert (pool.stats()['hits'], pool.stats()['misses']) == (2, 4)
+
+
+def test_byte_cap_keeps_the_newest_document(make_pdf):
+    a = make_pdf('a.pdf', ["text"])
+    b = make_pdf('b.pdf', ["text"])
+    pool = DocumentPool(max_handles=8, max_bytes=1)
+    for path in (a, b):
+        with pool.document(path):
+            pass
+    # over the cap with one document open: it is kept, everything older goes
+    assert pool.stats()['open'] == 1
+    with pool.document(b):
+        pass
+    assert pool.stats()['hits'] == 1
+
+
+def test_changed_file_is_reopened(make_pdf):
+    path = make_pdf('book.pdf', ["one"])
+    pool = DocumentPool()
+    with pool.document(path) as doc:
+        assert len(doc) == 1
+    make_pdf('book.pdf', ["one", "two", "three"])
+    with pool.document(path) as doc:
+        assert len(doc) == 3
+    assert pool.stats()['open'] == 1 and pool.stats()['misses'] == 2
+
+
+def test_discard_closes_the_document(make_pdf):
+    path = make_pdf('book.pdf', ["one"])
+    pool = DocumentPool()
+    with pool.document(path):
+        pass
+    pool.discard(path)
+    assert pool.stats()['open'] == 0 and pool.stats()['bytes'] == 0
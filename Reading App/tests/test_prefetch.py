@@ -0,0 +1,79 @@
+import threading
+
+from readvibe.prefetch import MAX_AHEAD, MIN_AHEAD, PagePrefetcher, prefetch_window, record_move
+
+
+def visits(*pages, every=30.0):
+    history = []
+    for i, page in enumerate(pages):
+        record_move(history, page, now=1000 + i * every)
+    return history
+
+
+def test_nothing_to_prefetch_without_history():
+    assert prefetch_window([], 100) == []
+
+
+def test_window_leans_the_way_the_reader_moves():
+    assert prefetch_window(visits(10, 11, 12), 100) == [13, 14, 11]
+    assert prefetch_window(visits(12, 11, 10), 100) == [9, 8, 11]
+
+
+def test_window_grows_with_the_page_turn_rate():
+    slow = prefetch_window(visits(10, 11, 12), 100)
+    fast = prefetch_window(visits(*range(10, 20), every=0.5), 100)
+    assert len(slow) == MIN_AHEAD + 1
+    assert fast == list(range(20, 20 + MAX_AHEAD)) + [18]
+
+
+def test_window_stays_inside_the_book():
+    assert prefetch_window(visits(97, 98, 99), 100) == [98]
+    assert prefetch_window(visits(1, 0), 100) == [1]
+
+
+def test_jumps_do_not_count_as_reading_pace():
+    # only single-page steps are pace; a jump forward still reads forwards by default
+    assert prefetch_window(visits(10, 40), 100) == [41, 42, 39]
+
+
+def test_old_visits_are_forgotten():
+    history = visits(1, 2, 3)
+    record_move(history, 4, now=5000)
+    assert history == [(5000, 4)]
+
+
+class Renders:
+    """A render callable whose jobs wait until ``release`` is set."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.pages = []
+
+    def __call__(self, pdf_path, page):
+        self.release.wait(5)
+        self.pages.append(page)
+
+
+def test_queued_and_cached_pages_are_not_queued_again():
+    prefetcher = PagePrefetcher(workers=1)
+    render = Renders()
+    prefetcher.schedule('s1', render, 'book.pdf', [1, 2, 3])
+    prefetcher.schedule('s1', render, 'book.pdf', [2, 3, 4, 5], cached=lambda path, page: page == 5)
+    assert prefetcher.pending('s1') == 4
+    render.release.set()
+    prefetcher._pool.shutdown(wait=True)
+    assert render.pages == [1, 2, 3, 4]
+
+
+def test_owner_is_forgotten_once_its_jobs_are_done():
+    prefetcher = PagePrefetcher(workers=1)
+    render = Renders()
+    prefetcher.schedule('s1', render, 'book.pdf', [1, 2])
+    prefetcher.schedule('s2', render, 'book.pdf', [7])
+    prefetcher.cancel('s1')
+    prefetcher.cancel('s3')  # never scheduled anything
+    render.release.set()
+    prefetcher._pool.shutdown(wait=True)
+    # s1's first page was already running when it was cancelled
+    assert render.pages in ([7], [1, 7])
+    assert prefetcher._jobs == {} and prefetcher._generation == {}
@@ -0,0 +1,22 @@
+from readvibe.records import LOCK_STRIPES, UserRecords
+from readvibe.store import SQLiteUserStore
+
+
+def test_records_are_bounded_and_follow_writes(tmp_path):
+    store = SQLiteUserStore(str(tmp_path / 'users.db'))
+    records = UserRecords(store, max_users=2)
+    seen = []
+    records.listeners.append(lambda username, rec: seen.append(username))
+    for name in ('ann', 'bob', 'cy'):
+        records.handle(name).create('h')
+    assert list(records._records) == ['bob', 'cy']
+    assert len(records._locks) == LOCK_STRIPES and records.lock('ann') is records.lock('ann')
+    assert seen == ['ann', 'bob', 'cy']
+
+    old = records.get('ann')
+    book = records.handle('ann').add_book({'title': 'Dune', 'pages': 10})
+    records.handle('ann').update_book(book['id'], current_page=4)
+    # readers keep the record they had; the next get sees the write
+    assert old['data']['books'] == []
+    assert records.get('ann')['data']['books'][0]['current_page'] == 4
+    assert records.get('nobody') is None
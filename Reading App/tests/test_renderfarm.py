@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+from readvibe.renderfarm import INDEXING, PREFETCH, VISIBLE, QueueFull, RenderFarm
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def farm():
+    # jobs run on the dispatcher threads, so they can be closures
+    with RenderFarm(workers=2, limit=8, processes=False) as farm:
+        yield farm
+
+
+def test_most_urgent_job_runs_first(farm):
+    gates = [threading.Event(), threading.Event()]
+    started = []
+    for gate in gates:  # hold both workers
+        farm.submit(VISIBLE, gate.wait, 5)
+    wait_until(lambda: farm.stats()['running'] == 2)
+    jobs = [farm.submit(priority, started.append, name)
+            for priority, name in ((INDEXING, 'index a'), (PREFETCH, 'prefetch'), (VISIBLE, 'visible'), (INDEXING, 'index b'))]
+    gates[0].set()  # one worker works through the queue
+    for job in jobs:
+        job.result(5)
+    assert started == ['visible', 'prefetch', 'index a', 'index b']
+    gates[1].set()
+
+
+def test_indexing_never_takes_every_worker():
+    with RenderFarm(workers=3, processes=False) as farm:
+        assert farm.indexing == 2
+        release = threading.Event()
+        jobs = [farm.submit(INDEXING, release.wait, 5) for _ in range(4)]
+        wait_until(lambda: farm.stats()['running_indexing'] == 2)
+        time.sleep(0.05)
+        assert farm.stats()['running_indexing'] == 2 and farm.stats()['queued'] == 2
+        # the worker kept free serves a reader at once
+        assert farm.call(VISIBLE, sum, [1, 2]) == 3
+        release.set()
+        for job in jobs:
+            job.result(5)
+        assert farm.stats()['running_indexing'] == 0
+
+
+def test_backpressure():
+    with RenderFarm(workers=2, limit=1, processes=False) as farm:
+        gate = threading.Event()
+        farm.submit(VISIBLE, gate.wait, 5)
+        farm.submit(VISIBLE, gate.wait, 5)
+        wait_until(lambda: farm.stats()['running'] == 2)
+        farm.submit(INDEXING, len, [])
+        with pytest.raises(QueueFull):
+            farm.submit(PREFETCH, len, [])
+        with pytest.raises(QueueFull):
+            farm.submit(INDEXING, len, [], block=False)
+        farm.submit(VISIBLE, len, [])  # a reader's page is always queued
+        assert farm.stats()['refused'] == 2
+        gate.set()
+
+
+def test_a_farm_has_a_worker_outside_indexing():
+    farm = RenderFarm(workers=1, indexing=4, processes=False)
+    assert (farm.workers, farm.indexing) == (5, 4)
@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+from readvibe.jsonstore import JournaledJsonStore
+from readvibe.rollups import aggregate, bucket_keys
+from readvibe.store import SQLiteUserStore
+
+
+def local(*fields):
+    """Timestamp of a local date and time, since buckets are named in server local time."""
+    return time.mktime((*fields, 0, 0, -1))
+
+
+NEW_YEARS_EVE = local(2025, 12, 31, 23, 30, 0)
+NEW_YEARS_DAY = local(2026, 1, 1, 0, 30, 0)
+NEXT_MONDAY = local(2026, 1, 5, 9, 0, 0)
+
+
+@pytest.fixture(params=['sqlite', 'json'])
+def store(request, tmp_path):
+    store = (JournaledJsonStore(str(tmp_path / 'users.json')) if request.param == 'json'
+             else SQLiteUserStore(str(tmp_path / 'users.db')))
+    store.create_user('alice', 'h')
+    store.add_book('alice', {'title': 'Dune', 'author': 'F. Herbert', 'pages': 100})
+    return store
+
+
+def test_bucket_names():
+    # 2025-12-31 is a Wednesday in ISO week 1 of 2026
+    assert bucket_keys(NEW_YEARS_EVE) == {'day': '2025-12-31', 'week': '2026-W01', 'month': '2025-12'}
+    assert bucket_keys(NEXT_MONDAY) == {'day': '2026-01-05', 'week': '2026-W02', 'month': '2026-01'}
+
+
+def test_aggregate():
+    buckets = aggregate([('alice', NEW_YEARS_EVE, 10, 20, 5), ('alice', NEW_YEARS_DAY, 4, 6, 2),
+                         ('bob', NEW_YEARS_DAY, 1, 1, 1)])
+    assert buckets[('alice', 'week', '2026-W01')] == {'pages': 14, 'minutes': 26, 'points': 7, 'sessions': 2}
+    assert buckets[('alice', 'day', '2026-01-01')]['pages'] == 4
+    assert len(buckets) == 3 + 3 + 3 - 1  # alice's two sessions share their week
+
+
+def test_day_week_and_month_roll_over(store):
+    book_id = store.get_books('alice')[0]['id']
+    store.log_session('alice', book_id, 0, 10, 20, 5, logged_at=NEW_YEARS_EVE)
+    store.log_session('alice', book_id, 10, 14, 6, 2, logged_at=NEW_YEARS_DAY)
+
+    eve = store.get_rollups('alice', NEW_YEARS_EVE)
+    assert eve['day'] == eve['month'] == {'pages': 10, 'minutes': 20, 'points': 5, 'sessions': 1}
+    assert eve['week'] == {'pages': 14, 'minutes': 26, 'points': 7, 'sessions': 2}
+    day = store.get_rollups('alice', NEW_YEARS_DAY)
+    assert day['day'] == day['month'] == {'pages': 4, 'minutes': 6, 'points': 2, 'sessions': 1}
+    assert day['week'] == eve['week']
+    # a new week starts from nothing; the month carries on
+    monday = store.get_rollups('alice', NEXT_MONDAY)
+    assert monday['day']['sessions'] == monday['week']['sessions'] == 0
+    assert monday['month']['pages'] == 4
+
+    assert store.day_series('alice', '2025-12-31') == {'2025-12-31': 10, '2026-01-01': 4}
+    assert store.day_series('alice', '2026-01-01') == {'2026-01-01': 4}
+    assert store.get_rollups('bob', NEW_YEARS_DAY)['week']['sessions'] == 0
+
+
+def test_rebuild_matches_the_logged_sessions(store):
+    book_id = store.get_books('alice')[0]['id']
+    store.log_session('alice', book_id, 0, 10, 20, 5, logged_at=NEW_YEARS_EVE)
+    store.log_sessions([('alice', book_id, 10, 14, 6, 2, NEW_YEARS_DAY), ('alice', book_id, 14, 20, 9, 4, NEXT_MONDAY)])
+    if isinstance(store, JournaledJsonStore):
+        store.compact()
+    before = [store.get_rollups('alice', ts) for ts in (NEW_YEARS_EVE, NEW_YEARS_DAY, NEXT_MONDAY)]
+    assert store.rebuild_rollups() == 3 + 2 + 2
+    assert [store.get_rollups('alice', ts) for ts in (NEW_YEARS_EVE, NEW_YEARS_DAY, NEXT_MONDAY)] == before
+    if isinstance(store, JournaledJsonStore):
+        assert JournaledJsonStore(store.path).get_rollups('alice', NEXT_MONDAY) == before[2]
@@ -0,0 +1,58 @@
+import pytest
+
+from readvibe.sessions import calc_points, import_sessions
+from readvibe.store import SQLiteUserStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteUserStore(str(tmp_path / 'users.db'))
+    store.create_user('alice', 'h')
+    store.add_book('alice', {'title': 'Dune', 'author': 'F. Herbert', 'pages': 100})
+    return store
+
+
+def row(**fields):
+    return {'user': 'alice', 'book': 'Dune', 'start_page': '1', 'end_page': '11', 'minutes': '20',
+            'timestamp': '2025-01-31T08:00:00', **fields}
+
+
+def test_valid_rows_are_imported(store):
+    book_id = store.get_books('alice')[0]['id']
+    report = import_sessions(store, [row(), row(book=str(book_id), start_page='11', end_page='21', timestamp='')])
+    assert (report.rows, report.imported, report.rejected) == (2, 2, [])
+    assert report.points == 2 * calc_points(10, 20)
+    assert store.get_books('alice')[0]['pages_read'] == 20
+
+
+@pytest.mark.parametrize('fields, reason', [
+    ({'start_page': 'one'}, "unreadable row"),
+    ({'minutes': None}, "unreadable row"),
+    ({'timestamp': 'yesterday'}, "unreadable row"),
+    ({'user': 'mallory'}, "unknown user 'mallory'"),
+    ({'user': '_meta'}, "unknown user '_meta'"),
+    ({'book': 'Emma'}, "unknown book 'Emma'"),
+    ({'start_page': '11', 'end_page': '11'}, "no pages or minutes read"),
+    ({'minutes': '0'}, "no pages or minutes read"),
+    ({'start_page': '0'}, "pages outside 1-100"),
+    ({'start_page': '95', 'end_page': '105'}, "pages outside 1-100"),
+    ({'minutes': '0.5'}, "unrealistic reading pace"),
+])
+def test_rejected_rows(store, fields, reason):
+    report = import_sessions(store, [row(), row(**fields)])
+    assert [(n, r.split(':')[0]) for n, r in report.rejected] == [(2, reason)]
+    assert report.imported == 1
+
+
+def test_missing_column_is_rejected(store):
+    incomplete = row()
+    del incomplete['end_page']
+    assert import_sessions(store, [incomplete]).rejected == [(1, "unreadable row: 'end_page'")]
+
+
+def test_dry_run_and_strict_import_nothing(store):
+    rows = [row(), row(user='mallory')]
+    assert import_sessions(store, rows, dry_run=True).imported == 0
+    report = import_sessions(store, rows, strict=True)
+    assert report.imported == 0 and len(report.rejected) == 1
+    assert store.get_books('alice')[0]['pages_read'] == 0
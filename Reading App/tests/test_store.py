@@ -0,0 +1,103 @@
+import pytest
+
+from readvibe.jsonstore import JournaledJsonStore
+from readvibe.store import ImportConflict, SQLiteUserStore
+
+
+@pytest.fixture(params=['sqlite', 'json'])
+def store(request, tmp_path):
+    if request.param == 'json':
+        return JournaledJsonStore(str(tmp_path / 'users.json'))
+    return SQLiteUserStore(str(tmp_path / 'users.db'))
+
+
+def book(title, **fields):
+    return {'title': title, 'author': 'A', 'pages': 100, 'current_page': 0, 'pages_read': 0, **fields}
+
+
+def test_users(store):
+    assert store.create_user('alice', 'h', {'wpm': 250})
+    assert not store.create_user('alice', 'other')
+    assert store.has_user('alice') and not store.has_user('bob')
+    assert store.get_user('bob') is None
+    rec = store.get_user('alice')
+    assert rec['password'] == 'h'
+    assert rec['data']['wpm'] == 250
+    assert rec['data']['stats']['points'] == 0
+
+    store.update_settings('alice', wpm=300, name='Alice')
+    assert {k: store.get_user('alice')['data'][k] for k in ('wpm', 'name')} == {'wpm': 300, 'name': 'Alice'}
+    assert set(store.load_all()) == {'alice', '_last_user'}
+
+
+def test_meta(store):
+    assert store.get_meta('schema_version', 0) == 0
+    store.set_meta('schema_version', 3)
+    store.set_meta('_last_user', 'alice')
+    assert store.get_meta('schema_version') == 3
+    assert store.get_meta('_last_user') == 'alice'
+
+
+def test_books(store):
+    store.create_user('alice', 'h')
+    store.create_user('bob', 'h')
+    first = store.add_book('alice', book('Dune', sha256='d1'))
+    second = store.add_book('bob', book('Dune', sha256='d1'))
+    third = store.add_book('alice', book('Emma'))
+    assert first['id'] < second['id'] < third['id']
+    assert store.blob_refs('d1') == 2
+    assert [(u, b['title']) for u, b in store.iter_books()] == [('alice', 'Dune'), ('bob', 'Dune'), ('alice', 'Emma')]
+    assert [b['id'] for _, b in store.iter_books(after_id=first['id'])] == [second['id'], third['id']]
+
+    store.update_book('alice', first['id'], current_page=12, status='ready', not_a_field=1)
+    dune = store.get_books('alice')[0]
+    assert (dune['current_page'], dune['status']) == (12, 'ready')
+    assert 'not_a_field' not in dune
+
+    store.update_book('alice', first['id'], sha256='d2')
+    assert (store.blob_refs('d1'), store.blob_refs('d2')) == (1, 1)
+
+    assert store.delete_book('bob', second['id']) == 0
+    assert store.delete_book('alice', third['id']) is None  # no blob
+    assert [b['title'] for b in store.get_books('alice')] == ['Dune']
+    assert store.get_books('bob') == []
+
+
+def test_unknown_user_or_book_is_left_alone(store):
+    store.create_user('alice', 'h')
+    dune = store.add_book('alice', book('Dune', sha256='d1'))
+    before = store.get_books('alice')
+    assert store.update_book('ghost', dune['id'], current_page=3) is None
+    assert store.delete_book('ghost', dune['id']) is None
+    assert store.update_book('alice', dune['id'] + 1, current_page=3) is None
+    assert store.delete_book('alice', dune['id'] + 1) is None
+    assert not store.has_user('ghost')
+    assert store.get_books('alice') == before
+    assert store.blob_refs('d1') == 1
+
+
+def test_sessions(store):
+    store.create_user('alice', 'h')
+    dune = store.add_book('alice', book('Dune'))
+    version = store.get_user('alice')['data']['version']
+    store.log_session('alice', dune['id'], 0, 10, 15, 13, logged_at=1000.0)
+    store.log_sessions([('alice', dune['id'], 30, 40, 20, 20, 3000.0), ('alice', dune['id'], 10, 30, 25, 35, 2000.0)])
+
+    data = store.get_user('alice')['data']
+    assert data['version'] > version
+    assert (data['books'][0]['current_page'], data['books'][0]['pages_read']) == (40, 40)
+    assert {k: data['stats'][k] for k in ('total_pages', 'total_time', 'points')} == \
+        {'total_pages': 40, 'total_time': 60, 'points': 68}
+    assert store.get_rollups('alice', 1000.0)['month']['sessions'] == 3
+
+
+def test_import_legacy(store):
+    legacy = {'alice': {'password': 'h', 'data': {'books': [book('Dune')]}}, '_last_user': 'alice'}
+    assert store.import_legacy(legacy) == 1
+    assert store.import_legacy(legacy) == 0  # already imported
+    assert [b['title'] for b in store.get_books('alice')] == ['Dune']
+
+    store.create_user('bob', 'taken')
+    with pytest.raises(ImportConflict):
+        store.import_legacy({'bob': {'password': 'legacy', 'data': {}}})
+    assert store.get_user('bob')['password'] == 'taken'